@@ -9,41 +9,115 @@ import m60_matrix2 as m60
 try:
 	from keyboard_config import (
 		NKRO,
+		COALESCE_REPORTS,
+		LATENCY_HISTOGRAM,
+		KEYTRACE_SIZE,
+		PERSISTENT_HEATMAP,
+		BIGRAM_STATS,
+		PERSISTENT_SETTINGS,
+		PROFILES,
+		COMBO_TERM,
+		LEADER_TIMEOUT,
+		TEXT_REPORT_INTERVAL,
+		MACRO_QUEUE_SIZE,
+		CANCEL_MACRO_ON_RELEASE,
+		SCAN_RATE_TIERS,
 		TIME_TAP_THRESH,
 		TIME_TAP_DELAY,
+		TAP_HOLD_MODE,
+		ADAPTIVE_TAP_TIMING,
+		TAP_THRESH_RANGE,
+		TAP_DELAY_RANGE,
 		VERBOSE,
 	)
 except:
 	NKRO = False
+	COALESCE_REPORTS = False
+	LATENCY_HISTOGRAM = False
+	KEYTRACE_SIZE = 0
+	PERSISTENT_HEATMAP = False
+	BIGRAM_STATS = False
+	PERSISTENT_SETTINGS = False
+	PROFILES = {}
+	COMBO_TERM = 50
+	LEADER_TIMEOUT = 1000
+	TEXT_REPORT_INTERVAL = {"usb": 1, "ble": 10}
+	MACRO_QUEUE_SIZE = 8
+	CANCEL_MACRO_ON_RELEASE = False
+	SCAN_RATE_TIERS = ((500, 2), (5000, 8), (60000, 16))
 	TIME_TAP_THRESH = 170
 	TIME_TAP_DELAY = 87
+	TAP_HOLD_MODE = "hold_on_other_key_press"
+	ADAPTIVE_TAP_TIMING = False
+	TAP_THRESH_RANGE = (120, 250)
+	TAP_DELAY_RANGE = (40, 120)
 	VERBOSE = True
 
 
-default_keymap = keymaps['qwerty_mod']
-keymap_qwerty_plain = keymaps['qwerty_plain']
-keymap_dvorak = keymaps['dvorak']
-keymap_norman = keymaps['norman']
+default_keymap_name = 'qwerty_mod'
 
 
 ## initialize keyboard
 keyboard = Keyboard(
 	nkro_usb = NKRO,
+	coalesce_reports = COALESCE_REPORTS,
+	latency_histogram = LATENCY_HISTOGRAM,
+	persistent_heatmap = PERSISTENT_HEATMAP,
+	bigram_stats = BIGRAM_STATS,
+	persistent_settings = PERSISTENT_SETTINGS,
+	combo_term = COMBO_TERM,
+	leader_timeout = LEADER_TIMEOUT,
+	text_report_interval = TEXT_REPORT_INTERVAL,
+	macro_queue_size = MACRO_QUEUE_SIZE,
+	cancel_macro_on_release = CANCEL_MACRO_ON_RELEASE,
 	verbose = VERBOSE,
 	time_tap_thresh = TIME_TAP_THRESH,
-	time_tap_delay = TIME_TAP_DELAY)
-keyboard.register_hardware(m60.KeyboardHardware)
-keyboard.register_keymap(default_keymap)
+	time_tap_delay = TIME_TAP_DELAY,
+	tap_hold_mode = TAP_HOLD_MODE,
+	adaptive_tap_timing = ADAPTIVE_TAP_TIMING,
+	tap_thresh_range = TAP_THRESH_RANGE,
+	tap_delay_range = TAP_DELAY_RANGE)
+if KEYTRACE_SIZE > 0:
+	# record the key events, see keyboard/keytrace.py
+	from keyboard.keytrace import KeyTraceRecorder
+	keyboard.register_hardware(lambda: KeyTraceRecorder(m60.KeyboardHardware(), size = KEYTRACE_SIZE))
+else:
+	keyboard.register_hardware(m60.KeyboardHardware)
+# the keymap in use before the reset, see PERSISTENT_SETTINGS
+# keymaps are loaded and compiled on demand, see keyboard/keymap_registry.py
+keymap_name = keyboard.saved_keymap
+if keymap_name not in keymaps:
+	keymap_name = default_keymap_name
+keyboard.register_keymap(keymaps.load(keymap_name), keymap_name)
+# switched to when connecting, see PROFILES
+for key, name in PROFILES.items():
+	keyboard.register_profile(key, keymaps.load(name))
+# combos example, keys pressed together, see keyboard/combos.py
+# keymap positions and an action, J + K for Escape, D + F + J + K for Caps Lock
+#from keyboard.action_code import ESC, CAPS
+#keyboard.register_combos((
+#	((35, 36), ESC),
+#	((31, 32, 35, 36), CAPS),
+#))
+# leader key sequences example, typed after a LEADER key in the keymap, see
+# keyboard/leader.py, the keys as on the base layer
+#from keyboard.action_code import MACRO, CAPS
+#keyboard.register_leader_sequences((
+#	(('h', 'i'), MACRO(2)),
+#	(('c', 'l'), CAPS),
+#))
+if hasattr(keyboard.hardware, "set_scan_rate_tiers"):
+	keyboard.hardware.set_scan_rate_tiers(SCAN_RATE_TIERS)
 
 # macro handler example
 async def macro_handler(dev, i, press):
 	if press:
 		if i == 0:
 			print("Switching to QWERTY_MOD")
-			dev.keyboard_core.register_keymap(default_keymap)
+			dev.keyboard_core.register_keymap(keymaps.load(default_keymap_name), default_keymap_name)
 		elif i == 1:
 			print("Switching to QWERTY_PLAIN")
-			dev.keyboard_core.register_keymap(keymap_qwerty_plain)
+			dev.keyboard_core.register_keymap(keymaps.load('qwerty_plain'), 'qwerty_plain')
 		elif i == 2:
 			await dev.send_text("Hello Python Keyboard!")
 		else:
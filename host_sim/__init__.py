@@ -0,0 +1,54 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Host(CPython) simulation runtime
+#
+# Provides stand-ins for the CircuitPython modules used by the firmware
+# (supervisor, microcontroller, usb_hid, _bleio, adafruit_ble, digitalio,
+# busio, analogio, board, matrix2, keypad, ...), so `keyboard`, `keymaps`
+# and the `m60_*` packages can be imported and run on a PC.
+#
+#   import host_sim
+#   host_sim.install()  # before importing any firmware module
+#   from keyboard import Keyboard
+#   import m60_matrix2
+#   ...
+#   host_sim.MATRIX.play([(0, 17, True), (50, 17, False)], stop_after = 500)
+#   try:
+#       keyboard.run()
+#   except host_sim.SimulationDone:
+#       pass
+#   print(host_sim.RECORDER.records)
+#
+# The simulated hardware lives in `host_sim.hardware`.
+
+import os
+import sys
+
+from .hardware import (
+	SimulationDone,
+	SystemReset,
+	HOST,
+	RECORDER,
+	MATRIX,
+	I2C_BUS,
+	LED_DRIVER,
+	BLE,
+	SYSTEM,
+)
+
+MODULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modules")
+
+
+def install():
+	# make the stand-in modules importable, ahead of anything else
+	if MODULES_PATH not in sys.path:
+		sys.path.insert(0, MODULES_PATH)
+
+
+def use_virtual_time(**kwargs):
+	# run the firmware and asyncio on a virtual clock, see host_sim/clock.py
+	# kwargs go to `VirtualClock`, the clock is returned
+	install()
+	from .clock import use_virtual_time
+	return use_virtual_time(**kwargs)
@@ -0,0 +1,54 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Run the firmware(boot.py, then code.py) on the host
+#   python -m host_sim [--duration SECONDS] [--ble] [--virtual]
+
+import argparse
+import os
+import runpy
+import sys
+
+import host_sim
+
+
+def main():
+	parser = argparse.ArgumentParser(prog = "python -m host_sim",
+			description = "Run the keyboard firmware on the host.")
+	parser.add_argument("--root", default = os.getcwd(),
+			help = "folder containing boot.py and code.py(the CIRCUITPY drive)")
+	parser.add_argument("--duration", type = float, default = None,
+			help = "stop after this many seconds")
+	parser.add_argument("--ble", action = "store_true",
+			help = "start with USB disconnected, a BLE host connects when advertised")
+	parser.add_argument("--virtual", action = "store_true",
+			help = "run on a virtual clock, as fast as possible and deterministic")
+	args = parser.parse_args()
+
+	host_sim.install()
+	if args.virtual:
+		host_sim.use_virtual_time()
+	if args.root not in sys.path:
+		sys.path.insert(0, args.root)
+	if args.ble:
+		host_sim.HOST.usb_connected = False
+		host_sim.BLE.auto_connect = True
+	if args.duration is not None:
+		host_sim.MATRIX.play((), stop_after = int(args.duration * 1000))
+
+	boot = os.path.join(args.root, "boot.py")
+	if os.path.exists(boot):
+		runpy.run_path(boot, run_name = "__main__")
+	try:
+		runpy.run_path(os.path.join(args.root, "code.py"), run_name = "__main__")
+	except host_sim.SimulationDone:
+		pass
+	except host_sim.SystemReset as e:
+		print("Firmware requested a %s" % e.reason)
+	except KeyboardInterrupt:
+		pass
+	print("%d HID reports sent" % len(host_sim.RECORDER))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,257 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# End-to-end keystroke latency benchmark
+#   python -m host_sim.bench [--backend m60_py] [--scenario plain] [--save] [--check]
+#
+# Runs `Keyboard` with each scanning backend(m60_matrix2, m60_keypad, m60_py)
+# on the simulated hardware and the virtual clock, and measures for each key
+# kind(scenario):
+#   p50/p99: scan-to-report latency, host time from the scan that sees a
+#     matrix change to the next HID report, changes not followed by a report
+#     (e.g. pressing a tap key) are not counted
+#   events/s: key events processed per second of host time, keys hammered
+#     1ms apart
+#   allocs/event: memory blocks allocated per key event, counted on CPython
+#     (`sys.getallocatedblocks` sampled at every call and return) and
+#     minus an idle run of the same length, an approximation of the heap
+#     allocations on CircuitPython
+#
+# Latencies and events/s depend on the host, compare them against baselines
+# recorded on the same machine: `--save` stores the results, `--check`
+# exits with 1 if a result regressed beyond `--tolerance`.
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import sys
+import time
+
+import host_sim
+
+BACKENDS = ("m60_matrix2", "m60_keypad", "m60_py")
+
+# scenario: keymap positions(default keymap) typed in turns, hold time in ms
+SCENARIOS = {
+	"plain": ((29, 32, 35, 36), 40),    # A F J K
+	"mods_tap": ((38,), 40),            # SCC, ';' tapped
+	"layer_tap": ((31,), 40),           # L2D, 'd' tapped
+	"macro": ((44,), 40),               # MACRO(0), see `bench_keymap`
+}
+
+MACRO_KEYCODE = 0x06 # 'c'
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+
+def bench_keymap():
+	# the default keymap, with MACRO(0) in place of 'C'
+	from keyboard.action_code import MACRO
+	from keymaps import keymaps
+	keymap = [list(layer) for layer in keymaps["default"]]
+	keymap[0][44] = MACRO(0)
+	return tuple(tuple(layer) for layer in keymap)
+
+
+async def bench_macro_handler(dev, i, press):
+	# the macro sends a key, so it shows in the latency
+	if press:
+		await dev.hid_manager.keyboard_press(MACRO_KEYCODE)
+	else:
+		await dev.hid_manager.keyboard_release(MACRO_KEYCODE)
+
+
+def make_script(backend, scenario, count, hold_ms, gap_ms):
+	# `count` key events, half of them presses, starting at 100ms
+	bsm = importlib.import_module(backend + ".bsm")
+	positions, _ = SCENARIOS[scenario]
+	script = []
+	t = 100
+	for i in range(count // 2):
+		raw = bsm.COORDS.index(positions[i % len(positions)])
+		script.append((t, raw, True))
+		script.append((t + hold_ms, raw, False))
+		t += hold_ms + gap_ms
+	return script
+
+
+def run_keyboard(backend, script, stop_after = 50):
+	# run the firmware until the script is done, return the host time spent
+	from keyboard import Keyboard
+	board = importlib.import_module(backend)
+
+	host_sim.use_virtual_time(step_ns = 500000)
+	host_sim.MATRIX.release_all()
+	host_sim.MATRIX.changes.clear()
+	host_sim.MATRIX.log_changes = True
+	host_sim.RECORDER.clear()
+
+	keyboard = Keyboard(nkro_usb = False, verbose = False)
+	keyboard.register_hardware(board.KeyboardHardware)
+	# scan at full speed, or the idle run of `bench` would scan less often
+	# than the keyed one and the difference would count as allocations
+	if hasattr(keyboard.hardware, "set_scan_rate_tiers"):
+		keyboard.hardware.set_scan_rate_tiers(())
+	keyboard.register_keymap(bench_keymap())
+	keyboard.register_macro_handler(bench_macro_handler)
+	host_sim.MATRIX.play(script, stop_after = stop_after)
+	start = time.perf_counter_ns()
+	try:
+		keyboard.run()
+	except host_sim.SimulationDone:
+		pass
+	return time.perf_counter_ns() - start
+
+
+def count_allocations(func, *args):
+	# run `func`, return (allocated blocks, its result)
+	count = 0
+	last = sys.getallocatedblocks()
+
+	def tracer(frame, event, arg):
+		nonlocal count, last
+		blocks = sys.getallocatedblocks()
+		if blocks > last:
+			count += blocks - last
+		last = blocks
+		return tracer
+
+	sys.setprofile(tracer)
+	try:
+		result = func(*args)
+	finally:
+		sys.setprofile(None)
+	return count, result
+
+
+def latencies(changes, report_times):
+	# for each matrix change, the time to the first report after it,
+	# if that report comes before the next change
+	result = []
+	j = 0
+	n = len(report_times)
+	for i in range(len(changes)):
+		t = changes[i][0]
+		next_t = changes[i + 1][0] if i + 1 < len(changes) else None
+		while j < n and report_times[j] < t:
+			j += 1
+		if j < n and (next_t is None or report_times[j] < next_t):
+			result.append(report_times[j] - t)
+	return result
+
+
+def percentile(values, q):
+	if not values:
+		return 0
+	values = sorted(values)
+	return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def bench(backend, scenario, events = 200, alloc_events = 10):
+	_, hold_ms = SCENARIOS[scenario]
+
+	# latency, keys typed at a human pace
+	script = make_script(backend, scenario, events, hold_ms, 60)
+	run_keyboard(backend, script)
+	samples = latencies(host_sim.MATRIX.changes, host_sim.RECORDER.host_times)
+
+	# throughput, keys hammered
+	script = make_script(backend, scenario, events, 1, 1)
+	elapsed = run_keyboard(backend, script)
+	event_count = len(host_sim.MATRIX.changes)
+
+	# allocations, minus an idle run of the same length
+	# the runs are slow with the profiler on, keep them short
+	script = make_script(backend, scenario, alloc_events, hold_ms, 20)
+	allocs, _ = count_allocations(run_keyboard, backend, script)
+	allocs_idle, _ = count_allocations(run_keyboard, backend, [], script[-1][0] + 50)
+
+	return {
+		"samples": len(samples),
+		"p50_us": round(percentile(samples, 0.5) / 1000, 1),
+		"p99_us": round(percentile(samples, 0.99) / 1000, 1),
+		"events_per_s": round(event_count * 1e9 / elapsed),
+		"allocs_per_event": round((allocs - allocs_idle) / alloc_events, 1),
+	}
+
+
+def compare(result, baseline, tolerance, slack_us):
+	# return the names of the regressed metrics
+	regressions = []
+	for name in ("p50_us", "p99_us"):
+		if result[name] > baseline[name] * (1 + tolerance) + slack_us:
+			regressions.append(name)
+	if result["events_per_s"] < baseline["events_per_s"] * (1 - tolerance):
+		regressions.append("events_per_s")
+	if result["allocs_per_event"] > baseline["allocs_per_event"] * (1 + tolerance) + 1:
+		regressions.append("allocs_per_event")
+	return regressions
+
+
+def main():
+	parser = argparse.ArgumentParser(prog = "python -m host_sim.bench",
+			description = "End-to-end keystroke latency benchmark.")
+	parser.add_argument("--root", default = os.getcwd(),
+			help = "folder containing the firmware(the CIRCUITPY drive)")
+	parser.add_argument("--backend", action = "append", choices = BACKENDS,
+			help = "backend(s) to run, all by default")
+	parser.add_argument("--scenario", action = "append", choices = tuple(SCENARIOS),
+			help = "scenario(s) to run, all by default")
+	parser.add_argument("--events", type = int, default = 200,
+			help = "key events per latency/throughput run")
+	parser.add_argument("--baseline", default = BASELINE_PATH, help = "baseline file")
+	parser.add_argument("--save", action = "store_true", help = "store the results as the baseline")
+	parser.add_argument("--check", action = "store_true",
+			help = "exit with 1 if any result regressed")
+	parser.add_argument("--tolerance", type = float, default = 0.25,
+			help = "relative tolerance of latencies and events/s")
+	parser.add_argument("--slack-us", type = float, default = 25,
+			help = "absolute tolerance of latencies, on top of the relative one")
+	args = parser.parse_args()
+
+	host_sim.install()
+	if args.root not in sys.path:
+		sys.path.insert(0, args.root)
+	logging.disable(logging.CRITICAL)
+
+	baseline = {}
+	if os.path.exists(args.baseline):
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+
+	results = {}
+	regressed = False
+	print("%-12s %-10s %8s %8s %10s %12s" % ("backend", "scenario", "p50 us", "p99 us", "events/s", "allocs/event"))
+	for backend in args.backend or BACKENDS:
+		# warm up, the first runs also count the imports and the profiler's
+		# own setup
+		for scenario in SCENARIOS:
+			count_allocations(run_keyboard, backend, make_script(backend, scenario, 4, 40, 20))
+		for scenario in args.scenario or SCENARIOS:
+			result = bench(backend, scenario, args.events)
+			results.setdefault(backend, {})[scenario] = result
+			line = "%-12s %-10s %8.1f %8.1f %10d %12.1f" % (backend, scenario,
+					result["p50_us"], result["p99_us"], result["events_per_s"], result["allocs_per_event"])
+			old = baseline.get(backend, {}).get(scenario, None)
+			if old is not None:
+				regressions = compare(result, old, args.tolerance, args.slack_us)
+				if regressions:
+					regressed = True
+					line += "  REGRESSED: " + ", ".join(regressions)
+			print(line, flush = True)
+
+	if args.save:
+		for backend, scenarios in results.items():
+			baseline.setdefault(backend, {}).update(scenarios)
+		with open(args.baseline, "w") as f:
+			json.dump(baseline, f, indent = "\t", sort_keys = True)
+			f.write("\n")
+		print("Baseline saved to %s" % args.baseline)
+	if args.check and regressed:
+		sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
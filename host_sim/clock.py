@@ -0,0 +1,125 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Virtual time for simulated runs
+#
+# `VirtualClock` replaces the firmware's time source(`keyboard.clock`), and
+# `VirtualTimeLoop` is an asyncio event loop running on that clock: it never
+# sleeps, when every task is waiting it jumps straight to the next timer.
+# Each pass of the loop also costs `step_ns` of virtual time, standing in for
+# the CPU time of the tasks, so the busy `asyncio.sleep(0)` loops of the
+# firmware still see time moving. A run only depends on its inputs, the same
+# script produces a bit-identical HID report stream every time.
+#
+#   host_sim.install()
+#   clock = host_sim.use_virtual_time()
+#   keyboard.run()  # asyncio.run() now uses the virtual time loop
+#   clock.fast_forward(600 * 10**9, at_ns = clock.now_ns + 10**9)
+#     # 1 second in, skip 10 minutes of idling
+
+import asyncio
+import selectors
+
+from keyboard import clock as firmware_clock
+from . import hardware
+
+
+class VirtualClock:
+
+	def __init__(self, start_ns = 1000000000, step_ns = 100000):
+		self.now_ns = start_ns
+		self.step_ns = step_ns
+		self._jumps = [] # (at_ns, ns), see `fast_forward`
+
+	def monotonic_ns(self):
+		return self.now_ns
+
+	def time(self):
+		return self.now_ns / 1000000000
+
+	def advance(self, ns):
+		self.now_ns += max(0, int(ns))
+
+	def advance_to(self, ns):
+		self.now_ns = max(self.now_ns, int(ns))
+
+	def fast_forward(self, ns, at_ns = None):
+		# skip `ns` of virtual time once the clock reaches `at_ns`(now if None)
+		# takes effect on the next pass of the loop
+		at_ns = self.now_ns if at_ns is None else at_ns
+		self._jumps.append((at_ns, int(ns)))
+		self._jumps.sort()
+
+	def step(self, timeout_ns):
+		# one pass of the loop: wait for the timeout, at least one step
+		self.advance(max(timeout_ns, self.step_ns))
+		jumps = self._jumps
+		while jumps and jumps[0][0] <= self.now_ns:
+			self.advance(jumps.pop(0)[1])
+
+
+class _VirtualSelector(selectors.BaseSelector):
+	# no real I/O in a simulation, waiting for I/O means moving the clock
+
+	def __init__(self, clock):
+		self._clock = clock
+		self._map = {}
+
+	def register(self, fileobj, events, data = None):
+		key = selectors.SelectorKey(fileobj, id(fileobj), events, data)
+		self._map[fileobj] = key
+		return key
+
+	def unregister(self, fileobj):
+		return self._map.pop(fileobj)
+
+	def select(self, timeout = None):
+		if timeout is None:
+			# nothing scheduled at all, nothing can ever happen
+			raise RuntimeError("Virtual time loop stalled: no task is waiting on a timer")
+		self._clock.step(timeout * 1000000000)
+		return []
+
+	def close(self):
+		self._map.clear()
+
+	def get_map(self):
+		return self._map
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+
+	def __init__(self, clock):
+		self.clock = clock
+		super().__init__(_VirtualSelector(clock))
+		self._clock_resolution = 1e-9
+
+	def time(self):
+		return self.clock.time()
+
+
+class VirtualTimePolicy(asyncio.DefaultEventLoopPolicy):
+	# makes asyncio.run() and friends use the virtual time loop
+
+	def __init__(self, clock):
+		super().__init__()
+		self.clock = clock
+
+	def new_event_loop(self):
+		return VirtualTimeLoop(self.clock)
+
+
+def use_virtual_time(clock = None, **kwargs):
+	# install a virtual clock for the firmware and asyncio, return it
+	if clock is None:
+		clock = VirtualClock(**kwargs)
+	firmware_clock.set_source(clock.monotonic_ns)
+	hardware.set_time_source(clock.monotonic_ns)
+	asyncio.set_event_loop_policy(VirtualTimePolicy(clock))
+	return clock
+
+
+def use_real_time():
+	firmware_clock.set_source(None)
+	hardware.set_time_source(None)
+	asyncio.set_event_loop_policy(None)
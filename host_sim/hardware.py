@@ -0,0 +1,315 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Models of the simulated hardware
+#
+# The stand-in modules in `host_sim/modules` (board, digitalio, matrix2, ...)
+# talk to the singletons created at the bottom of this file, scripts and
+# benchmarks talk to the same objects to press keys or inspect the results.
+
+import time
+
+
+class SimulationDone(Exception):
+	# raised by the key matrix once its script is finished, stops the firmware
+	pass
+
+
+class SystemReset(Exception):
+	# raised where the real hardware would reset(microcontroller.reset, suspend)
+	def __init__(self, reason = "reset"):
+		super().__init__(reason)
+		self.reason = reason
+
+
+# the time source of the simulated hardware, see `set_time_source`
+_time_source = time.monotonic_ns
+
+
+def set_time_source(monotonic_ns):
+	global _time_source
+	_time_source = monotonic_ns if monotonic_ns is not None else time.monotonic_ns
+
+
+def monotonic_ns():
+	return _time_source()
+
+
+def ms():
+	return _time_source() // 1000000
+
+
+class HostModel:
+	# the computer(s) on the other side of USB and BLE
+
+	def __init__(self):
+		self.usb_connected = True
+		self.keyboard_leds = 0 # LED out report, e.g. 0x02 for capslock
+
+
+class ReportRecorder:
+	# records every HID report sent by the firmware
+	# each record: (time_ns, interface, kind, report)
+	#   interface: "usb" or "ble"
+	#   kind: "keyboard", "mouse", "consumer_control" or "device"
+	# `host_times` holds the host's perf_counter_ns of each record, which
+	# unlike time_ns is real time even on the virtual clock
+
+	def __init__(self):
+		self.records = []
+		self.host_times = []
+		self.enabled = True
+
+	def record(self, interface, kind, report):
+		if self.enabled:
+			self.host_times.append(time.perf_counter_ns())
+			self.records.append((_time_source(), interface, kind, bytes(report)))
+
+	def clear(self):
+		self.records.clear()
+		self.host_times.clear()
+
+	def filter(self, interface = None, kind = None):
+		return [r for r in self.records
+				if (interface is None or r[1] == interface)
+				and (kind is None or r[2] == kind)]
+
+	def __len__(self):
+		return len(self.records)
+
+
+class KeyMatrixModel:
+	# a scriptable key matrix
+	# keys are numbered `row * cols + col`, the same as matrix2/keypad do
+	# a script is a list of (time_ms, key_number, pressed), time_ms is relative
+	# to the moment `play` is called, the events are applied when the matrix
+	# is read, so no extra task is needed
+
+	def __init__(self, rows = 8, cols = 8):
+		self.rows = rows
+		self.cols = cols
+		self.key_count = rows * cols
+		self.pressed = bytearray(self.key_count)
+		self.row_pins = ()
+		self.col_pins = ()
+		# output level driven on each row, None if the row is an input
+		self.row_levels = [None] * rows
+		self._script = ()
+		self._script_index = 0
+		self._script_start = 0
+		# stop the simulation this many ms after the last scripted event
+		# None to keep running
+		self.stop_after = None
+		self.change_count = 0
+		# if True, every change is logged into `changes` as
+		# (perf_counter_ns, key_number, pressed), see `ReportRecorder.host_times`
+		self.log_changes = False
+		self.changes = []
+
+	def set_key(self, key_number, pressed):
+		pressed = 1 if pressed else 0
+		if self.pressed[key_number] != pressed:
+			self.pressed[key_number] = pressed
+			self.change_count += 1
+			if self.log_changes:
+				self.changes.append((time.perf_counter_ns(), key_number, pressed))
+
+	def press(self, key_number):
+		self.set_key(key_number, True)
+
+	def release(self, key_number):
+		self.set_key(key_number, False)
+
+	def release_all(self):
+		for i in range(self.key_count):
+			self.pressed[i] = 0
+
+	def play(self, script, stop_after = None):
+		self._script = sorted(script, key = lambda e: e[0])
+		self._script_index = 0
+		self._script_start = ms()
+		self.stop_after = stop_after
+
+	@property
+	def script_done(self):
+		return self._script_index >= len(self._script)
+
+	def poll(self):
+		# apply the scripted events that are due
+		script = self._script
+		if self._script_index < len(script):
+			now = ms() - self._script_start
+			while self._script_index < len(script) and script[self._script_index][0] <= now:
+				_, key_number, pressed = script[self._script_index]
+				self.set_key(key_number, pressed)
+				self._script_index += 1
+		elif self.stop_after is not None:
+			last = script[-1][0] if script else 0
+			if ms() - self._script_start >= last + self.stop_after:
+				raise SimulationDone()
+
+	def is_pressed(self, key_number):
+		self.poll()
+		return self.pressed[key_number] != 0
+
+	def read_column(self, col, pull_level):
+		# the level seen on a column pin, through any pressed key
+		# on a row that is driven to the opposite level of the pull
+		self.poll()
+		cols = self.cols
+		pressed = self.pressed
+		for row in range(self.rows):
+			level = self.row_levels[row]
+			if level is not None and level != pull_level and pressed[row * cols + col]:
+				return level
+		return pull_level
+
+
+class IS31FL3733Model:
+	# register model of the IS31FL3733 LED matrix driver
+	# page 0: LED on/off, open and short; page 1: PWM; page 2: auto breath mode
+	# page 3: function registers
+
+	def __init__(self):
+		self.pages = [bytearray(256) for _ in range(4)]
+		self.page = 0
+		self._unlocked = False
+		self._pointer = 0
+		self.write_count = 0
+		self.bytes_written = 0
+		self.reset_count = 0
+
+	def reset(self):
+		for page in self.pages:
+			for i in range(len(page)):
+				page[i] = 0
+		self.reset_count += 1
+
+	def write(self, data):
+		self.write_count += 1
+		self.bytes_written += len(data)
+		register = data[0]
+		self._pointer = register
+		if len(data) < 2:
+			return
+		if register == 0xFE: # command register write lock
+			self._unlocked = data[1] == 0xC5
+			return
+		if register == 0xFD: # command register, page select
+			if self._unlocked:
+				self.page = data[1] & 0x3
+				self._unlocked = False
+			return
+		page = self.pages[self.page]
+		for i in range(1, len(data)):
+			page[(register + i - 1) & 0xFF] = data[i]
+
+	def readinto(self, buffer):
+		page = self.pages[self.page]
+		register = self._pointer
+		if self.page == 3 and register == 0x11: # reading it resets the chip
+			self.reset()
+		for i in range(len(buffer)):
+			buffer[i] = page[(register + i) & 0xFF]
+
+	@property
+	def brightness(self):
+		# global current control
+		return self.pages[3][0x01]
+
+	def pixel(self, i):
+		# (r, g, b) of the LED, same layout as m60_*/is32fl3733.py
+		offset = (i >> 4) * 48 + (i & 15)
+		pwm = self.pages[1]
+		return (pwm[offset + 16], pwm[offset], pwm[offset + 32])
+
+
+class I2CBusModel:
+	# an in-memory I2C bus, devices are registered by address
+
+	def __init__(self):
+		self.devices = {}
+		self.transaction_count = 0
+
+	def attach(self, address, device):
+		self.devices[address] = device
+
+	def get(self, address):
+		device = self.devices.get(address, None)
+		if device is None:
+			raise OSError(19, "No such device") # ENODEV, like CircuitPython
+		self.transaction_count += 1
+		return device
+
+
+class BLEModel:
+	# the BLE radio and the remote host
+
+	def __init__(self):
+		self.name = "CIRCUITPY"
+		self.address = None
+		self.advertising = False
+		self.advertisement = None
+		self.connections = []
+		# connect as soon as the firmware starts advertising
+		self.auto_connect = False
+		self.advertise_count = 0
+
+	@property
+	def connected(self):
+		return len(self.connections) > 0
+
+	def start_advertising(self, advertisement):
+		self.advertising = True
+		self.advertisement = advertisement
+		self.advertise_count += 1
+		if self.auto_connect:
+			self.host_connect()
+
+	def stop_advertising(self):
+		self.advertising = False
+
+	def host_connect(self):
+		# a host connects, the radio stops advertising like the real one
+		connection = BLEConnectionModel(self)
+		self.connections.append(connection)
+		self.advertising = False
+		return connection
+
+	def host_disconnect(self):
+		self.connections.clear()
+
+
+class BLEConnectionModel:
+	def __init__(self, radio):
+		self._radio = radio
+		self.connected = True
+
+	def disconnect(self):
+		self.connected = False
+		if self in self._radio.connections:
+			self._radio.connections.remove(self)
+
+
+class SystemModel:
+	# microcontroller level state
+
+	def __init__(self):
+		self.uid = bytes(range(0x10, 0x20))
+		self.nvm = bytearray(8192)
+		self.next_run_mode = None
+		self.reset_count = 0
+		self.suspend_count = 0
+		# raw ADC value of the battery pin, about 4.0V on M60
+		self.battery_value = 39718
+
+
+HOST = HostModel()
+RECORDER = ReportRecorder()
+MATRIX = KeyMatrixModel()
+I2C_BUS = I2CBusModel()
+LED_DRIVER = IS31FL3733Model()
+BLE = BLEModel()
+SYSTEM = SystemModel()
+
+I2C_BUS.attach(0x50, LED_DRIVER)
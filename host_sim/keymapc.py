@@ -0,0 +1,51 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Compile the keymaps into binary blobs(see keyboard/keymap_blob.py)
+#   python -m host_sim.keymapc [--root .] [--out keymaps] [name ...]
+#
+# Writes `<name>.kmap` for each keymap in `keymaps.keymaps`, all of them by
+# default. Copy them to the drive's `keymaps` folder, the keyboard then loads
+# those instead of the modules. Run it again after editing a keymap, a blob
+# compiled from other sources than the ones on the drive is ignored(with a
+# warning), the keymap is then compiled from its module at boot.
+
+import argparse
+import os
+import sys
+
+import host_sim
+
+
+def main():
+	parser = argparse.ArgumentParser(prog = "python -m host_sim.keymapc",
+			description = "Compile the keymaps into binary blobs.")
+	parser.add_argument("names", nargs = "*", help = "keymap(s) to compile, all by default")
+	parser.add_argument("--root", default = os.getcwd(),
+			help = "folder containing the firmware(the CIRCUITPY drive)")
+	parser.add_argument("--out", default = None,
+			help = "output folder, the `keymaps` folder of the root by default")
+	args = parser.parse_args()
+
+	host_sim.install()
+	if args.root not in sys.path:
+		sys.path.insert(0, args.root)
+
+	from keyboard.keymap_blob import encode_keymap, keymap_source_stamp, KEYMAP_BLOB_SUFFIX
+	from keymaps import keymaps
+
+	source = os.path.join(args.root, "keymaps")
+	out = args.out if args.out is not None else source
+	stamp = keymap_source_stamp(source) or 0
+	for name in args.names or keymaps:
+		if name not in keymaps:
+			parser.error("Unknown keymap %s, choose from %s" % (name, ", ".join(keymaps)))
+		data = encode_keymap(keymaps[name], stamp)
+		path = os.path.join(out, name + KEYMAP_BLOB_SUFFIX)
+		with open(path, "wb") as f:
+			f.write(data)
+		print("%s: %d layers, %d bytes" % (path, len(keymaps[name]), len(data)))
+
+
+if __name__ == "__main__":
+	main()
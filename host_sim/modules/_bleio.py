@@ -0,0 +1,22 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# host stand-in for CircuitPython's `_bleio`, addresses only
+
+
+class Address:
+	PUBLIC = 0x0
+	RANDOM_STATIC = 0x1
+	RANDOM_PRIVATE_RESOLVABLE = 0x2
+	RANDOM_PRIVATE_NON_RESOLVABLE = 0x3
+
+	def __init__(self, address, address_type):
+		self.address_bytes = bytes(address)
+		self.type = address_type
+
+	def __eq__(self, other):
+		return isinstance(other, Address) \
+			and self.address_bytes == other.address_bytes and self.type == other.type
+
+	def __repr__(self):
+		return "<Address %s>" % ":".join("%02x" % b for b in reversed(self.address_bytes))
@@ -0,0 +1,49 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# host stand-in for `adafruit_ble`, a fake radio backed by host_sim.hardware.BLE
+
+from host_sim.hardware import BLE
+
+
+class _Adapter:
+	@property
+	def address(self):
+		return BLE.address
+
+	@address.setter
+	def address(self, value):
+		BLE.address = value
+
+
+class BLERadio:
+	def __init__(self, adapter = None):
+		self._adapter = _Adapter()
+
+	@property
+	def name(self):
+		return BLE.name
+
+	@name.setter
+	def name(self, value):
+		BLE.name = value
+
+	@property
+	def advertising(self):
+		return BLE.advertising
+
+	@property
+	def connected(self):
+		return BLE.connected
+
+	@property
+	def connections(self):
+		return tuple(BLE.connections)
+
+	def start_advertising(self, advertisement, scan_response = None, interval = 0.1, timeout = None):
+		if BLE.advertising:
+			raise RuntimeError("Already advertising")
+		BLE.start_advertising(advertisement)
+
+	def stop_advertising(self):
+		BLE.stop_advertising()
@@ -0,0 +1,12 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# host stand-in for `adafruit_ble.advertising`
+
+
+class Advertisement:
+	def __init__(self):
+		self.complete_name = None
+		self.short_name = None
+		self.appearance = None
+		self.connectable = True
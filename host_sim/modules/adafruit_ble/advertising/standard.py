@@ -0,0 +1,12 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# host stand-in for `adafruit_ble.advertising.standard`
+
+from . import Advertisement
+
+
+class ProvideServicesAdvertisement(Advertisement):
+	def __init__(self, *services):
+		super().__init__()
+		self.services = services
@@ -0,0 +1,8 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# host stand-in for `adafruit_ble.services`
+
+
+class Service:
+	pass
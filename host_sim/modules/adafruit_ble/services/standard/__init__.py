@@ -0,0 +1,11 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# host stand-in for `adafruit_ble.services.standard`
+
+from .. import Service
+
+
+class BatteryService(Service):
+	def __init__(self):
+		self.level = 100
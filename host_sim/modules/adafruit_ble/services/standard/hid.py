@@ -0,0 +1,41 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# host stand-in for `adafruit_ble.services.standard.hid`
+# the device list mirrors the default descriptor: keyboard(in + LED out),
+# mouse and consumer control, sent reports are recorded by host_sim
+
+from host_sim.hardware import BLE, HOST, RECORDER
+from .. import Service
+
+
+class ReportIn:
+	def __init__(self, usage_page, usage, kind, length):
+		self.usage_page = usage_page
+		self.usage = usage
+		self.kind = kind
+		self.length = length
+
+	def send_report(self, report):
+		if BLE.connected:
+			RECORDER.record("ble", self.kind, report)
+
+
+class ReportOut:
+	def __init__(self, usage_page, usage):
+		self.usage_page = usage_page
+		self.usage = usage
+
+	@property
+	def report(self):
+		return bytes((HOST.keyboard_leds,))
+
+
+class HIDService(Service):
+	def __init__(self, hid_descriptor = None):
+		self.devices = [
+			ReportIn(0x01, 0x06, "keyboard", 8),
+			ReportOut(0x01, 0x06),
+			ReportIn(0x01, 0x02, "mouse", 4),
+			ReportIn(0x0C, 0x01, "consumer_control", 2),
+		]
@@ -0,0 +1,9 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# host stand-in for `adafruit_logging`, backed by CPython's logging
+
+import logging
+from logging import getLogger, NOTSET, DEBUG, INFO, WARNING, ERROR, CRITICAL
+
+logging.basicConfig(format = "%(name)s: %(levelname)s - %(message)s")
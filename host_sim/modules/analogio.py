@@ -0,0 +1,23 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# host stand-in for CircuitPython's `analogio`
+# only the battery pin is modelled
+
+from host_sim.hardware import SYSTEM
+
+
+class AnalogIn:
+	def __init__(self, pin):
+		self.pin = pin
+
+	@property
+	def value(self):
+		return SYSTEM.battery_value
+
+	@property
+	def reference_voltage(self):
+		return 3.3
+
+	def deinit(self):
+		pass
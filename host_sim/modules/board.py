@@ -0,0 +1,32 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# host stand-in for the M60 `board` module
+
+from microcontroller import Pin
+from host_sim.hardware import MATRIX
+
+R1 = Pin("R1")
+R2 = Pin("R2")
+R3 = Pin("R3")
+R4 = Pin("R4")
+R5 = Pin("R5")
+R6 = Pin("R6")
+R7 = Pin("R7")
+R8 = Pin("R8")
+
+C1 = Pin("C1")
+C2 = Pin("C2")
+C3 = Pin("C3")
+C4 = Pin("C4")
+C5 = Pin("C5")
+C6 = Pin("C6")
+C7 = Pin("C7")
+C8 = Pin("C8")
+
+SCL = Pin("SCL")
+SDA = Pin("SDA")
+
+# the key matrix model needs to know which pin is which row/column
+MATRIX.row_pins = (R1, R2, R3, R4, R5, R6, R7, R8)
+MATRIX.col_pins = (C1, C2, C3, C4, C5, C6, C7, C8)
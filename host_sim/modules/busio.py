@@ -0,0 +1,41 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# host stand-in for CircuitPython's `busio`, I2C only
+# transfers go to the devices attached to the in-memory bus
+
+from host_sim.hardware import I2C_BUS
+
+
+class I2C:
+	def __init__(self, scl, sda, *, frequency = 100000, timeout = 255):
+		self.frequency = frequency
+		self._locked = False
+
+	def deinit(self):
+		pass
+
+	def try_lock(self):
+		if self._locked:
+			return False
+		self._locked = True
+		return True
+
+	def unlock(self):
+		self._locked = False
+
+	def scan(self):
+		return sorted(I2C_BUS.devices.keys())
+
+	def writeto(self, address, buffer, *, start = 0, end = None):
+		I2C_BUS.get(address).write(bytes(buffer[start:end]))
+
+	def readfrom_into(self, address, buffer, *, start = 0, end = None):
+		view = memoryview(buffer)[start:end]
+		I2C_BUS.get(address).readinto(view)
+
+	def writeto_then_readfrom(self, address, buffer_out, buffer_in, *,
+			out_start = 0, out_end = None, in_start = 0, in_end = None):
+		device = I2C_BUS.get(address)
+		device.write(bytes(buffer_out[out_start:out_end]))
+		device.readinto(memoryview(buffer_in)[in_start:in_end])
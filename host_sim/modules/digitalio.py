@@ -0,0 +1,80 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# host stand-in for CircuitPython's `digitalio`
+# row and column pins of the key matrix are wired to the key matrix model
+
+from host_sim.hardware import MATRIX
+
+
+class Direction:
+	INPUT = "INPUT"
+	OUTPUT = "OUTPUT"
+
+
+class DriveMode:
+	PUSH_PULL = "PUSH_PULL"
+	OPEN_DRAIN = "OPEN_DRAIN"
+
+
+class Pull:
+	UP = "UP"
+	DOWN = "DOWN"
+
+
+class DigitalInOut:
+	def __init__(self, pin):
+		self.pin = pin
+		self._direction = Direction.INPUT
+		self._value = False
+		self.drive_mode = DriveMode.PUSH_PULL
+		self.pull = None
+		self._row = MATRIX.row_pins.index(pin) if pin in MATRIX.row_pins else -1
+		self._col = MATRIX.col_pins.index(pin) if pin in MATRIX.col_pins else -1
+
+	def deinit(self):
+		self.direction = Direction.INPUT
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.deinit()
+
+	def switch_to_output(self, value = False, drive_mode = DriveMode.PUSH_PULL):
+		self.drive_mode = drive_mode
+		self.direction = Direction.OUTPUT
+		self.value = value
+
+	def switch_to_input(self, pull = None):
+		self.direction = Direction.INPUT
+		self.pull = pull
+
+	@property
+	def direction(self):
+		return self._direction
+
+	@direction.setter
+	def direction(self, value):
+		self._direction = value
+		self._update_row()
+
+	@property
+	def value(self):
+		if self._direction == Direction.INPUT and self._col >= 0:
+			return MATRIX.read_column(self._col, self.pull == Pull.UP)
+		if self._direction == Direction.INPUT:
+			return self.pull == Pull.UP
+		return self._value
+
+	@value.setter
+	def value(self, value):
+		self._value = bool(value)
+		self._update_row()
+
+	def _update_row(self):
+		if self._row >= 0:
+			if self._direction == Direction.OUTPUT:
+				MATRIX.row_levels[self._row] = self._value
+			else:
+				MATRIX.row_levels[self._row] = None
@@ -0,0 +1,92 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# host stand-in for CircuitPython's `keypad`, KeyMatrix only
+# the real module scans in the background every `interval` seconds, here the
+# scan happens when the events are read and the interval has passed
+
+from host_sim.hardware import MATRIX, monotonic_ns
+
+
+class Event:
+	def __init__(self, key_number = 0, pressed = True):
+		self.key_number = key_number
+		self.pressed = pressed
+		self.timestamp = monotonic_ns() // 1000000
+
+	@property
+	def released(self):
+		return not self.pressed
+
+	def __eq__(self, other):
+		return isinstance(other, Event) \
+			and self.key_number == other.key_number and self.pressed == other.pressed
+
+
+class EventQueue:
+	def __init__(self, keys, max_events):
+		self._keys = keys
+		self._events = []
+		self._max_events = max_events
+		self.overflowed = False
+
+	def _put(self, event):
+		if len(self._events) >= self._max_events:
+			self.overflowed = True
+			return
+		self._events.append(event)
+
+	def get(self):
+		self._keys._scan()
+		if self._events:
+			return self._events.pop(0)
+		return None
+
+	def get_into(self, event):
+		got = self.get()
+		if got is None:
+			return False
+		event.key_number = got.key_number
+		event.pressed = got.pressed
+		event.timestamp = got.timestamp
+		return True
+
+	def clear(self):
+		self._events.clear()
+		self.overflowed = False
+
+	def __len__(self):
+		return len(self._events)
+
+	def __bool__(self):
+		return len(self._events) != 0
+
+
+class KeyMatrix:
+	def __init__(self, row_pins, column_pins, columns_to_anodes = True,
+			interval = 0.02, max_events = 64):
+		self.key_count = len(row_pins) * len(column_pins)
+		self._interval_ns = int(interval * 1000000000)
+		self._last_scan = 0
+		self._state = bytearray(self.key_count)
+		self.events = EventQueue(self, max_events)
+
+	def deinit(self):
+		pass
+
+	def reset(self):
+		for i in range(self.key_count):
+			self._state[i] = 0
+
+	def _scan(self):
+		now = monotonic_ns()
+		if now - self._last_scan < self._interval_ns:
+			return
+		self._last_scan = now
+		MATRIX.poll()
+		pressed = MATRIX.pressed
+		state = self._state
+		for key_number in range(self.key_count):
+			if pressed[key_number] != state[key_number]:
+				state[key_number] = pressed[key_number]
+				self.events._put(Event(key_number, pressed[key_number] != 0))
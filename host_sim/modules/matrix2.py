@@ -0,0 +1,116 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# host stand-in for the custom `matrix2` module
+# same debouncing and event generation as the C implementation, but reads
+# the key matrix model instead of the pins
+
+from host_sim.hardware import HOST, MATRIX, SYSTEM, SystemReset
+
+
+class Matrix2:
+	def __init__(self, row_pins, column_pins, columns_to_anodes = True,
+			max_events = 64, max_bit_count = 6, active_bit_count = 4, inactive_bit_count = 2):
+		self._rows = len(row_pins)
+		self._cols = len(column_pins)
+		self.key_count = self._rows * self._cols
+		self.columns_to_anodes = columns_to_anodes
+		self.max_bit_count = min(max_bit_count, 15)
+		self.active_bit_count = active_bit_count
+		self.inactive_bit_count = inactive_bit_count
+		self._key_values = [0] * self.key_count
+		self._previously_pressed = bytearray(self.key_count)
+		self._max_events = max_events
+		self._events = bytearray(max_events)
+		self._events_head = 0
+		self._events_length = 0
+
+	@property
+	def rows(self):
+		return self._rows
+
+	@property
+	def cols(self):
+		return self._cols
+
+	def deinit(self):
+		self.key_count = 0
+
+	def _put(self, event):
+		# new events are dropped when full, like ringbuf_put
+		if self._events_length >= self._max_events:
+			return
+		self._events[(self._events_head + self._events_length) % self._max_events] = event
+		self._events_length += 1
+
+	def get(self):
+		if self._events_length == 0:
+			return None
+		event = self._events[self._events_head]
+		self._events_head = (self._events_head + 1) % self._max_events
+		self._events_length -= 1
+		return event
+
+	def scan(self):
+		MATRIX.poll()
+		max_bit_mask = (1 << self.max_bit_count) - 1
+		pressed = MATRIX.pressed
+		key_values = self._key_values
+		for key_number in range(self.key_count):
+			if pressed[key_number]:
+				key_values[key_number] = ((key_values[key_number] << 1) | 1) & max_bit_mask
+			else:
+				key_values[key_number] >>= 1
+
+	def generate_events(self):
+		active_mask = (1 << self.active_bit_count) - 1
+		inactive_mask = (1 << self.inactive_bit_count) - 1
+		key_values = self._key_values
+		previously_pressed = self._previously_pressed
+		for key_number in range(self.key_count):
+			value = key_values[key_number]
+			if value > active_mask and not previously_pressed[key_number]:
+				previously_pressed[key_number] = 1
+				self._put(key_number & 0x7F)
+			elif value < inactive_mask and previously_pressed[key_number]:
+				previously_pressed[key_number] = 0
+				self._put((key_number & 0x7F) | 0x80)
+		return self._events_length
+
+	def suspend(self):
+		# the real one powers off and resets on the next key press
+		if HOST.usb_connected:
+			return 0
+		SYSTEM.suspend_count += 1
+		self.deinit()
+		raise SystemReset("suspend")
+
+	def __len__(self):
+		return self._events_length
+
+	def __bool__(self):
+		return self._events_length != 0
+
+	def __getitem__(self, index):
+		if index < 0:
+			index += self._events_length
+		if not 0 <= index < self._events_length:
+			raise IndexError
+		return self._events[(self._events_head + index) % self._max_events]
+
+	def __iter__(self):
+		return _Matrix2Iterator(self)
+
+
+class _Matrix2Iterator:
+	def __init__(self, matrix):
+		self._matrix = matrix
+
+	def __iter__(self):
+		return self
+
+	def __next__(self):
+		event = self._matrix.get()
+		if event is None:
+			raise StopIteration
+		return event
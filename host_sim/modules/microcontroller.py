@@ -0,0 +1,58 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# host stand-in for CircuitPython's `microcontroller`
+
+from host_sim.hardware import SYSTEM, SystemReset
+
+
+class Pin:
+	def __init__(self, name):
+		self.name = name
+
+	def __repr__(self):
+		return "microcontroller.pin.%s" % self.name
+
+
+class _Pins:
+	P0_02 = Pin("P0_02") # battery
+	P1_04 = Pin("P1_04") # LED driver power
+
+
+pin = _Pins()
+
+
+class _Processor:
+	@property
+	def uid(self):
+		return SYSTEM.uid
+
+	@property
+	def temperature(self):
+		return 25.0
+
+	@property
+	def voltage(self):
+		return 3.3
+
+
+cpu = _Processor()
+
+# non-volatile memory, a bytearray is close enough
+nvm = SYSTEM.nvm
+
+
+class RunMode:
+	NORMAL = "NORMAL"
+	SAFE_MODE = "SAFE_MODE"
+	UF2 = "UF2"
+	BOOTLOADER = "BOOTLOADER"
+
+
+def on_next_reset(run_mode):
+	SYSTEM.next_run_mode = run_mode
+
+
+def reset():
+	SYSTEM.reset_count += 1
+	raise SystemReset("reset")
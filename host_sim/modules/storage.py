@@ -0,0 +1,12 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# host stand-in for CircuitPython's `storage`, for boot.py
+
+
+def remount(mount_path, readonly = False, *, disable_concurrent_write_protection = False):
+	pass
+
+
+def disable_usb_drive():
+	pass
@@ -0,0 +1,27 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# host stand-in for CircuitPython's `supervisor`
+
+from host_sim.hardware import HOST, monotonic_ns
+
+
+class _Runtime:
+	@property
+	def usb_connected(self):
+		return HOST.usb_connected
+
+	@property
+	def serial_connected(self):
+		return True
+
+
+runtime = _Runtime()
+
+
+def disable_ble_workflow():
+	pass
+
+
+def ticks_ms():
+	return (monotonic_ns() // 1000000) & 0x3FFFFFFF
@@ -0,0 +1,64 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# host stand-in for CircuitPython's `usb_hid`
+# every sent report is recorded by host_sim.hardware.RECORDER
+
+from host_sim.hardware import HOST, RECORDER
+
+
+def _kind(usage_page, usage):
+	if usage_page == 0x01 and usage == 0x06:
+		return "keyboard"
+	if usage_page == 0x01 and usage == 0x02:
+		return "mouse"
+	if usage_page == 0x0C and usage == 0x01:
+		return "consumer_control"
+	return "device"
+
+
+class Device:
+	def __init__(self, *, report_descriptor = b"", usage_page, usage,
+			report_ids, in_report_lengths, out_report_lengths):
+		self.report_descriptor = report_descriptor
+		self.usage_page = usage_page
+		self.usage = usage
+		self.report_ids = tuple(report_ids)
+		self.in_report_lengths = tuple(in_report_lengths)
+		self.out_report_lengths = tuple(out_report_lengths)
+		self.kind = _kind(usage_page, usage)
+		self._last_leds = None
+
+	def send_report(self, report, report_id = None):
+		if not HOST.usb_connected:
+			raise OSError("USB busy")
+		RECORDER.record("usb", self.kind, report)
+
+	def get_last_received_report(self, report_id = None):
+		# only the keyboard LED report is modelled
+		if self.kind != "keyboard" or not self.out_report_lengths:
+			return None
+		if self._last_leds == HOST.keyboard_leds:
+			return None
+		self._last_leds = HOST.keyboard_leds
+		return bytes((HOST.keyboard_leds,))
+
+
+Device.KEYBOARD = Device(usage_page = 0x01, usage = 0x06,
+		report_ids = (1,), in_report_lengths = (8,), out_report_lengths = (1,))
+Device.MOUSE = Device(usage_page = 0x01, usage = 0x02,
+		report_ids = (2,), in_report_lengths = (4,), out_report_lengths = (0,))
+Device.CONSUMER_CONTROL = Device(usage_page = 0x0C, usage = 0x01,
+		report_ids = (3,), in_report_lengths = (2,), out_report_lengths = (0,))
+
+devices = (Device.KEYBOARD, Device.MOUSE, Device.CONSUMER_CONTROL)
+
+
+def enable(new_devices, boot_device = 0):
+	global devices
+	devices = tuple(new_devices)
+
+
+def disable():
+	global devices
+	devices = ()
@@ -0,0 +1,79 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Replay a key trace(see keyboard/keytrace.py) on the host
+#   python -m host_sim.replay keytrace.bin [--board m60_matrix2] [--keymap default]
+#
+# Runs on the virtual clock by default, so the replay is deterministic and
+# takes only the CPU time it needs, `--real-time` keeps the recorded pace.
+
+import argparse
+import importlib
+import os
+import sys
+import time
+
+import host_sim
+
+
+def main():
+	parser = argparse.ArgumentParser(prog = "python -m host_sim.replay",
+			description = "Replay a key trace through the keyboard firmware.")
+	parser.add_argument("trace", help = "key trace file")
+	parser.add_argument("--root", default = os.getcwd(),
+			help = "folder containing the firmware(the CIRCUITPY drive)")
+	parser.add_argument("--board", default = "m60_matrix2",
+			help = "hardware package providing KeyboardHardware")
+	parser.add_argument("--keymap", default = "default",
+			help = "name of the keymap in `keymaps`")
+	parser.add_argument("--speed", type = float, default = 1,
+			help = "timing scale, 0 to replay one recorded scan per pass")
+	parser.add_argument("--nkro", action = "store_true", help = "use the NKRO USB report")
+	parser.add_argument("--real-time", action = "store_true",
+			help = "run on the real clock instead of the virtual one")
+	parser.add_argument("--verbose", action = "store_true")
+	parser.add_argument("--dump", action = "store_true", help = "print every HID report")
+	args = parser.parse_args()
+
+	host_sim.install()
+	if args.root not in sys.path:
+		sys.path.insert(0, args.root)
+	clock = None
+	if not args.real_time:
+		clock = host_sim.use_virtual_time()
+
+	from keyboard import Keyboard
+	from keyboard.keytrace import KeyTraceReplayer, ReplayFinished
+	from keymaps import keymaps
+	board = importlib.import_module(args.board)
+
+	with open(args.trace, "rb") as f:
+		trace = f.read()
+	replayer = KeyTraceReplayer(trace, board.KeyboardHardware(), speed = args.speed)
+
+	keyboard = Keyboard(nkro_usb = args.nkro, verbose = args.verbose)
+	keyboard.register_hardware(lambda: replayer)
+	keyboard.register_keymap(keymaps[args.keymap])
+
+	start = time.perf_counter()
+	start_ns = clock.now_ns if clock is not None else None
+	try:
+		keyboard.run()
+	except ReplayFinished:
+		pass
+	except host_sim.SystemReset as e:
+		print("Firmware requested a %s" % e.reason)
+	elapsed = time.perf_counter() - start
+
+	if args.dump:
+		for record in host_sim.RECORDER.records:
+			print("%.3f %s %s %s" % (record[0] / 1e9, record[1], record[2], record[3].hex()))
+	print("%d events replayed, %d HID reports sent" % (replayer.replayed, len(host_sim.RECORDER)))
+	if clock is not None:
+		print("%.3f s virtual time, %.3f s CPU time" % ((clock.now_ns - start_ns) / 1e9, elapsed))
+	else:
+		print("%.3f s" % elapsed)
+
+
+if __name__ == "__main__":
+	main()
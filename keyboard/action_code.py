@@ -470,6 +470,7 @@ ACT_MODS            = 0b0000
 ACT_MODS_TAP        = 0b0010
 ACT_USAGE           = 0b0100
 ACT_MOUSEKEY        = 0b0101
+ACT_LEADER          = 0b0110    # key sequences, see keyboard/leader.py
 ACT_LAYER           = 0b1000
 ACT_LAYER_TAP       = 0b1010    # Layer  0-15
 ACT_LAYER_TAP_EXT   = 0b1011    # Layer 16-31
@@ -576,6 +577,7 @@ MS_MOVEMENT = (
 )
 
 MACRO = lambda n: ACTION(ACT_MACRO, n)
+LEADER = ACTION(ACT_LEADER, 0)
 BACKLIGHT = lambda n: ACTION(ACT_BACKLIGHT, n)
 
 RGB_TOGGLE = BACKLIGHT(0)
@@ -595,6 +597,9 @@ HEATMAP = COMMAND(0, 1)
 SUSPEND = COMMAND(0, 2)
 SHUTDOWN = COMMAND(0, 3)
 USB_TOGGLE = COMMAND(0, 4)
+LATENCY = COMMAND(0, 5) # print the scan-to-report latency histograms
+TAP_TIMING = COMMAND(0, 6) # print and save the adaptive tap timing
+BIGRAM = COMMAND(0, 7) # export the key transition counts
 
 BT = lambda n: COMMAND(1, n)
 BT0 = BT(0)
@@ -0,0 +1,88 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Key transition(bigram) counters, for offline layout analysis
+#
+# counts[previous * key_count + key] is incremented on every press, 16 bits
+# saturating, about 7.5KB for 61 keys. The BIGRAM command key exports them
+# to `path`(the drive must be writable for the code, see USB_STORAGE_MODE in
+# keyboard_config.py), or prints them to the serial console as hex lines
+# between "BIGRAM BEGIN" and "BIGRAM END" if it can't be written.
+#
+# Export format:
+#   header: b"BGRM", version(1 byte), key_count(1 byte), entries(2 bytes)
+#   entries: previous key(1 byte), key(1 byte), count(2 bytes), only the
+#     non-zero counters
+#   little endian
+
+import binascii
+import struct
+
+import array
+
+from adafruit_logging import getLogger
+
+logger = getLogger("Bigram")
+
+BIGRAM_MAGIC = b"BGRM"
+BIGRAM_VERSION = 1
+
+
+class BigramStats:
+
+	def __init__(self, key_count, path = "/bigram.bin"):
+		self.key_count = key_count
+		self.path = path
+		# raw initialized from the bytes, like keyboard/keymap_blob.py, not
+		# grown one item at a time
+		self.counts = array.array("H", bytearray(2 * key_count * key_count))
+		self.last = -1
+
+	def record(self, key_id):
+		# on every press
+		last = self.last
+		self.last = key_id
+		if last >= 0:
+			i = last * self.key_count + key_id
+			if self.counts[i] < 0xFFFF:
+				self.counts[i] += 1
+
+	def clear(self):
+		counts = self.counts
+		for i in range(len(counts)):
+			counts[i] = 0
+		self.last = -1
+
+	def _entries(self):
+		counts = self.counts
+		key_count = self.key_count
+		for i in range(len(counts)):
+			if counts[i]:
+				yield i // key_count, i % key_count, counts[i]
+
+	def export(self, write):
+		# stream the export format to `write`, 4 bytes at a time
+		entries = 0
+		for _ in self._entries():
+			entries += 1
+		write(BIGRAM_MAGIC + struct.pack("<BBH", BIGRAM_VERSION, self.key_count, entries))
+		record = bytearray(4)
+		for previous, key, count in self._entries():
+			struct.pack_into("<BBH", record, 0, previous, key, count)
+			write(record)
+
+	def save(self, path = None):
+		# export to a file, print it if the drive is read-only
+		# return True if saved
+		path = self.path if path is None else path
+		try:
+			with open(path, "wb") as f:
+				self.export(f.write)
+		except OSError as e:
+			logger.error("Cannot save the bigram counts to %s: %s" % (path, e))
+			print("BIGRAM BEGIN")
+			self.export(lambda data: print(binascii.hexlify(data).decode()))
+			print("BIGRAM END")
+			return False
+		logger.info("Bigram counts saved to %s" % path)
+		return True
@@ -0,0 +1,32 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# The clock used by the firmware
+#
+# Every time reading in `keyboard` and the hardware modules goes through
+# here, so a simulation can replace the time source(see `set_source`) and
+# get repeatable timing. On the keyboard it's just `time.monotonic_ns`.
+
+import time
+
+_source = time.monotonic_ns
+
+
+def set_source(monotonic_ns):
+	# `monotonic_ns`: a function returning nanoseconds, None to restore the default
+	global _source
+	_source = monotonic_ns if monotonic_ns is not None else time.monotonic_ns
+
+
+def monotonic_ns():
+	return _source()
+
+
+def monotonic():
+	# seconds, float
+	return _source() / 1000000000
+
+
+def ms():
+	# milliseconds, wraps around at 31 bits
+	return _source() // 1000000 & 0x7FFFFFFF
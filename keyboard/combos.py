@@ -0,0 +1,171 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Combos(chords), keys pressed together for another action
+#
+# A combo is a few keymap positions and an action code. When a key of a
+# combo is pressed, the engine holds it back for up to `term` ms:
+#   all the keys of a combo pressed: the held presses are dropped, and the
+#     combo is pressed instead, released when the first of its keys is
+#   any other event, or `term` expired: the held presses go on as they are
+# A combo with more keys wins over one it contains, if it's completed in
+# time.
+#
+# The engine sits in front of the tap-hold buffer(`Keyboard._process_pending_events`),
+# a combo comes out as a key event of its own, with the id
+# `key_count + combo index`, so its action can be a tap key as well.
+#
+# Each position has the combos it's in, with its bit in each of them, the
+# bits of the held keys are ORed into a mask per combo, a combo is complete
+# when its mask is full. The masks are small ints, only the combos of the
+# pressed key are touched, and nothing is allocated per key event.
+
+import array
+
+from .action_code import get_action_code
+
+COMBO_MAX_KEYS = 8
+
+
+class ComboEngine:
+
+	def __init__(self, combos, key_count, term = 50):
+		# `combos`: ((positions, action), ...), keymap positions and an
+		# action like in a keymap
+		count = len(combos)
+		if key_count + count > 0x80:
+			raise ValueError("Too many combos, key ids are 7 bits")
+		self.key_count = key_count
+		self.term = term
+		self.actions = array.array("H", (get_action_code(action) for _, action in combos))
+		self._full = bytearray(count) # mask of every key of a combo
+		self._mask = bytearray(count) # keys of a combo held back
+		self._hits = bytearray(count) # same, as a count
+		self._active = bytearray(count) # combo pressed
+		# by position: the combos, the bits of the position in them
+		# None for the positions in no combo
+		index_combos = [None] * key_count
+		index_bits = [None] * key_count
+		size = 0
+		for c in range(count):
+			positions = combos[c][0]
+			if len(positions) < 2 or len(positions) > COMBO_MAX_KEYS:
+				raise ValueError("A combo has 2 to %d keys" % COMBO_MAX_KEYS)
+			for i in range(len(positions)):
+				position = positions[i]
+				index_combos[position] = (index_combos[position] or ()) + (c,)
+				index_bits[position] = (index_bits[position] or ()) + (1 << i,)
+			self._full[c] = (1 << len(positions)) - 1
+			size = max(size, len(positions))
+		self._index_combos = index_combos
+		self._index_bits = index_bits
+		# the combo(index + 1) a key is part of, while it's held down
+		self._owner = bytearray(key_count)
+		# presses held back
+		self._events = bytearray(size)
+		self._times = [0] * size
+		self.held = 0
+		# events for the keyboard, read them after `feed` and `check`
+		self.out_events = bytearray(size + 2)
+		self.out_times = [0] * (size + 2)
+		self.out_count = 0
+
+	@property
+	def deadline(self):
+		# ms when the held presses go on, if any
+		return self._times[0] + self.term + 1
+
+	def feed(self, event, timestamp):
+		key = event & 0x7F
+		if event & 0x80: # release
+			if self.held > 0:
+				self._resolve()
+			owner = self._owner[key]
+			if owner == 0:
+				self._output(event, timestamp)
+				return
+			self._owner[key] = 0
+			c = owner - 1
+			if self._active[c]: # the first key of the combo released
+				self._active[c] = 0
+				self._output(0x80 | (self.key_count + c), timestamp)
+			return
+
+		combos = self._index_combos[key]
+		if self.held > 0 and (combos is None or not self._extends(combos)):
+			self._resolve()
+		if combos is None:
+			self._output(event, timestamp)
+			return
+		self._hold(key, timestamp)
+
+	def check(self, now):
+		# `term` expired, then the held presses go on
+		if self.held > 0 and (now - self._times[0]) & 0x7FFFFFFF > self.term:
+			self._resolve()
+
+	def _extends(self, combos):
+		# if a combo of the key has all the held keys
+		held = self.held
+		hits = self._hits
+		for c in combos:
+			if hits[c] == held:
+				return True
+		return False
+
+	def _hold(self, key, timestamp):
+		n = self.held
+		self._events[n] = key
+		self._times[n] = timestamp
+		n += 1
+		self.held = n
+		combos = self._index_combos[key]
+		bits = self._index_bits[key]
+		hits = self._hits
+		mask = self._mask
+		full = self._full
+		complete = False
+		waiting = False
+		for i in range(len(combos)):
+			c = combos[i]
+			hits[c] += 1
+			mask[c] |= bits[i]
+			if hits[c] == n:
+				if mask[c] == full[c]:
+					complete = True
+				else: # a bigger combo may still come
+					waiting = True
+		if complete and not waiting:
+			self._resolve()
+
+	def _resolve(self):
+		# the complete combo if any, otherwise let the held presses go on
+		n = self.held
+		combos = self._index_combos[self._events[n - 1]]
+		hits = self._hits
+		for c in combos:
+			if hits[c] == n and self._mask[c] == self._full[c]:
+				for i in range(n):
+					self._owner[self._events[i]] = c + 1
+				self._active[c] = 1
+				self._output(self.key_count + c, self._times[n - 1])
+				self._clear()
+				return
+		for i in range(n):
+			self._output(self._events[i], self._times[i])
+		self._clear()
+
+	def _clear(self):
+		hits = self._hits
+		mask = self._mask
+		for i in range(self.held):
+			for c in self._index_combos[self._events[i]]:
+				hits[c] = 0
+				mask[c] = 0
+		self.held = 0
+
+	def _output(self, event, timestamp):
+		i = self.out_count
+		self.out_events[i] = event
+		self.out_times[i] = timestamp
+		self.out_count = i + 1
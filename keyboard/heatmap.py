@@ -0,0 +1,121 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Persistent key press counters
+#
+# The counters live in an array("L"), the keyboard only increments them.
+# `flush` appends the changes since the last flush to a record log on nvm
+# (see keyboard/storage.py) as one delta record, and `load` adds them all
+# back up at boot. Each flush erases a flash page(see keyboard/storage.py),
+# so the keyboard only flushes before suspending or resetting and on the
+# HEATMAP command, never per keystroke or when idle.
+#
+# records:
+#   HEATMAP_SNAPSHOT: first key(1 byte), counts(4 bytes each, little endian)
+#   HEATMAP_DELTA: (key(1 byte), increment(2 bytes, little endian)), ...
+
+import array
+import struct
+
+from adafruit_logging import getLogger
+
+logger = getLogger("Heatmap")
+
+HEATMAP_SNAPSHOT = 1
+HEATMAP_DELTA = 2
+
+# keys per snapshot record, 4 bytes each
+_SNAPSHOT_KEYS = 60
+
+
+class HeatmapLog:
+
+	def __init__(self, counts, log):
+		# `counts`: array("L") with a counter per key
+		# `log`: a `RecordLog`, None to keep the counters in RAM only
+		self.counts = counts
+		self._log = log
+		# counts at the last flush
+		self._saved = array.array("L", counts)
+		self._delta = bytearray(255)
+
+	@property
+	def dirty(self):
+		counts = self.counts
+		saved = self._saved
+		for key in range(len(counts)):
+			if counts[key] != saved[key]:
+				return True
+		return False
+
+	def load(self):
+		# add the stored counts to the counters
+		if self._log is None:
+			return
+		counts = self.counts
+		key_count = len(counts)
+		loaded = array.array("L", [0] * key_count)
+		for tag, payload in self._log.records():
+			if tag == HEATMAP_SNAPSHOT:
+				first = payload[0]
+				for i in range((len(payload) - 1) // 4):
+					if first + i < key_count:
+						loaded[first + i] = struct.unpack_from("<L", payload, 1 + i * 4)[0]
+			elif tag == HEATMAP_DELTA:
+				for i in range(0, len(payload) - 2, 3):
+					key = payload[i]
+					if key < key_count:
+						loaded[key] += payload[i + 1] | (payload[i + 2] << 8)
+		for key in range(key_count):
+			counts[key] += loaded[key]
+			self._saved[key] += loaded[key]
+		logger.debug("Heatmap loaded, %d presses" % sum(loaded))
+
+	def flush(self):
+		# write the changes since the last flush, return True if written
+		if self._log is None or not self.dirty:
+			return False
+		counts = self.counts
+		saved = self._saved
+		delta = self._delta
+		key = 0
+		key_count = len(counts)
+		while key < key_count:
+			# one record with as many keys as fit
+			length = 0
+			while key < key_count and length + 3 <= len(delta):
+				increment = min(0xFFFF, (counts[key] - saved[key]) & 0xFFFFFFFF)
+				if increment > 0:
+					delta[length] = key
+					delta[length + 1] = increment & 0xFF
+					delta[length + 2] = increment >> 8
+					length += 3
+				key += 1
+			if length == 0:
+				break
+			if not self._log.append(HEATMAP_DELTA, memoryview(delta)[:length]):
+				# the half is full, a snapshot replaces everything
+				self._compact()
+				return True
+			for i in range(0, length, 3):
+				saved[delta[i]] += delta[i + 1] | (delta[i + 2] << 8)
+		return True
+
+	def _compact(self):
+		counts = self.counts
+		records = []
+		for first in range(0, len(counts), _SNAPSHOT_KEYS):
+			keys = counts[first:first + _SNAPSHOT_KEYS]
+			records.append((HEATMAP_SNAPSHOT, bytes((first,)) + struct.pack("<%dL" % len(keys), *keys)))
+		self._log.compact(records)
+		for key in range(len(counts)):
+			self._saved[key] = counts[key]
+		logger.debug("Heatmap log compacted")
+
+	def clear(self):
+		# reset the counters, stored ones included
+		counts = self.counts
+		for key in range(len(counts)):
+			counts[key] = 0
+		if self._log is not None:
+			self._compact()
@@ -4,7 +4,6 @@
 # This module wraps high-level HID API provided by usb_hid and BLERadio
 
 import struct
-import time
 import microcontroller
 import asyncio
 import adafruit_logging as logging
@@ -12,6 +11,9 @@ logger = logging.getLogger("HID Manager")
 logger.setLevel(logging.DEBUG)
 
 from .hid_wrapper import wrap_hid_interface
+from .text import compile_text
+from ..latency import LatencyHistogram
+from ..timers import Timers
 
 # USB interface
 import usb_hid
@@ -30,6 +32,11 @@ except:
 
 # tools
 from ..utils import do_nothing, is_usb_connected, async_no_fail
+from .. import clock
+
+# ms between the LED checks after a key press, and how many
+LED_CHECK_INTERVAL = 20
+LED_CHECK_COUNT = 5
 
 
 class HIDDeviceManager:
@@ -46,28 +53,56 @@ class HIDDeviceManager:
 				enable_ble = True,
 				battery = True,
 				verbose = False,
+				coalesce_reports = False,
+				latency_histogram = False,
+				timers = None,
+				ble_id = 1,
+				text_report_interval = None,
 				**kwargs):
 		self._interfaces = dict()
 		self._nkro_usb = nkro_usb
+		self._coalesce_reports = coalesce_reports
 		self._nkro_ble = False
 		self._hid_ble_handle = None
 		self._ble_radio = None
 		self._ble_mac_pool = None
-		self._ble_id = 1
+		self._ble_id = ble_id # the last one used, see keyboard/settings.py
+		# ms between the reports of `send_text`, by interface
+		self._text_report_interval = {"usb": 1, "ble": 10} \
+				if text_report_interval is None else text_report_interval
 		self._ble_battery = None
 		self._ble_advertisement = None
 		self._ble_advertisement_scan_response = None
 		self._ble_advertisement_started = False
 		self._ble_name_prefix = "PYKB"
-		self._ble_advertise_stop_time = time.time()
-		self._ble_last_connected_time = time.time()
+		# the keyboard's timers, or own ones checked by `connection_check`
+		self._own_timers = timers is None
+		self._timers = Timers() if timers is None else timers
+		self._ble_advertise_timer = self._timers.add(self.ble_advertisement_stop)
+		self._ble_last_connected_time = clock.monotonic()
 		self._current_interface_name = "unknown"
+		# called after switching the interface or the BLE ID
+		self._switch_callback = None
+		# set when the keyboard LEDs or the BLE state change, for the
+		# hardware(backlight), see `add_status_event`
+		self._status_events = []
+		self._last_led_status = 0
+		self._last_ble_advertising = False
+		self._last_ble_id = ble_id
+		# the LEDs are checked a few times after each key press, the host
+		# answers a CAPSLOCK with a new LED report, and every second
+		self._led_checks = 0
+		self._led_check_timer = self._timers.add(self._led_check)
 		self._previous_interface_name = "unknown"
 		self._usb_was_connected = False
 		# initialize interfaces and activate a proper one
 		self.__initialize_usb_interface()
 		if enable_ble and BLE_AVAILABLE:
 			self.__initialize_ble_interface(battery = battery)
+		for name, interface in self._interfaces.items():
+			interface.set_coalescing(coalesce_reports)
+			if latency_histogram:
+				interface.set_latency_histogram(LatencyHistogram(name))
 		self.current_interface = self._auto_select_device()
 		if not verbose:
 			logger.setLevel(logging.ERROR)
@@ -102,7 +137,6 @@ class HIDDeviceManager:
 		self._ble_advertisement.appearance = 961 # keyboard
 		self._ble_advertisement_scan_response = Advertisement()
 		self._ble_name_prefix = "PYKB" # TODO: better naming?
-		self._ble_id = 1
 		self._ble_radio = BLERadio()
 		if self._ble_radio.connected:
 			for c in self._ble_radio.connections:
@@ -129,6 +163,9 @@ class HIDDeviceManager:
 	async def connection_check(self):
 		while True:
 			await asyncio.sleep(1) # run at most one time a second
+			if self._own_timers:
+				await self._timers.dispatch()
+			self.check_status()
 
 			# check USB, switch to USB automatically if just connected
 			if is_usb_connected():
@@ -138,16 +175,11 @@ class HIDDeviceManager:
 			else:
 				self._usb_was_connected = False
 
-			# check BLE, auto stop advertisement
+			# check BLE, the advertisement is stopped by `_ble_advertise_timer`
 			if "ble" in self._interfaces:
-				# check connection and advertisement timeout
-				if self._ble_radio.advertising:
-					if time.time() > self._ble_advertise_stop_time:
-						await self.ble_advertisement_stop()
-						await asyncio.sleep(1)
 				# check ble connection
 				if self._ble_radio.connected:
-					self._ble_last_connected_time = time.time()
+					self._ble_last_connected_time = clock.monotonic()
 					# CPY will stop it
 					#await self.ble_advertisement_stop()
 					self._ble_advertisement_started = False
@@ -161,7 +193,7 @@ class HIDDeviceManager:
 					and not self._ble_radio.advertising \
 					and not self._ble_radio.connected \
 					and not self._ble_advertisement_started:
-						if time.time() - self._ble_last_connected_time < 180: # connected 3min ago
+						if clock.monotonic() - self._ble_last_connected_time < 180: # connected 3min ago
 							await self.ble_advertisement_start(60)
 				# switch to ble if usb is not available
 				if not is_usb_connected():
@@ -198,6 +230,7 @@ class HIDDeviceManager:
 		if interface and self._current_interface_name != "usb":
 			logger.info("Switching to USB")
 			await self.release_all()
+			interface.invalidate_last_reports()
 			self.current_interface = interface
 			self.set_current_interface_name("usb")
 
@@ -207,11 +240,13 @@ class HIDDeviceManager:
 			logger.info("Switching to BLE(%d)" % self._ble_id)
 			await self.release_all()
 			await self.ble_advertisement_update()
+			interface.invalidate_last_reports()
 			self.current_interface = interface
 			self.set_current_interface_name("ble")
 			# the check loop will restart the advertisement automatically, don't do it here
 			# but set the time
-			self._ble_last_connected_time = time.time()
+			self._ble_last_connected_time = clock.monotonic()
+			self.check_status()
 
 	async def ble_advertisement_update(self):
 		bt_id = self._ble_id
@@ -232,11 +267,13 @@ class HIDDeviceManager:
 		if self._ble_id == bt_id:
 			# if not connected, advertise, switch to bt
 			# reset last connected time so advertisement will auto start
-			self._ble_last_connected_time = time.time()
+			self._ble_last_connected_time = clock.monotonic()
 			await self.switch_to_ble()
 			return
 		else:
 			self._ble_id = bt_id
+			if self._switch_callback is not None:
+				self._switch_callback()
 
 		# stop advertising and disconnect all
 		await self.ble_advertisement_stop()
@@ -249,12 +286,14 @@ class HIDDeviceManager:
 	async def ble_advertisement_start(self, timeout = 60):
 		#await self.ble_advertisement_stop()
 		await self.ble_advertisement_update()
-		self._ble_advertise_stop_time = time.time() + max(10, timeout)
+		self._timers.start(self._ble_advertise_timer, max(10, timeout) * 1000)
 		if not self._ble_radio.advertising:
 			logger.debug("Starting BLE advertisement")
 			self._ble_radio.start_advertising(self._ble_advertisement, self._ble_advertisement_scan_response)
+		self.check_status()
 
 	async def ble_advertisement_stop(self):
+		self._timers.stop(self._ble_advertise_timer)
 		self._ble_advertisement_started = False
 		if self._ble_radio.advertising:
 			logger.debug("Stopping BLE advertisement")
@@ -262,6 +301,7 @@ class HIDDeviceManager:
 				self._ble_radio.stop_advertising()
 			except Exception as e:
 				print(e)
+		self.check_status()
 
 	def ble_is_connected(self):
 		return self._ble_radio.connected
@@ -278,6 +318,12 @@ class HIDDeviceManager:
 
 	## HID control API mirrored from interface wrapper
 
+	@async_no_fail
+	async def flush_reports(self):
+		# send the reports changed since the last flush, one per report type
+		# only meaningful when `coalesce_reports` is enabled
+		await self.current_interface.flush()
+
 	@async_no_fail
 	async def release_all(self):
 		await self.current_interface.release_all()
@@ -285,6 +331,9 @@ class HIDDeviceManager:
 	@async_no_fail
 	async def keyboard_press(self, *keycodes):
 		await self.current_interface.keyboard_press(*keycodes)
+		if self._led_checks == 0:
+			self._timers.start(self._led_check_timer, LED_CHECK_INTERVAL)
+		self._led_checks = LED_CHECK_COUNT
 
 	@async_no_fail
 	async def keyboard_release(self, *keycodes):
@@ -310,13 +359,114 @@ class HIDDeviceManager:
 	async def mouse_move(self, x=0, y=0, wheel=0):
 		await self.current_interface.mouse_move(x, y, wheel)
 
+	@async_no_fail
+	async def send_text(self, text):
+		# type `text`(ASCII), one report with the keys of a stroke pressed
+		# and one with them released, paced for the interface
+		# the keys and modifiers held are left out of these reports, or a
+		# held GUI would turn the text into shortcuts, and pressed again
+		# (the live report) when it ends or it's cancelled, the keys pressed
+		# meanwhile go out between the strokes
+		# stops if the interface changes meanwhile, see keyboard/hid/text.py
+		interface = self.current_interface
+		interval = self._text_report_interval.get(self._current_interface_name, 0) / 1000
+		strokes, skipped = compile_text(text, interface.nkro)
+		if skipped > 0:
+			logger.debug("%d character(s) not typed" % skipped)
+		try:
+			i = 0
+			while i < len(strokes):
+				count = strokes[i + 1]
+				await interface.keyboard_send_keys(strokes[i], strokes, i + 2, count)
+				await asyncio.sleep(interval)
+				await interface.keyboard_send_keys(0)
+				await asyncio.sleep(interval)
+				if self.current_interface is not interface:
+					# released when switching
+					logger.debug("Interface changed, text not finished")
+					return
+				i += 2 + count
+		finally:
+			# also when cancelled, see keyboard/macro_scheduler.py
+			await interface.keyboard_restore()
+
+	## keyboard LEDs and BLE state
+
+	def add_status_event(self, event):
+		# `event`(asyncio.Event) is set when the keyboard LEDs, the BLE
+		# advertising or the BLE ID change, the hardware waits on it
+		self._status_events.append(event)
+
+	def check_status(self):
+		led_status = self.current_interface.keyboard_led_status
+		advertising = self._ble_radio is not None \
+				and (self._ble_advertisement_started or self._ble_radio.advertising)
+		if led_status == self._last_led_status \
+			and advertising == self._last_ble_advertising \
+			and self._ble_id == self._last_ble_id:
+				return
+		self._last_led_status = led_status
+		self._last_ble_advertising = advertising
+		self._last_ble_id = self._ble_id
+		for event in self._status_events:
+			event.set()
+
+	async def _led_check(self):
+		# timer callback
+		self.check_status()
+		self._led_checks -= 1
+		if self._led_checks > 0:
+			self._timers.start(self._led_check_timer, LED_CHECK_INTERVAL)
+
 	## Misc
+	def register_switch_callback(self, func):
+		# `func()` is called after switching the interface or the BLE ID,
+		# the keyboard picks the profile then
+		self._switch_callback = func
+
 	def set_current_interface_name(self, value):
 		self._previous_interface_name = self._current_interface_name
 		self._current_interface_name = value
+		if self._switch_callback is not None:
+			self._switch_callback()
 	
 	def get_current_interface_name(self):
 		return self._current_interface_name
+
+	def set_latency_stamp(self, timestamp):
+		# reports sent from now on record their latency since `timestamp`(ms)
+		# -1 to stop, no-op if the latency histograms are disabled
+		if timestamp < 0:
+			# the interface may have changed since the stamp
+			for interface in self._interfaces.values():
+				interface.latency_stamp = -1
+			return
+		interface = self.current_interface
+		if interface.latency is not None:
+			interface.latency_stamp = timestamp
+
+	def latency_histogram(self, name = None):
+		# the latency histogram of the interface `name`("usb", "ble"),
+		# the current one if None, None if disabled or no such interface
+		if name is None:
+			return self.current_interface.latency
+		interface = self._interfaces.get(name, None)
+		return interface.latency if interface is not None else None
+
+	@property
+	def ble_id(self):
+		# current BLE ID, 0 to 9
+		return self._ble_id
+
+	@property
+	def latency_histograms(self):
+		# all enabled latency histograms
+		return [i.latency for i in self._interfaces.values() if i.latency is not None]
+
+	@property
+	def suppressed_reports(self):
+		# count of unchanged reports not sent, all interfaces
+		return sum(i.suppressed_reports for i in self._interfaces.values())
 		
 	@property
 	def keyboard_led_status(self):
@@ -2,6 +2,8 @@
 # vim: ts=4 noexpandtab
 import struct
 
+from ..clock import ms
+
 class DummyControl:
 	# The dummy one only implements a send_report and to avoid failure only
 	def send_report(self, *args, **kwargs):
@@ -39,6 +41,11 @@ def find_device_last_received_report(devices, usage_page, usage):
 			return device
 	return None
 
+PENDING_KEYBOARD = 1 << 0
+PENDING_MOUSE = 1 << 1
+PENDING_CONSUMER_CONTROL = 1 << 2
+
+
 class HIDInterfaceWrapper:
 	# read:
 	# https://docs.circuitpython.org/en/latest/shared-bindings/usb_hid/#usb_hid.Device
@@ -47,6 +54,8 @@ class HIDInterfaceWrapper:
     # suitable for 6KRO
 	# for bluetooth interface, the hid out and in use different objects
 
+	nkro = False
+
 	def __init__(self, devices):
 		self.devices = devices
 		self.keyboard = find_device(devices, usage_page=0x1, usage=0x06)
@@ -66,7 +75,49 @@ class HIDInterfaceWrapper:
 		self.report_mouse = bytearray(4)
 		#self.report_gamepad = None
 		self.last_received_report_keyboard = bytes(1)
+		self._init_last_reports()
+		self._init_coalescing()
+		self._init_latency()
+
+	def _init_last_reports(self):
+		# the last sent reports, identical reports are not sent again
+		self._last_report_keyboard = bytearray(len(self.report_keyboard))
+		self._last_report_consumer_control = bytearray(len(self.report_consumer_control))
+		self._last_report_mouse = bytearray(len(self.report_mouse))
+		# the keyboard report of a text stroke, see `keyboard_send_keys`
+		self._report_text = bytearray(len(self.report_keyboard))
+		self.suppressed_reports = 0
+		self.invalidate_last_reports()
+
+	def invalidate_last_reports(self):
+		# force the next report of each type to be sent
+		# e.g. the host may have changed
+		# bitmap of PENDING_* reports whose last sent copy is unknown, any
+		# byte value may appear in a real report
+		self._invalid_last_reports = PENDING_KEYBOARD | PENDING_MOUSE | PENDING_CONSUMER_CONTROL
+
+	def _init_coalescing(self):
+		# report coalescing, see `set_coalescing`
+		self._coalescing = False
+		self._pending = 0 # bitmap of PENDING_* reports not sent yet
+		# keycodes/buttons changed since the last flush
+		# a second change to any of them flushes first, so a tap
+		# that presses and releases in the same pass is never lost
+		self._batch_keys = bytearray(32)
+		self._batch_mouse = 0
+		self._batch_consumer_control = False
 	
+	def _init_latency(self):
+		# scan-to-report latency, see keyboard/latency.py
+		# while `latency_stamp` is set(>= 0), every report sent records the
+		# time elapsed since it
+		self.latency = None
+		self.latency_stamp = -1
+
+	def set_latency_histogram(self, histogram):
+		self.latency = histogram
+		self.latency_stamp = -1
+
 	def get_keyboard_led_status(self):
 		if hasattr(self.keyboard, "get_last_received_report"):
 			self.get_keyboard_led_status = self.get_keyboard_led_status_from_last_report_api
@@ -106,19 +157,108 @@ class HIDInterfaceWrapper:
 
 	## HID APIs ##
 
-	async def _send_keyboard(self):
-		self.keyboard.send_report(self.report_keyboard)
+	async def _send_keyboard(self, report = None):
+		if report is None:
+			report = self.report_keyboard
+		if not self._invalid_last_reports & PENDING_KEYBOARD \
+			and report == self._last_report_keyboard:
+				self.suppressed_reports += 1
+				return
+		self._invalid_last_reports &= ~PENDING_KEYBOARD
+		self._last_report_keyboard[:] = report
+		self.keyboard.send_report(report)
+		if self.latency_stamp >= 0:
+			self.latency.record((ms() - self.latency_stamp) & 0x7FFFFFFF)
 
 	async def _send_consumer_control(self):
-		self.consumer_control.send_report(self.report_consumer_control)
+		report = self.report_consumer_control
+		if not self._invalid_last_reports & PENDING_CONSUMER_CONTROL \
+			and report == self._last_report_consumer_control:
+				self.suppressed_reports += 1
+				return
+		self._invalid_last_reports &= ~PENDING_CONSUMER_CONTROL
+		self._last_report_consumer_control[:] = report
+		self.consumer_control.send_report(report)
+		if self.latency_stamp >= 0:
+			self.latency.record((ms() - self.latency_stamp) & 0x7FFFFFFF)
 
 	async def _send_mouse(self):
-		self.mouse.send_report(self.report_mouse)
+		report = self.report_mouse
+		# movement is relative, only a report without movement can be skipped
+		if not self._invalid_last_reports & PENDING_MOUSE \
+			and report == self._last_report_mouse \
+			and report[1] == 0 and report[2] == 0 and report[3] == 0:
+				self.suppressed_reports += 1
+				return
+		self._invalid_last_reports &= ~PENDING_MOUSE
+		self._last_report_mouse[:] = report
+		self.mouse.send_report(report)
+		if self.latency_stamp >= 0:
+			self.latency.record((ms() - self.latency_stamp) & 0x7FFFFFFF)
 
 	async def _send_gamepad(self):
 		raise NotImplemented
 
+	## report coalescing ##
+	# When enabled, changes only update the report buffers, and `flush`
+	# sends each changed report once. A keycode(or mouse button, consumer
+	# control) changed twice before a flush flushes the first change, so
+	# the host always sees a press before its release.
+
+	def set_coalescing(self, enabled):
+		# call `flush` after disabling it, if anything may be pending
+		self._coalescing = enabled
+
+	async def flush(self):
+		pending = self._pending
+		if pending == 0: # nothing changed since the last flush
+			return
+		self._pending = 0
+		if pending & PENDING_KEYBOARD:
+			await self._send_keyboard()
+		if pending & PENDING_MOUSE:
+			await self._send_mouse()
+		if pending & PENDING_CONSUMER_CONTROL:
+			await self._send_consumer_control()
+		self._batch_mouse = 0
+		self._batch_consumer_control = False
+		batch_keys = self._batch_keys
+		for i in range(32):
+			batch_keys[i] = 0
+
+	async def _batch_touch_keys(self, keycodes):
+		batch_keys = self._batch_keys
+		for keycode in keycodes:
+			if batch_keys[keycode >> 3] & (1 << (keycode & 0x7)):
+				await self.flush()
+				break
+		for keycode in keycodes:
+			batch_keys[keycode >> 3] |= 1 << (keycode & 0x7)
+
+	async def _commit_keyboard(self):
+		if self._coalescing:
+			self._pending |= PENDING_KEYBOARD
+		else:
+			await self._send_keyboard()
+
+	async def _commit_mouse(self, touched):
+		# touched: button bits, or 0x80 for movement
+		if self._coalescing:
+			self._batch_mouse |= touched
+			self._pending |= PENDING_MOUSE
+		else:
+			await self._send_mouse()
+
+	async def _commit_consumer_control(self):
+		if self._coalescing:
+			self._batch_consumer_control = True
+			self._pending |= PENDING_CONSUMER_CONTROL
+		else:
+			await self._send_consumer_control()
+
 	async def release_all(self):
+		# anything pending goes out first, then everything is released at once
+		await self.flush()
 		for i in range(len(self.report_keyboard)):
 			self.report_keyboard[i] = 0
 		for i in range(len(self.report_mouse)):
@@ -130,6 +270,8 @@ class HIDInterfaceWrapper:
 		await self._send_consumer_control()
 
 	async def keyboard_press(self, *keycodes):
+		if self._coalescing:
+			await self._batch_touch_keys(keycodes)
 		for keycode in keycodes:
 			if 0xE0 <= keycode < 0xE8: # modifiers
 				self.report_keyboard[0] |= 1 << (keycode & 0x7)
@@ -142,9 +284,11 @@ class HIDInterfaceWrapper:
 					if self.report_keys[i] == 0:
 						self.report_keys[i] = keycode
 						break
-		await self._send_keyboard()
+		await self._commit_keyboard()
 
 	async def keyboard_release(self, *keycodes):
+		if self._coalescing:
+			await self._batch_touch_keys(keycodes)
 		for keycode in keycodes:
 			if 0xE0 <= keycode < 0xE8: # modifiers
 				self.report_keyboard[0] &= ~(1 << (keycode & 0x7))
@@ -152,36 +296,69 @@ class HIDInterfaceWrapper:
 			for i in range(6):
 				if self.report_keys[i] == keycode:
 					self.report_keys[i] = 0
+		await self._commit_keyboard()
+
+	async def keyboard_send_keys(self, modifiers, keycodes = b"", start = 0, count = 0):
+		# send one report with only `modifiers` and `keycodes[start:start + count]`
+		# pressed, for typing text(keyboard/hid/text.py), the keys and
+		# modifiers held are left out, so they don't change the text
+		# the live report is left alone, `keyboard_restore` sends it again
+		await self.flush()
+		report = self._report_text
+		for i in range(len(report)):
+			report[i] = 0
+		report[0] = modifiers
+		self._fill_keys(report, keycodes, start, count)
+		await self._send_keyboard(report)
+
+	async def keyboard_restore(self):
+		# send the live report again, after `keyboard_send_keys`
+		await self.flush()
 		await self._send_keyboard()
 
+	def _fill_keys(self, report, keycodes, start, count):
+		for i in range(min(count, 6)):
+			report[2 + i] = keycodes[start + i]
+
 	async def consumer_control_press(self, keycode):
+		if self._coalescing and self._batch_consumer_control:
+			await self.flush()
 		struct.pack_into("<H", self.report_consumer_control, 0, keycode)
-		await self._send_consumer_control()
+		await self._commit_consumer_control()
 	
 	async def consumer_control_release(self, keycode = None):
 		await self.consumer_control_press(0)
 
 	async def mouse_press(self, buttons):
 		# buttons is a number
+		if self._coalescing and self._batch_mouse & buttons:
+			await self.flush()
 		self.report_mouse[0] |= buttons
-		await self._send_mouse()
+		await self._commit_mouse(buttons)
 
 	async def mouse_release(self, buttons):
 		# buttons is a number
+		if self._coalescing and self._batch_mouse & buttons:
+			await self.flush()
 		self.report_mouse[0] &= ~buttons
-		await self._send_mouse()
+		await self._commit_mouse(buttons)
 
 	async def mouse_move(self, x=0, y=0, wheel=0):
+		# movement is relative, never merge two of them
+		if self._coalescing and self._batch_mouse & 0x80:
+			await self.flush()
 		self.report_mouse[1] = x & 0xFF
 		self.report_mouse[2] = y & 0xFF
 		self.report_mouse[3] = wheel & 0xFF
-		await self._send_mouse()
+		await self._commit_mouse(0x80)
 
 
 class HIDInterfaceWrapperNKRO(HIDInterfaceWrapper):
 	# reference: https://learn.adafruit.com/custom-hid-devices-in-circuitpython/n-key-rollover-nkro-hid-device
 	# currently only keyboard is different so I inherit other from original implementation
 
+	nkro = True
+
 	def __init__(self, devices):
 		self.devices = devices
 		self.keyboard = find_device(devices, usage_page=0x1, usage=0x06)
@@ -195,24 +372,36 @@ class HIDInterfaceWrapperNKRO(HIDInterfaceWrapper):
 		self.report_consumer_control = bytearray(2)
 		self.report_mouse = bytearray(4)
 		self.last_received_report_keyboard = bytes(1)
+		self._init_last_reports()
+		self._init_coalescing()
+		self._init_latency()
 
 	async def keyboard_press(self, *keycodes):
+		if self._coalescing:
+			await self._batch_touch_keys(keycodes)
 		for keycode in keycodes:
 			if 0xE0 <= keycode < 0xE8: # modifiers
 				self.report_keyboard[0] |= 1 << (keycode & 0x7)
 				continue
 			else:
 				self.report_keys[keycode >> 3] |= 1 << (keycode & 0x7)
-		await self._send_keyboard()
+		await self._commit_keyboard()
 
 	async def keyboard_release(self, *keycodes):
+		if self._coalescing:
+			await self._batch_touch_keys(keycodes)
 		for keycode in keycodes:
 			if 0xE0 <= keycode < 0xE8: # modifiers
 				self.report_keyboard[0] &= ~(1 << (keycode & 0x7))
 				continue
 			else:
 				self.report_keys[keycode >> 3] &= ~(1 << (keycode & 0x7))
-		await self._send_keyboard()
+		await self._commit_keyboard()
+
+	def _fill_keys(self, report, keycodes, start, count):
+		for i in range(start, start + count):
+			keycode = keycodes[i]
+			report[1 + (keycode >> 3)] |= 1 << (keycode & 0x7)
 
 # a utility function
 def wrap_hid_interface(devices, nkro=False):
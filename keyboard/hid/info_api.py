@@ -38,6 +38,21 @@ class HIDInfo:
         # keyboard led raw data
         return self._manager.keyboard_led_status
 
+    def add_status_event(self, event):
+        # `event`(asyncio.Event) is set when the keyboard LEDs or the BLE
+        # state(advertising, ID) change
+        self._manager.add_status_event(event)
+
+    @property
+    def timers(self):
+        # the shared timer service, see keyboard/timers.py
+        return self._manager._timers
+
+    def latency_histogram(self, name = None):
+        # scan-to-report latency histogram(see keyboard/latency.py) of an
+        # interface("usb" or "ble", current if None), None if disabled
+        return self._manager.latency_histogram(name)
+
     def set_battery_level(self, value: int):
         if self._manager._ble_battery is not None:
             self._manager._ble_battery.level = int(max(0, min(100, value)))
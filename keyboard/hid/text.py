@@ -0,0 +1,46 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Text to keyboard reports, see `HIDDeviceManager.send_text`
+#
+# The text is turned into key strokes first, then sent as one report with
+# the keys pressed(the shift included) and one with them released, paced
+# per interface, BLE drops reports sent too fast.
+# On NKRO interfaces, following characters with the same modifiers go in one
+# report, as long as their keycodes ascend, since hosts read a bitmap in
+# keycode order. Characters without a keycode(non-ASCII, control) are
+# skipped.
+#
+# strokes: (modifiers(1 byte), key count(1 byte), keycodes), ...
+
+from ..action_code import ASCII_TO_KEYCODE
+
+# keys per stroke, the size of the 6KRO report
+TEXT_STROKE_MAX_KEYS = 6
+
+
+def compile_text(text, nkro = False):
+	# return (strokes, skipped characters)
+	strokes = bytearray()
+	skipped = 0
+	start = -1 # of the current stroke
+	for character in text:
+		code = ord(character)
+		code = ASCII_TO_KEYCODE[code] if code < len(ASCII_TO_KEYCODE) else 0
+		keycode = code & 0x7F
+		if keycode < 0x04: # none, or an error code
+			skipped += 1
+			continue
+		modifiers = 0x02 if code & 0x80 else 0 # left shift
+		if nkro and start >= 0 \
+			and strokes[start] == modifiers \
+			and strokes[start + 1] < TEXT_STROKE_MAX_KEYS \
+			and strokes[-1] < keycode:
+				strokes[start + 1] += 1
+				strokes.append(keycode)
+				continue
+		start = len(strokes)
+		strokes.append(modifiers)
+		strokes.append(1)
+		strokes.append(keycode)
+	return strokes, skipped
@@ -1,7 +1,6 @@
 # -*- encoding: utf-8 -*-
 # vim: ts=4 noexpandtab
 
-import time
 import array
 import struct
 import microcontroller
@@ -12,65 +11,214 @@ logger = logging.getLogger("Keyboard Core")
 logger.setLevel(logging.DEBUG)
 
 from .utils import async_no_fail, ms
+from . import clock
 from .action_code import *
 from .hid import HIDDeviceManager, HIDInfo
 from .macro_interface import MacroInterface
+from .macro_scheduler import MacroScheduler
+from .timers import Timers
+from .tap_timing import AdaptiveTapTiming
+from .storage import RecordLog, NVM_SIZE, NVM_HEATMAP, NVM_SETTINGS
+from .settings import Settings, SETTING_BLE_ID, SETTING_KEYMAP, SETTING_BACKLIGHT
+from .heatmap import HeatmapLog
+from .keymap_blob import compile_keymap
+from .combos import ComboEngine
+from .leader import LeaderTrie
+from .bigram import BigramStats
+from .trace import Tracer, TRACE_OFF, TRACE_TEXT
 import keyboard.hardware_spec_ids as hwspecs
 
+# how a pending tap key turns into `hold` when another key is used, see
+# `Keyboard._resolve_tap_key`
+TAP_HOLD_MODES = ("hold_on_other_key_press", "permissive_hold", "timeout")
+TAP_HOLD_ON_OTHER_KEY_PRESS = 0
+TAP_HOLD_PERMISSIVE = 1
+TAP_HOLD_TIMEOUT = 2
+# decisions
+TAP_HOLD_WAIT = 0
+TAP_HOLD_TAP = 1
+TAP_HOLD_HOLD = 2
+
 
 class Keyboard:
-	# TODO: add pair key
 	# TODO: add macro
 	
 	def __init__(self, *args,
 			  nkro_usb = False,
+			  coalesce_reports = False,
+			  latency_histogram = False,
 			  verbose = False,
 			  time_tap_thresh = 170,
 			  time_tap_delay = 80,
+			  tap_hold_mode = "hold_on_other_key_press",
+			  tap_hold_buffer_size = 32,
+			  adaptive_tap_timing = False,
+			  tap_thresh_range = (120, 250),
+			  tap_delay_range = (40, 120),
+			  persistent_heatmap = False,
+			  bigram_stats = False,
+			  persistent_settings = False,
+			  settings_flush_delay = 60000,
+			  combo_term = 50,
+			  leader_timeout = 1000,
+			  text_report_interval = None,
+			  macro_queue_size = 8,
+			  cancel_macro_on_release = False,
+			  effective_cache_size = 4,
+			  trace = None,
+			  trace_size = 128,
+			  mouse_interval = 10,
 			  **kwargs):
 		self.hardware = None
 		self.hardware_spec = 0
 		self.hid_manager = None
 		self.nkro_usb = nkro_usb
+		self.coalesce_reports = coalesce_reports
+		# scan-to-report latency histograms, see keyboard/latency.py
+		self.latency_histogram = latency_histogram
 		self.verbose = verbose
 		self._keymap = None
-		self._heatmap = None # TODO: load heatmap?
-		self._profiles = {}  # profile auto switching is not supported yet
+		self._heatmap = None # key press counters, array("L")
+		# stores the heatmap on nvm, see keyboard/heatmap.py
+		self.heatmap_log = None
+		self.persistent_heatmap = persistent_heatmap
+		# key transition counters, see keyboard/bigram.py
+		self.bigram = None
+		self.bigram_stats = bigram_stats
 		self._actionmap = None
-		self._actionmaps = None
+		# profiles, compiled actionmaps by BLE ID(0~9) or interface("usb",
+		# "ble"), see `register_profile`
+		self._actionmaps = {}
 		self._default_actionmap = None
 		self._layer_mask = 1
-		self._macro_handler = None
+		# flattened actionmap for the current layer mask, see `_get_action_code`
+		self._effective_actionmap = None
+		self._effective_mask = -1
+		self._effective_cache_size = effective_cache_size
+		self._effective_cache_masks = []
+		self._effective_cache_maps = []
+		# macros run in their own task, see keyboard/macro_scheduler.py
+		self.macros = MacroScheduler(macro_queue_size, cancel_macro_on_release)
+		# combos, see `register_combos`, None if there's none
+		self.combos = None
+		self._combos = ()
+		# registered while running, set up by `_main_routine`
+		self._combos_changed = False
+		self._next_combos = None
+		self._keys_down = 0 # physical keys held
+		self._combo_term = combo_term # ms
+		self._key_count = 0
+		# leader key sequences, see `register_leader_sequences`
+		self._leader_sequences = ()
+		self._leader_trie = None
+		self._leader_node = -1 # trie node while capturing keys
+		self._leader_key = 0
+		self._leader_timeout = leader_timeout # ms after each key
+		# ms between text reports by interface, see `HIDDeviceManager.send_text`
+		self._text_report_interval = text_report_interval
 		self._tap_thresh = time_tap_thresh # micro second
 		self._tap_delay = time_tap_delay # micro second
 		self._mouse_status = 0
 		self._mouse_time = 0
 		self._mouse_move = [0,0,0]
 		self._mouse_speed = 1
+		# ms between mouse updates while a mouse key is held
+		self._mouse_interval = mouse_interval
+		# deadlines shared with the HID manager and the hardware, the main
+		# loop sleeps until the next one, see keyboard/timers.py
+		self.timers = Timers()
+		self._tap_timer = self.timers.add()
+		self._mouse_timer = self.timers.add()
+		self._combo_timer = self.timers.add()
+		self._leader_timer = self.timers.add(self._leader_timed_out)
+		# BLE ID, keymap and backlight across resets, see keyboard/settings.py
+		# read now, so the saved keymap is known before `register_keymap`
+		log = None
+		nvm = getattr(microcontroller, "nvm", None)
+		if persistent_settings and nvm is not None and len(nvm) >= NVM_SIZE:
+			log = RecordLog(nvm, *NVM_SETTINGS)
+		self.settings = Settings(log)
+		self.settings.load()
+		self._settings_flush_delay = settings_flush_delay # ms after the last change
+		self._settings_timer = self.timers.add(self._flush_settings)
 		self.keys_last_action_code = None
 		self.keys_down_time = None
 		self.keys_up_time = None
+		# pending tap key, shared between the main loop and the action handlers
+		self._tap_key_last_id = 0
+		self._tap_key_variant = 0
+		self._tap_hold_mode = TAP_HOLD_MODES.index(tap_hold_mode)
+		# key events received while a tap key is pending, a ring buffer
+		# see `_process_pending_events`
+		self._pending_events = bytearray(tap_hold_buffer_size)
+		self._pending_times = [0] * tap_hold_buffer_size
+		self._pending_head = 0
+		self._pending_count = 0
+		# learns _tap_thresh and _tap_delay, see keyboard/tap_timing.py
+		self.tap_timing = None
+		if adaptive_tap_timing:
+			self.tap_timing = AdaptiveTapTiming(time_tap_thresh, time_tap_delay,
+					thresh_range = tap_thresh_range, delay_range = tap_delay_range)
+		self._last_press_time = -1
+		self._event_count = 0
+		# for auto suspend, see `_suspend_routine`
+		self._last_active_time = clock.monotonic()
+		self._suspend_time_limit = 10 * 60  # 10 min
+		# action handler tables, see `_build_action_handlers`
+		self._press_handlers = None
+		self._release_handlers = None
 
 		if not verbose:
 			logger.setLevel(logging.ERROR)
 		else:
 			logger.setLevel(logging.DEBUG)
 
+		# hot path logging, see keyboard/trace.py
+		# text tracing follows `verbose` unless a trace mode is given
+		if trace is None:
+			trace = TRACE_TEXT if verbose else TRACE_OFF
+		self.tracer = Tracer(logger, mode = trace, size = trace_size)
+
 	def initialize(self):
 		# check then setup basics
 		logger.debug("Initializing the hardware and hid_manager")
 		self._check_hardware_api(self.hardware)
 		params = self._generate_hid_manager_parameters_from_hardware_spec(self.hardware.hardware_spec)
-		self.hid_manager = HIDDeviceManager(nkro_usb = self.nkro_usb, verbose = self.verbose, *params)
+		ble_id = self.settings.get(SETTING_BLE_ID, b"\x01")[0]
+		self.hid_manager = HIDDeviceManager(nkro_usb = self.nkro_usb,
+				coalesce_reports = self.coalesce_reports,
+				latency_histogram = self.latency_histogram,
+				timers = self.timers,
+				ble_id = ble_id,
+				text_report_interval = self._text_report_interval,
+				verbose = self.verbose, *params)
+		self.hid_manager.register_switch_callback(self._select_profile)
+		self.macros.interface = MacroInterface(
+				keyboard_core = self,
+				hid_manager = self.hid_manager,
+				keyboard_hardware = self.hardware)
+		self._select_profile()
 		hid_info = HIDInfo(self.hid_manager)
 		self.hardware.register_hid_info(hid_info)
 		# initialize shared memory
 		logger.debug("Key count: %d" % self.hardware.key_count)
 		logger.debug("NKRO(USB): %s" % str(self.nkro_usb))
-		self._heatmap = [0] * self.hardware.key_count
-		self.keys_last_action_code = [0] * self.hardware.key_count
-		self.keys_down_time = [0] * self.hardware.key_count
-		self.keys_up_time = [0] * self.hardware.key_count
+		self._heatmap = array.array("L", [0] * self.hardware.key_count)
+		log = None
+		nvm = getattr(microcontroller, "nvm", None)
+		if self.persistent_heatmap and nvm is not None and len(nvm) >= NVM_SIZE:
+			log = RecordLog(nvm, *NVM_HEATMAP)
+		self.heatmap_log = HeatmapLog(self._heatmap, log)
+		self.heatmap_log.load()
+		if self.bigram_stats:
+			self.bigram = BigramStats(self.hardware.key_count)
+		self._key_count = self.hardware.key_count
+		self._setup_combos()
+		if self.tap_timing is not None and self.tap_timing.load():
+			self._tap_thresh = self.tap_timing.tap_thresh
+			self._tap_delay = self.tap_timing.tap_delay
+			logger.debug("Tap timing loaded: %s" % self.tap_timing)
+		self._restore_backlight()
 	
 	def _check_hardware_api(self, hardware):
 		assert hasattr(hardware, "get_all_tasks")
@@ -107,6 +255,13 @@ class Keyboard:
 		# do not include submodule tasks
 		tasks = list()
 		tasks.append(asyncio.create_task(self._main_routine()))
+		tasks.append(asyncio.create_task(self._suspend_routine()))
+		tasks.append(asyncio.create_task(self.macros.run()))
+		# wake the main loop at every deadline, if it sleeps between key
+		# events, otherwise it checks the timers on every pass
+		events_ready = getattr(self.hardware, "events_ready", None)
+		if events_ready is not None:
+			tasks.append(asyncio.create_task(self.timers.run(events_ready)))
 		return tasks
 
 	def register_hardware(self, keyboard_hardware):
@@ -114,46 +269,229 @@ class Keyboard:
 		self._check_hardware_api(hardware)
 		self.hardware = hardware
 
-	def register_keymap(self, keymap):
+	def register_keymap(self, keymap, name = None):
+		# `name` is saved, see `saved_keymap`
 		self._keymap = keymap
+		if name is not None:
+			self._store_setting(SETTING_KEYMAP, name.encode())
 		self._compile_keymap()
+		if self._press_handlers is None:
+			self._build_action_handlers()
 
 	def _compile_keymap(self):
-		convert = lambda a: array.array("H", (get_action_code(k) for k in a))
-		self._default_actionmap = tuple(convert(layer) for layer in self._keymap)
-		self._actionmap = self._default_actionmap
-		self._actionmaps = {}
-		#for key in self._profiles:
-		#	self.actionmaps[key] = tuple(
-		#		convert(layer) for layer in self.profiles[key]
-		#	)
+		# compiled layers(see keyboard/keymap_blob.py) are used as they are
+		self._default_actionmap = compile_keymap(self._keymap)
+		self._select_profile()
+
+	def register_profile(self, key, keymap):
+		# use `keymap` on the BLE ID `key`(0~9), or on the interface `key`
+		# ("usb" or "ble"), a BLE ID's profile wins over "ble"'s
+		# compiled now, switching is then only picking another actionmap
+		self._actionmaps[key] = compile_keymap(keymap)
+		if self._default_actionmap is not None:
+			self._select_profile()
+
+	def _select_profile(self):
+		# the profile of the current BLE ID or interface, the registered
+		# keymap if there's none, called by the HID manager after a switch
+		actionmap = self._default_actionmap
+		manager = self.hid_manager
+		if manager is not None and self._actionmaps:
+			name = manager.get_current_interface_name()
+			if name == "ble" and manager.ble_id in self._actionmaps:
+				actionmap = self._actionmaps[manager.ble_id]
+			elif name in self._actionmaps:
+				actionmap = self._actionmaps[name]
+		if actionmap is not self._actionmap:
+			self._actionmap = actionmap
+			self._flush_effective_actionmap_cache()
+			self._map_leader_keys()
+
+	@property
+	def saved_keymap(self):
+		# name of the keymap registered before the reset, None if unknown
+		name = self.settings.get(SETTING_KEYMAP)
+		return None if name is None else name.decode()
+
+	def register_leader_sequences(self, sequences):
+		# ((keys, action), ...), typed after the LEADER key, the keys as on
+		# the base layer of the keymap, see keyboard/leader.py
+		self._leader_sequences = tuple(sequences)
+		self._compile_leader_sequences()
+
+	def _compile_leader_sequences(self):
+		self._leader_node = -1
+		self._leader_trie = None
+		if self._leader_sequences:
+			self._leader_trie = LeaderTrie(self._leader_sequences)
+			self._map_leader_keys()
+
+	def _map_leader_keys(self):
+		# the sequences are matched by position, on the base layer of the
+		# actionmap in use, see `_select_profile`
+		if self._leader_trie is not None and self._actionmap is not None:
+			self._leader_node = -1
+			self._leader_trie.map_layer(self._actionmap[0])
+
+	def register_combos(self, combos):
+		# ((keymap positions, action), ...), keys pressed together within
+		# `combo_term` ms for another action, see keyboard/combos.py
+		# once initialized, they're used from the main loop's first pass
+		# without any key down, since the key state arrays are resized
+		self._combos = tuple(combos)
+		if self.keys_down_time is not None:
+			self._next_combos = self._make_combo_engine()
+			self._combos_changed = True
+
+	def _make_combo_engine(self):
+		if not self._combos:
+			return None
+		return ComboEngine(self._combos, self._key_count, term = self._combo_term)
+
+	def _setup_combos(self):
+		# combos are key events too, with ids from `key_count` up
+		key_count = self._key_count
+		if self._combos_changed:
+			self.combos = self._next_combos
+		else:
+			self.combos = self._make_combo_engine()
+		self._combos_changed = False
+		self._next_combos = None
+		size = key_count + len(self._combos)
+		self.keys_last_action_code = [0] * size
+		self.keys_down_time = [0] * size
+		self.keys_up_time = [0] * size
+
+	def _key_name(self, key_id):
+		if key_id >= self._key_count:
+			return "COMBO%d" % (key_id - self._key_count)
+		return self.hardware.key_name(key_id)
 
 	def register_macro_handler(self, func):
 		if callable(func):
-			self._macro_handler = func
+			self.macros.handler = func
+
+	def _flush_effective_actionmap_cache(self):
+		# must be called whenever self._actionmap changes
+		self._effective_actionmap = None
+		self._effective_mask = -1
+		self._effective_cache_masks.clear()
+		self._effective_cache_maps.clear()
+
+	def _update_effective_actionmap(self):
+		# Flatten the layers enabled by self._layer_mask into one array, so
+		# a key press is a single index lookup instead of a walk through
+		# every layer. Recently used masks are kept in a small LRU cache,
+		# so toggling a layer back and forth won't rebuild anything.
+		actionmap = self._actionmap
+		layer_count = len(actionmap)
+		# bits above the top layer do not affect the result
+		layer_mask = self._layer_mask & ((1 << layer_count) - 1)
+		self._effective_mask = self._layer_mask
+		masks = self._effective_cache_masks
+		maps = self._effective_cache_maps
+
+		if layer_mask in masks:
+			i = masks.index(layer_mask)
+			if i > 0: # move to front
+				masks.insert(0, masks.pop(i))
+				maps.insert(0, maps.pop(i))
+			self._effective_actionmap = maps[0]
+			return
+
+		if len(masks) >= self._effective_cache_size:
+			# reuse the least recently used array
+			masks.pop()
+			flat = maps.pop()
+		else:
+			flat = array.array("H", bytearray(2 * len(actionmap[0])))
+
+		layers = [actionmap[layer] for layer in range(layer_count - 1, -1, -1)
+				if (layer_mask >> layer) & 1]
+		for position in range(len(flat)):
+			for layer in layers:
+				code = layer[position]
+				if code != 1: # TRANSPARENT
+					break
+			else:
+				code = 0 # no action
+			flat[position] = code
+
+		masks.insert(0, layer_mask)
+		maps.insert(0, flat)
+		self._effective_actionmap = flat
 
 	def _get_action_code(self, position):
 		# the actual action code varies because of layer support
-		layer_mask = self._layer_mask
-		for layer in range(len(self._actionmap) - 1, -1, -1):
-			if (layer_mask >> layer) & 1:
-				code = self._actionmap[layer][position]
-				if code == 1:  # TRANSPARENT
-					continue
-				return code
-		return 0 # no action
+		# the flattened map is rebuilt only when the layer mask changes
+		if self._layer_mask != self._effective_mask:
+			self._update_effective_actionmap()
+		return self._effective_actionmap[position]
+
+	def _save_state(self):
+		# before a reset or suspending(which may reset), and when idle
+		self.heatmap_log.flush()
+		self.settings.flush()
+
+	def _store_setting(self, tag, value):
+		# written `settings_flush_delay` after the last change
+		if self.settings.set(tag, value):
+			self.timers.start(self._settings_timer, self._settings_flush_delay)
+
+	async def _flush_settings(self):
+		# timer callback
+		self.settings.flush()
+
+	def _restore_backlight(self):
+		backlight = getattr(self.hardware, "backlight", None)
+		state = self.settings.get(SETTING_BACKLIGHT)
+		if backlight is None or state is None or len(state) < 6:
+			return
+		backlight.hsv[0] = state[2]
+		backlight.hsv[1] = state[3]
+		backlight.hsv[2] = state[4]
+		backlight.set_mode(state[1])
+		backlight.val = state[5]
+		if not state[0] and backlight.enabled:
+			backlight.toggle()
+
+	def _store_backlight(self):
+		backlight = self.hardware.backlight
+		hue, sat, val = backlight.hsv
+		self._store_setting(SETTING_BACKLIGHT, (1 if backlight.enabled else 0,
+				backlight.mode, hue, sat, val, backlight.val))
 
 	async def _handle_action_command(self, action_code):
 		if action_code == BOOTLOADER:
+			self._save_state()
 			microcontroller.on_next_reset(microcontroller.RunMode.BOOTLOADER)
 			microcontroller.reset() # normally the first line will be enough
 		elif action_code == SUSPEND:
+			self._save_state()
 			await self.hardware.suspend()
 		elif action_code == SHUTDOWN:
+			self._save_state()
 			microcontroller.reset()
 		elif action_code == HEATMAP:
-			# TODO: write to a external binary file
-			print(self._heatmap)
+			self.heatmap_log.flush()
+			print(list(self._heatmap))
+		elif action_code == BIGRAM:
+			if self.bigram is None:
+				print("Bigram stats disabled")
+			else:
+				self.bigram.save()
+		elif action_code == LATENCY:
+			histograms = self.hid_manager.latency_histograms
+			if not histograms:
+				print("Latency histogram disabled")
+			for histogram in histograms:
+				print(histogram)
+		elif action_code == TAP_TIMING:
+			if self.tap_timing is None:
+				print("Adaptive tap timing disabled")
+			else:
+				print(self.tap_timing)
+				self.tap_timing.save()
 		elif action_code == USB_TOGGLE:
 			await self.hid_manager.switch_to_usb()
 		elif action_code == BT_TOGGLE:
@@ -162,17 +500,13 @@ class Keyboard:
 			i = action_code - BT(0)
 			logger.info("Manager: Switch to BT {}".format(i))
 			await self.hid_manager.ble_switch_to(i)
+			self._store_setting(SETTING_BLE_ID, (self.hid_manager.ble_id,))
 
-	@async_no_fail
-	async def _handle_action_macro(self, action_code, press):
-		if self._macro_handler is None:
+	def _handle_action_macro(self, key_id, action_code, press):
+		# queued, the handler runs in the macro task
+		if self.macros.handler is None:
 			return
-		macro_interface = MacroInterface(
-				keyboard_core = self,
-				hid_manager = self.hid_manager,
-				keyboard_hardware = self.hardware)
-		i = action_code & 0xFFF
-		await self._macro_handler(macro_interface, i, press)
+		self.macros.put(key_id, action_code & 0xFFF, press)
 
 	async def _handle_action_layer_press(self, action_code):
 		# op<<10|on<<8|part<<5|(bits&0x1f)
@@ -218,11 +552,181 @@ class Keyboard:
 			self._layer_mask |= 1 << param
 
 	async def _trigger_tapkey_action_tap(self, key_id, key_variant):
+		# the key is released as a plain key afterwards
 		action_code = self.keys_last_action_code[key_id]
 		keycode = action_code & 0xFF
+		if key_variant >= ACT_LAYER_TAP and keycode == OP_TAP_TOGGLE:
+			layer_mask = 1 << ((action_code >> 8) & 0x1F)
+			if self.tracer.text:
+				self.tracer.info("Toggle layer %d", (action_code >> 8) & 0x1F)
+			self._layer_mask ^= layer_mask
+			self.keys_last_action_code[key_id] = 0 # nothing to release
+			return
 		self.keys_last_action_code[key_id] = keycode
 		await self.hid_manager.keyboard_press(keycode)
 
+	def _resolve_tap_key(self, now):
+		# decide the pending tap key from the events received since its press
+		# returns TAP_HOLD_WAIT, TAP_HOLD_TAP or TAP_HOLD_HOLD
+		#  press    delay     thresh
+		#  |        ^         ^
+		#  v   1    |    2    |    3
+		# ----------+---------+---------> t
+		# 1, 2: the tap key released: `tap`
+		#    another key pressed and released: `hold` if TAP_HOLD_PERMISSIVE
+		# 1: another key pressed: `tap` if TAP_HOLD_ON_OTHER_KEY_PRESS
+		# 2: another key pressed: `hold` if TAP_HOLD_ON_OTHER_KEY_PRESS
+		# 3: `hold`
+		# the other modes leave fast rolls to the release order, so two tap
+		# keys pressed together can both be held
+		key_id = self._tap_key_last_id
+		down_time = self.keys_down_time[key_id]
+		tap_thresh = self._tap_thresh
+		mode = self._tap_hold_mode
+		events = self._pending_events
+		times = self._pending_times
+		capacity = len(events)
+		head = self._pending_head
+		count = self._pending_count
+		for i in range(count):
+			j = (head + i) % capacity
+			event = events[j]
+			duration = (times[j] - down_time) & 0x7FFFFFFF
+			if duration > tap_thresh:
+				# held long enough before this event
+				return TAP_HOLD_HOLD
+			other_id = event & 0x7F
+			if event & 0x80 == 0:
+				if mode == TAP_HOLD_ON_OTHER_KEY_PRESS:
+					if duration < self._tap_delay: # quick typing
+						return TAP_HOLD_TAP
+					return TAP_HOLD_HOLD
+			elif other_id == key_id:
+				tap_timing = self.tap_timing
+				if tap_timing is not None and tap_timing.record_tap(duration):
+					self._tap_thresh = tap_timing.tap_thresh
+					self._tap_delay = tap_timing.tap_delay
+				return TAP_HOLD_TAP
+			elif mode == TAP_HOLD_PERMISSIVE:
+				# only keys pressed after the tap key count
+				for k in range(i):
+					if events[(head + k) % capacity] == other_id:
+						return TAP_HOLD_HOLD
+		if count >= capacity:
+			# no room to wait any longer
+			return TAP_HOLD_HOLD
+		if (now - down_time) & 0x7FFFFFFF > tap_thresh:
+			return TAP_HOLD_HOLD
+		return TAP_HOLD_WAIT
+
+	async def _process_combo_events(self, now):
+		# move the events out of the combo engine into the tap-hold buffer
+		combos = self.combos
+		capacity = len(self._pending_events)
+		for i in range(combos.out_count):
+			if self._pending_count >= capacity:
+				await self._process_pending_events(now)
+			self._push_pending_event(combos.out_events[i], combos.out_times[i])
+		combos.out_count = 0
+		await self._process_pending_events(now)
+		# wake up when the held back keys time out
+		if combos.held > 0 and not self.timers.pending(self._combo_timer):
+			self.timers.start_at(self._combo_timer, combos.deadline)
+
+	def _push_pending_event(self, event, timestamp):
+		# the caller makes sure there's room, see `_process_pending_events`
+		events = self._pending_events
+		i = (self._pending_head + self._pending_count) % len(events)
+		events[i] = event
+		self._pending_times[i] = timestamp
+		self._pending_count += 1
+
+	async def _process_pending_events(self, now):
+		# run the buffered key events in order, stop at a tap key that has
+		# to wait for its decision
+		# every tap key is resolved on its own, when it's the oldest event
+		events = self._pending_events
+		times = self._pending_times
+		capacity = len(events)
+		keys_last_action_code = self.keys_last_action_code
+		key_count = self._key_count
+		tracer = self.tracer
+		while True:
+			if self._tap_key_variant > 0:
+				decision = self._resolve_tap_key(now)
+				if decision == TAP_HOLD_WAIT:
+					return
+				key_id = self._tap_key_last_id
+				key_variant = self._tap_key_variant
+				self._tap_key_variant = 0
+				if decision == TAP_HOLD_HOLD:
+					if tracer.text:
+						tracer.debug("TAP/hold/%d", key_id)
+					await self._trigger_tapkey_action_hold(key_id, key_variant)
+				else:
+					if tracer.text:
+						tracer.debug("TAP/tap/%d", key_id)
+					await self._trigger_tapkey_action_tap(key_id, key_variant)
+
+			if self._pending_count == 0:
+				return
+			head = self._pending_head
+			event = events[head]
+			timestamp = times[head]
+			self._pending_head = (head + 1) % capacity
+			self._pending_count -= 1
+
+			# the key_id is the relative ID in the keymap
+			key_id = event & 0x7F
+			if event & 0x80 == 0: # press
+				self.keys_down_time[key_id] = timestamp
+				if key_id < key_count:
+					self._heatmap[key_id] += 1
+					if self.tap_timing is not None:
+						if self._last_press_time >= 0:
+							self.tap_timing.record_interval((timestamp - self._last_press_time) & 0x7FFFFFFF)
+						self._last_press_time = timestamp
+					if self.bigram is not None:
+						self.bigram.record(key_id)
+
+					# get action, tap keys change the layer mask only once resolved
+					action_code = self._get_action_code(key_id)
+				else: # a combo
+					action_code = self.combos.actions[key_id - key_count]
+				if self._leader_node >= 0:
+					# typed after the LEADER key, released as a LEADER key, which
+					# does nothing
+					keys_last_action_code[key_id] = LEADER
+					await self._leader_step(key_id)
+					continue
+				keys_last_action_code[key_id] = action_code
+				key_variant = action_code >> 12
+
+				# log info
+				if tracer.text:
+					tracer.info("Key {} {:10} \\ {:0>4b} {}".format(
+						key_id, self._key_name(key_id), key_variant, hex(action_code)
+					))
+				if tracer.binary:
+					tracer.record(timestamp, event, action_code)
+
+				await self._press_handlers[key_variant](key_id, action_code)
+
+			else: # release
+				self.keys_up_time[key_id] = timestamp
+				action_code = keys_last_action_code[key_id]
+				key_variant = action_code >> 12
+
+				if tracer.text:
+					tracer.info("Key {} {:10} / {:0>4b} {}, {}ms".format(
+						key_id, self._key_name(key_id), key_variant, hex(action_code),
+						self.keys_up_time[key_id] - self.keys_down_time[key_id],
+					))
+				if tracer.binary:
+					tracer.record(timestamp, event, action_code)
+
+				await self._release_handlers[key_variant](key_id, action_code)
+
 	@async_no_fail
 	async def _handle_action_backlight(self, action_code):
 		backlight = self.hardware.backlight
@@ -242,17 +746,38 @@ class Keyboard:
 			backlight.val += 8
 		elif action_code == VAL_RGB:
 			backlight.val -= 8
+		self._store_backlight()
+		# a dynamic mode starts on the hardware's timers
+		backlight_ready = getattr(self.hardware, "backlight_ready", None)
+		if backlight_ready is not None:
+			backlight_ready.set()
+
+	async def _suspend_routine(self):
+		# auto suspend, like a watch dog
+		# the main loop updates _last_active_time on every key event
+		suspend_time_limit = self._suspend_time_limit
+		while True:
+			idle_time = clock.monotonic() - self._last_active_time
+			if idle_time > suspend_time_limit:
+				logger.info("Auto suspend the keyboard")
+				self._save_state()
+				await self.hardware.suspend()
+				# set _last_active_time in case suspend is a dummy function
+				self._last_active_time = clock.monotonic()
+			else:
+				await asyncio.sleep(suspend_time_limit - idle_time + 0.001)
 
 	async def _update_mouse_movement(self):
 		if self._mouse_status <= 0:
 			return
 		x, y, wheel = self._mouse_move
-		current_time = time.monotonic_ns()
+		current_time = clock.monotonic_ns()
 		dt = current_time - self._mouse_time
 		distance = max(1, dt * self._mouse_speed // 40000000)
 		self._mouse_time = current_time
 		await self.hid_manager.mouse_move(x * distance, y * distance, wheel)
-		logger.debug('dt %f, distance %d' % (dt, distance))
+		if self.tracer.text:
+			self.tracer.debug('dt %f, distance %d', dt, distance)
 		# TODO: better acceleration curve
 		if self._mouse_speed < 50:
 			self._mouse_speed += 1
@@ -269,7 +794,9 @@ class Keyboard:
 			self._mouse_move[0] += m[0]
 			self._mouse_move[1] += m[1]
 			self._mouse_move[2] += m[2]
-			self._mouse_time = time.monotonic_ns()
+			self._mouse_time = clock.monotonic_ns()
+			# move on the next pass
+			self.timers.start(self._mouse_timer, 0)
 
 	async def _handle_action_mouse_release(self, action_code):
 		mouse_code = (action_code >> 8) & 0xF
@@ -285,253 +812,285 @@ class Keyboard:
 			self._mouse_move[2] -= m[2]
 			if self._mouse_status == 0:
 				self._mouse_speed = 1
+				self.timers.stop(self._mouse_timer)
 				await self.hid_manager.mouse_move() # reset mouse movement
 
+	## action dispatch
+	# handlers are indexed by the action kind, which is `action_code >> 12`
+	# every handler has the same signature: (key_id, action_code)
+
+	def _build_action_handlers(self):
+		press = [self._handle_action_none] * 16
+		release = [self._handle_action_none] * 16
+		press[ACT_MODS] = press[ACT_MODS + 1] = self._handle_action_mods_press
+		release[ACT_MODS] = release[ACT_MODS + 1] = self._handle_action_mods_release
+		press[ACT_MODS_TAP] = press[ACT_MODS_TAP + 1] = self._handle_action_mods_tap_press
+		release[ACT_MODS_TAP] = release[ACT_MODS_TAP + 1] = self._handle_action_mods_tap_release
+		press[ACT_USAGE] = self._handle_action_usage_press
+		release[ACT_USAGE] = self._handle_action_usage_release
+		press[ACT_MOUSEKEY] = self._handle_action_mousekey_press
+		release[ACT_MOUSEKEY] = self._handle_action_mousekey_release
+		press[ACT_LAYER] = self._handle_action_layer_key_press
+		release[ACT_LAYER] = self._handle_action_layer_key_release
+		press[ACT_LAYER_TAP] = press[ACT_LAYER_TAP_EXT] = self._handle_action_layer_tap_press
+		release[ACT_LAYER_TAP] = release[ACT_LAYER_TAP_EXT] = self._handle_action_layer_tap_release
+		press[ACT_MACRO] = self._handle_action_macro_press
+		press[ACT_LEADER] = self._handle_action_leader_press
+		release[ACT_MACRO] = self._handle_action_macro_release
+		press[ACT_BACKLIGHT] = self._handle_action_backlight_press
+		press[ACT_COMMAND] = self._handle_action_command_press
+		self._press_handlers = tuple(press)
+		self._release_handlers = tuple(release)
+
+	async def _handle_action_none(self, key_id, action_code):
+		pass
+
+	async def _handle_action_mods_press(self, key_id, action_code):
+		if action_code < 0xFF:
+			# plain key
+			await self.hid_manager.keyboard_press(action_code)
+		else:
+			# MODS_KEY, one key for multiple modifiers and one other key
+			mods = (action_code >> 8) & 0x1F
+			keycodes = mods_to_keycodes(mods)
+			keycodes.append(action_code & 0xFF)
+			await self.hid_manager.keyboard_press(*keycodes)
+
+	async def _handle_action_mods_release(self, key_id, action_code):
+		if action_code < 0xFF:
+			await self.hid_manager.keyboard_release(action_code)
+		else:
+			# MODS_KEY, one key for multiple modifiers and one other key
+			mods = (action_code >> 8) & 0x1F
+			keycodes = mods_to_keycodes(mods)
+			keycodes.append(action_code & 0xFF)
+			await self.hid_manager.keyboard_release(*keycodes)
+
+	def _start_tap_timer(self, key_id):
+		# wake the main loop right when the pending tap key becomes `hold`
+		# the timer is not stopped if the key is resolved earlier, waking up
+		# for nothing once is cheaper
+		self.timers.start_at(self._tap_timer, self.keys_down_time[key_id] + self._tap_thresh + 1)
+
+	async def _handle_action_mods_tap_press(self, key_id, action_code):
+		# MODS_TAP, hold for modifiers, tap for other key
+		# wait for the decision, see `_resolve_tap_key`
+		if self.tracer.text:
+			self.tracer.debug("TAP/wait/%d", key_id)
+		self._tap_key_last_id = key_id
+		self._tap_key_variant = action_code >> 12
+		self._start_tap_timer(key_id)
+
+	async def _handle_action_mods_tap_release(self, key_id, action_code):
+		# only reached if held, a tapped key is released as a plain key
+		keycodes = mods_to_keycodes(( action_code >> 8 ) & 0x1F)
+		await self.hid_manager.keyboard_release(*keycodes)
+
+	async def _handle_action_usage_press(self, key_id, action_code):
+		# Consumer control, media keys
+		if action_code & 0x400 > 0:
+			await self.hid_manager.consumer_control_press(action_code & 0x3FF)
+
+	async def _handle_action_usage_release(self, key_id, action_code):
+		if action_code & 0x400 > 0:
+			await self.hid_manager.consumer_control_release(0)
+
+	async def _handle_action_mousekey_press(self, key_id, action_code):
+		await self._handle_action_mouse_press(action_code)
+
+	async def _handle_action_mousekey_release(self, key_id, action_code):
+		await self._handle_action_mouse_release(action_code)
+
+	async def _handle_action_layer_key_press(self, key_id, action_code):
+		await self._handle_action_layer_press(action_code)
+
+	async def _handle_action_layer_key_release(self, key_id, action_code):
+		await self._handle_action_layer_release(action_code)
+
+	async def _handle_action_layer_tap_press(self, key_id, action_code):
+		if action_code & 0xE0 == 0xC0: # press modifiers and switch layer
+			if self.tracer.text:
+				self.tracer.debug("LAYER_MODS")
+			keycodes = mods_to_keycodes(action_code & 0x1F)
+			await self.hid_manager.keyboard_press(*keycodes)
+			layer_mask = 1 << ((action_code >> 8) & 0x1F)
+			self._layer_mask |= layer_mask
+		else: # TAP key, change layer(hold) or other(tap)
+			if self.tracer.text:
+				self.tracer.debug("TAP-L/wait/%d", key_id)
+			self._tap_key_last_id = key_id
+			self._tap_key_variant = action_code >> 12
+			self._start_tap_timer(key_id)
+
+	async def _handle_action_layer_tap_release(self, key_id, action_code):
+		# only reached if held(or LAYER_MODS), a tapped key is released as a
+		# plain key
+		keycode = action_code & 0xFF
+		layer_mask = 1 << ((action_code >> 8) & 0x1F)
+		if keycode & 0xE0 == 0xC0:
+			if self.tracer.text:
+				self.tracer.debug("LAYER_MODS")
+			keycodes = mods_to_keycodes(keycode & 0x1F)
+			await self.hid_manager.keyboard_release(*keycodes)
+		self._layer_mask &= ~layer_mask
+		if self.tracer.text:
+			self.tracer.debug("layer_mask %x", layer_mask)
+
+	async def _handle_action_macro_press(self, key_id, action_code):
+		self._handle_action_macro(key_id, action_code, True)
+
+	async def _handle_action_macro_release(self, key_id, action_code):
+		self._handle_action_macro(key_id, action_code, False)
+
+	async def _handle_action_leader_press(self, key_id, action_code):
+		# capture the next keys, see `_leader_step`
+		if self._leader_trie is None:
+			return
+		self._leader_node = 0
+		self._leader_key = key_id
+		self.timers.start(self._leader_timer, self._leader_timeout)
+
+	async def _leader_step(self, key_id):
+		trie = self._leader_trie
+		node = trie.step(self._leader_node, key_id)
+		if node == 0: # no such sequence
+			if self.tracer.text:
+				self.tracer.debug("LEADER/none")
+			self._leader_node = -1
+			self.timers.stop(self._leader_timer)
+		elif trie.branches[node]: # a longer sequence may follow
+			self._leader_node = node
+			self.timers.start(self._leader_timer, self._leader_timeout)
+		else:
+			await self._leader_fire(node)
+
+	async def _leader_timed_out(self):
+		# timer callback
+		if self._leader_node >= 0:
+			await self._leader_fire(self._leader_node)
+
+	async def _leader_fire(self, node):
+		# press and release the action of the sequence ending at `node`
+		self._leader_node = -1
+		self.timers.stop(self._leader_timer)
+		action_code = self._leader_trie.actions[node]
+		if self.tracer.text:
+			self.tracer.debug("LEADER/%d %s", node, hex(action_code))
+		if action_code == 0:
+			return
+		key_id = self._leader_key
+		await self._press_handlers[action_code >> 12](key_id, action_code)
+		await self._release_handlers[action_code >> 12](key_id, action_code)
+
+	async def _handle_action_backlight_press(self, key_id, action_code):
+		await self._handle_action_backlight(action_code)
+
+	async def _handle_action_command_press(self, key_id, action_code):
+		await self._handle_action_command(action_code)
+
 	async def _main_routine(self):
-		# there's some circuitpython limit that prevents too many long function calls
-		# so I have to write everything in one loop
-		keys_last_action_code = self.keys_last_action_code
-		keys_down_time = self.keys_down_time
-		keys_up_time = self.keys_up_time
-		hid_manager = self.hid_manager
+		# the actions themselves are dispatched through the handler tables
 		input_hardware = self.hardware
-		event_count = 0
-
-		# to identify tap keys, need to process separately
-		# Store tap keys before triggering them
-		# Trigger them before new key's arrival
-		# Since every tap key is triggered before any new key's down event processed,
-		# there will be only one tap key to process
-		# Normal Typing 1 - A is a tap-key
+		hid_manager = self.hid_manager
+		tracer = self.tracer
+		latency_histogram = self.latency_histogram
+		if self._press_handlers is None:
+			self._build_action_handlers()
+
+		# to identify tap keys, every key event goes through a buffer
+		# a tap key(MODS_TAP, LAYER_TAP) waits there until it's decided to be
+		# `tap` or `hold`, see `_resolve_tap_key`, the events after it wait
+		# with it, then run in order with the right modifiers and layers
+		# Rolling - A is a tap-key
 		#   A↓      B↓      A↑      B↑
 		# --+-------+-------+-------+------> t
-		#           |       |
-		#           V
-		#           Trigger A(HOLD) here
-		# Normal Typing 2 - A is a tap-key
+		#                   |
+		#                   V
+		#                   A(TAP) B↓ A↑ here, if permissive hold
+		# Holding - A is a tap-key
+		#   A↓      B↓      B↑      A↑
+		# --+-------+-------+-------+------> t
+		#                   |
+		#                   V
+		#                   A(HOLD) B↓ B↑ here, if permissive hold
+		# Holding alone - A is a tap-key
 		#   A↓              A↑
 		# --+-------+-------+--------------> t
-		#      dt1  |       |
+		#      dt1  |
 		#           V
 		#           Trigger A(HOLD) here, dt1 > tap_thresh
-		tap_thresh = self._tap_thresh
-		tap_key_last_id = 0
-		tap_key_variant = 0 # also a marker whether tapkey is processed
-		# to improve fast typing, use tap_delay to find out if the key is a tap in a sequence
-		# Fast Typing - B is a tap-key
-		#   A↓      B↓      A↑      B↑
-		# --+-------+-------+-------+------> t
-		#           |  dt1  |
-		#         dt1 < tap_delay
-		tap_delay = self._tap_delay
-		# to further impove fast typing, add another check
-		# Fast Typing - B is a tap-key
-		#   B↓      C↓      B↑      C↑
-		# --+-------+-------+-------+------> t
-		#   |  dt1  |  dt2  |
-		# dt1 < tap_delay && dt2 < fast_type_thresh
-		# comparing dt2 and fast_type_thresh is not implemented
-		# then it becomes:
-		#  press    delay     thresh
-		#  |        ^         ^
-		#  v   1    |    2    |    3
-		# ----------+---------+---------> t
-		# 1: any key action will trigger `tap`
-		# 2: any `pressed` action will trigger `hold`, any `release` action will trigger `tap`
-		# 3: `hold` is triggered
-
+		# the pending tap key is stored in
+		# self._tap_key_last_id and self._tap_key_variant
+		# self._tap_key_variant is also a marker whether tapkey is processed
+		pending_capacity = len(self._pending_events)
 
-		# for auto suspend, like a watch dog
-		last_active_time = time.monotonic()
-		suspend_time_limit = 10 * 60  # 10 min
+		# if the hardware signals its key events, sleep until it does, or
+		# until the next deadline(tap key, mouse key, ...), `timers.run` sets
+		# the same event, see keyboard/timers.py
+		# otherwise poll it on every pass
+		# auto suspend is checked by `_suspend_routine`
+		events_ready = getattr(input_hardware, "events_ready", None)
+		timers = self.timers
+		mouse_timer = self._mouse_timer
+		mouse_interval = self._mouse_interval
+		self._last_active_time = clock.monotonic()
 
 		# report loop
 		while True:
-			if time.monotonic() - last_active_time > suspend_time_limit:
-				logger.info("Auto suspend the keyboard")
-				await input_hardware.suspend()
-				# set last_active_time in case suspend is a dummy function
-				last_active_time = time.monotonic()
-
-			# switch task, give some time to the scanner
-			await asyncio.sleep(0)
+			if events_ready is None or events_ready.is_set():
+				# switch task, give some time to the scanner
+				await asyncio.sleep(0)
+			else:
+				await events_ready.wait()
+			if events_ready is not None:
+				events_ready.clear()
 
-			event_count = await input_hardware.get_keys()
+			self._event_count = await input_hardware.get_keys()
 			trigger_time = ms()
+			if latency_histogram and self._event_count > 0:
+				hid_manager.set_latency_stamp(trigger_time)
 
-			
-			# check tapkey before any action
-			# hold: 12~8: 5bits, modifiers or layer
-			# tap: 7~0: 8bit, anykey
-			if tap_key_variant > 0:
-				duration = trigger_time - keys_down_time[tap_key_last_id]
-				if duration > tap_thresh: # hold time long enough
-					logger.debug("TAP/L/hold/timeout")
-					await self._trigger_tapkey_action_hold(tap_key_last_id, tap_key_variant)
-					tap_key_variant = 0
+			# run the expired timers' callbacks
+			await timers.dispatch(trigger_time)
 
-			# update mouse movements
-			await self._update_mouse_movement()
+			# combos go first, then the tap keys, see keyboard/combos.py
+			# registered meanwhile, set up once every key is up
+			if self._combos_changed and self._keys_down == 0 and self._pending_count == 0:
+				self._setup_combos()
+			combos = self.combos
+
+			# let held back combo keys go on if timed out
+			if combos is not None and combos.held > 0:
+				combos.check(trigger_time)
+				await self._process_combo_events(trigger_time)
+
+			# check tapkey before any new event, hold if timed out
+			if self._tap_key_variant > 0:
+				await self._process_pending_events(trigger_time)
+
+			# update mouse movements, every mouse_interval
+			if self._mouse_status > 0 and not timers.pending(mouse_timer):
+				await self._update_mouse_movement()
+				timers.start(mouse_timer, mouse_interval)
 
 			# process events
 			# Note: iter the input_hardware will also consume the events
 			for event in input_hardware:
-				# the key_id is the relative ID in the keymap
-				key_id = event & 0x7F
-				press = (event & 0x80) == 0
-				logger.debug("Event: %d | %d" % (key_id, press))
-				last_active_time = time.monotonic()
-
-				if press:
-					keys_down_time[key_id] = trigger_time
-					self._heatmap[key_id] += 1
-
-					# trigger tapkey `hold` action when key down events detected
-					# This will alter self._layer_mask thus affect action_code
-					if tap_key_variant > 0:
-						if duration < tap_delay: # quick typing
-							# TODO: better checking
-							logger.debug("TAP/L/tap/sequence")
-							await self._trigger_tapkey_action_tap(tap_key_last_id, tap_key_variant)
-							tap_key_variant = 0
-						else:
-							logger.debug("TAP/L/hold/newpress")
-							await self._trigger_tapkey_action_hold(tap_key_last_id, tap_key_variant)
-							tap_key_variant = 0
-
-					# get action
-					action_code = self._get_action_code(key_id)
-					keys_last_action_code[key_id] = action_code
-					key_variant = action_code >> 12
-
-					# log info
-					logger.info(
-							"Key {} {:10} \\ {:0>4b} {}".format(
-							key_id, self.hardware.key_name(key_id), key_variant, hex(action_code)
-						))
-
-					# start parsing key info
-					if action_code < 0xFF:
-						# plain key
-						await hid_manager.keyboard_press(action_code)
-					elif key_variant < ACT_MODS_TAP:
-						# MODS_KEY, one key for multiple modifiers and one other key
-						mods = (action_code >> 8) & 0x1F
-						keycodes = mods_to_keycodes(mods)
-						keycodes.append(action_code & 0xFF)
-						await hid_manager.keyboard_press(*keycodes)
-					elif key_variant < ACT_USAGE:
-						# MODS_TAP, hold for modifiers, tap for other key
-						if event_count != 1:
-							# trigger tap directly
-							logger.debug("TAP/tap/multiple")
-							keycode = action_code & 0xFF
-							keys_last_action_code[key_id] = keycode
-							await hid_manager.keyboard_press(keycode)
-						else:
-							# handle it the other way, with a state
-							logger.debug("TAP/wait/%d" % key_id)
-							tap_key_last_id = key_id
-							tap_key_variant = key_variant
-					elif key_variant == ACT_USAGE:
-						# Consumer control, media keys
-						if action_code & 0x400 > 0:
-							await hid_manager.consumer_control_press(action_code & 0x3FF)
-					elif key_variant == ACT_MOUSEKEY:
-						await self._handle_action_mouse_press(action_code)
-					elif key_variant == ACT_LAYER:
-						await self._handle_action_layer_press(action_code)
-					elif key_variant == ACT_LAYER_TAP or key_variant == ACT_LAYER_TAP_EXT:
-						if action_code & 0xE0 == 0xC0: # press modifiers and switch layer
-							logger.debug("LAYER_MODS")
-							keycodes = mods_to_keycodes(action_code & 0x1F)
-							await hid_manager.keyboard_press(*keycodes)
-							layer_mask = 1 << ((action_code >> 8) & 0x1F)
-							self._layer_mask |= layer_mask
-						elif event_count != 1: # TAP key, change layer(hold) or other(tap)
-							logger.debug("TAP-L/hold/multiple")
-							keycode = action_code & 0xFF
-							keys_last_action_code[key_id] = keycode
-							await hid_manager.keyboard_press(keycode)
-						else:
-							logger.debug("TAP-L/wait/%d" % key_id)
-							tap_key_last_id = key_id
-							tap_key_variant = key_variant
-					elif key_variant == ACT_MACRO:
-						await self._handle_action_macro(action_code, press)
-					elif key_variant == ACT_BACKLIGHT:
-						await self._handle_action_backlight(action_code)
-					elif key_variant == ACT_COMMAND:
-						await self._handle_action_command(action_code)
-					
-				else: # release
-					keys_up_time[key_id] = trigger_time
-
-					# detect tap key in a sequence
-					if tap_key_variant > 0:
-						duration = trigger_time - keys_down_time[tap_key_last_id]
-						if duration < tap_thresh: # just a tap in a sequence
-							logger.debug("TAP/L/tap/sequence")
-							await self._trigger_tapkey_action_tap(tap_key_last_id, tap_key_variant)
-							tap_key_variant = 0
-
-					action_code = keys_last_action_code[key_id]
-					key_variant = action_code >> 12
-
-					logger.info(
-							"Key {} {:10} / {:0>4b} {}, {}ms".format(
-							key_id, self.hardware.key_name(key_id), key_variant, hex(action_code),
-							keys_up_time[key_id] - keys_down_time[key_id],
-						))
-
-					if action_code < 0xFF:
-						await hid_manager.keyboard_release(action_code)
-					elif key_variant < ACT_MODS_TAP:
-						# MODS_KEY, one key for multiple modifiers and one other key
-						mods = ( action_code >> 8 ) & 0x1F
-						keycodes = mods_to_keycodes(mods)
-						keycodes.append(action_code & 0xFF)
-						await hid_manager.keyboard_release(*keycodes)
-					elif key_variant < ACT_USAGE:
-						# MODS_TAP
-						if key_variant == tap_key_variant and key_id == tap_key_last_id: # not triggered, same id
-							# press it then release it
-							logger.debug("TAP/tap/tap")
-							single_key = action_code & 0xFF
-							await hid_manager.keyboard_press(single_key)
-							await hid_manager.keyboard_release(single_key)
-							tap_key_variant = 0
-						else: # release it, already in hold state
-							keycodes = mods_to_keycodes(( action_code >> 8 ) & 0x1F)
-							await hid_manager.keyboard_release(*keycodes)
-					elif key_variant == ACT_USAGE:
-						if action_code & 0x400 > 0:
-							await hid_manager.consumer_control_release(0)
-					elif key_variant == ACT_MOUSEKEY:
-						await self._handle_action_mouse_release(action_code)
-					elif key_variant == ACT_LAYER:
-						await self._handle_action_layer_release(action_code)
-					elif key_variant == ACT_LAYER_TAP or key_variant == ACT_LAYER_TAP_EXT:
-						keycode = action_code & 0xFF
-						param = (action_code >> 8) & 0x1F
-						layer_mask = 1 << param
-						if  key_id == tap_key_last_id and key_variant == tap_key_variant:
-							# not triggered, is	tapping key
-							logger.debug("TAP-L/tap/tap")
-							if keycode == OP_TAP_TOGGLE:
-								logger.info("Toggle layer %d" % param)
-								self._layer_mask = (self._layer_mask & ~layer_mask) | (layer_mask & ~self._layer_mask)
-							else:
-								await hid_manager.keyboard_press(keycode)
-								await hid_manager.keyboard_release(keycode)
-							tap_key_variant = 0
-						else: # is `hold`
-							if keycode & 0xE0 == 0xC0:
-								logger.debug("LAYER_MODS")
-								keycodes = mods_to_keycodes(keycode & 0x1F)
-								await hid_manager.keyboard_release(*keycodes)
-							self._layer_mask &= ~layer_mask
-							logger.debug("layer_mask %x" % layer_mask)
-					elif key_variant == ACT_MACRO:
-						await self._handle_action_macro(action_code, press)
+				if tracer.text:
+					tracer.debug("Event: %d | %d", event & 0x7F, (event & 0x80) == 0)
+				self._last_active_time = clock.monotonic()
+				self._keys_down += -1 if event & 0x80 else 1
+				if combos is not None:
+					combos.feed(event, trigger_time)
+					await self._process_combo_events(trigger_time)
+					continue
+				if self._pending_count >= pending_capacity:
+					# full, the pending tap key is decided as `hold` to make room
+					await self._process_pending_events(trigger_time)
+				self._push_pending_event(event, trigger_time)
+				await self._process_pending_events(trigger_time)
 
+			# send the reports changed in this pass, if coalescing
+			await hid_manager.flush_reports()
+			if latency_histogram:
+				hid_manager.set_latency_stamp(-1)
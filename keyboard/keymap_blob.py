@@ -0,0 +1,92 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Compiled keymaps
+#
+# A keymap converted to action codes ahead of time, on the host(see
+# host_sim/keymapc.py), so the keyboard neither imports the keymap module nor
+# converts every key at boot. `load_keymap_blob` reads the action codes into
+# one array and returns a memoryview per layer, `Keyboard.register_keymap`
+# uses them as they are.
+#
+# A blob carries a stamp of the keymap sources it was compiled from, the
+# CRC32 of every .py file of the keymaps folder(a keymap may use the layers
+# of another module), so a blob left behind after editing a keymap is found
+# out, see `KeymapRegistry.load`.
+#
+# format:
+#   header: b"KMAP", version(1 byte), layer count(1 byte), keys per layer(2 bytes),
+#     source stamp(4 bytes)
+#   action codes: 2 bytes each, layer after layer
+#   little endian, like the nRF52840, the codes are read as they are
+
+import array
+import binascii
+import os
+import struct
+
+from .action_code import get_action_code
+
+KEYMAP_BLOB_MAGIC = b"KMAP"
+KEYMAP_BLOB_VERSION = 2
+KEYMAP_BLOB_HEADER = "<4sBBHL"
+KEYMAP_BLOB_HEADER_SIZE = 12
+KEYMAP_BLOB_SUFFIX = ".kmap"
+
+
+def compile_keymap(keymap):
+	# keymap(layers of key names/action codes) to a tuple of actionmaps,
+	# compiled layers are used as they are
+	convert = lambda a: a if isinstance(a, (array.array, memoryview)) \
+			else array.array("H", (get_action_code(k) for k in a))
+	return tuple(convert(layer) for layer in keymap)
+
+
+def keymap_source_stamp(folder):
+	# CRC32 of the names and contents of the .py files in `folder`, None if
+	# there's none(e.g. only .mpy files)
+	names = sorted(name for name in os.listdir(folder) if name.endswith(".py"))
+	if not names:
+		return None
+	crc = 0
+	for name in names:
+		crc = binascii.crc32(name.encode(), crc)
+		with open(folder + "/" + name, "rb") as f:
+			crc = binascii.crc32(f.read(), crc)
+	return crc & 0xFFFFFFFF
+
+
+def encode_keymap(keymap, stamp = 0):
+	# keymap(layers of key names/action codes) to blob bytes
+	# `stamp`: see `keymap_source_stamp`
+	key_count = len(keymap[0])
+	data = bytearray(struct.pack(KEYMAP_BLOB_HEADER, KEYMAP_BLOB_MAGIC,
+			KEYMAP_BLOB_VERSION, len(keymap), key_count, stamp))
+	for layer in keymap:
+		if len(layer) != key_count:
+			raise ValueError("Layers of different sizes")
+		for key in layer:
+			data += struct.pack("<H", get_action_code(key))
+	return bytes(data)
+
+
+def load_keymap_blob(path, stamp = None):
+	# return the layers, raise OSError if it can't be read, ValueError if
+	# it's not a compiled keymap, or not compiled from the sources `stamp`
+	# stands for(None to not check)
+	with open(path, "rb") as f:
+		header = f.read(KEYMAP_BLOB_HEADER_SIZE)
+		if len(header) != KEYMAP_BLOB_HEADER_SIZE:
+			raise ValueError("Not a compiled keymap: %s" % path)
+		magic, version, layer_count, key_count, source = struct.unpack(KEYMAP_BLOB_HEADER, header)
+		if magic != KEYMAP_BLOB_MAGIC or version != KEYMAP_BLOB_VERSION:
+			raise ValueError("Not a compiled keymap: %s" % path)
+		if stamp is not None and source != stamp:
+			raise ValueError("Keymap sources changed since %s was compiled" % path)
+		# a bytearray is copied as raw bytes, the array has the right size
+		# without a list of zeros
+		codes = array.array("H", bytearray(layer_count * key_count * 2))
+		if f.readinto(codes) != layer_count * key_count * 2:
+			raise ValueError("Truncated keymap: %s" % path)
+	codes = memoryview(codes)
+	return tuple(codes[i * key_count:(i + 1) * key_count] for i in range(layer_count))
@@ -0,0 +1,101 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Lazy keymap registry
+#
+# Knows the keymaps by name only, a keymap module is imported the first time
+# one of its keymaps is asked for. `load` returns the compiled actionmaps,
+# from the compiled blob(see keyboard/keymap_blob.py) if there's one and the
+# keymap sources haven't changed since, from the module otherwise, and
+# keeps the last `cache_size` of them, so switching back and forth between
+# two layouts compiles nothing, the least recently used one is dropped.
+#
+# Also reads like the old `keymaps` dict: `name in keymaps`, iterating over
+# the names, `keymaps[name]` for the keymap itself(not compiled).
+
+from .keymap_blob import compile_keymap, load_keymap_blob, keymap_source_stamp, KEYMAP_BLOB_SUFFIX
+
+from adafruit_logging import getLogger
+
+logger = getLogger("Keymaps")
+
+
+class KeymapRegistry:
+
+	def __init__(self, package, sources, blob_dir = None, cache_size = 2):
+		# `package`: the package of the keymap modules
+		# `sources`: {name: (module, attribute)}
+		# `blob_dir`: the folder of the compiled keymaps, `package` by default
+		self._package = package
+		self._sources = sources
+		self._source_dir = package.replace(".", "/")
+		self._blob_dir = self._source_dir if blob_dir is None else blob_dir
+		self._stamp = -1 # of the sources, read once, see `_source_stamp`
+		self._cache_size = cache_size
+		# most recently used first
+		self._cache_names = []
+		self._cache_maps = []
+
+	def __contains__(self, name):
+		return name in self._sources
+
+	def __iter__(self):
+		return iter(self._sources)
+
+	def __len__(self):
+		return len(self._sources)
+
+	def __getitem__(self, name):
+		# the keymap as written in its module, KeyError if unknown
+		module, attribute = self._sources[name]
+		module = __import__(self._package + "." + module, None, None, (attribute,))
+		return getattr(module, attribute)
+
+	def get(self, name, default = None):
+		return self[name] if name in self._sources else default
+
+	def load(self, name):
+		# the compiled actionmaps, KeyError if unknown
+		names = self._cache_names
+		maps = self._cache_maps
+		if name in names:
+			i = names.index(name)
+			if i > 0: # move to front
+				names.insert(0, names.pop(i))
+				maps.insert(0, maps.pop(i))
+			return maps[0]
+
+		if name not in self._sources:
+			raise KeyError(name)
+		path = self._blob_dir + "/" + name + KEYMAP_BLOB_SUFFIX
+		stamp = self._source_stamp()
+		try:
+			actionmaps = load_keymap_blob(path, stamp)
+			logger.info("Keymap %s loaded from %s%s" % (name, path,
+					"" if stamp is not None else ", sources not checked"))
+		except OSError: # not compiled
+			actionmaps = compile_keymap(self[name])
+			logger.info("Keymap %s loaded from its module" % name)
+		except ValueError as e:
+			actionmaps = compile_keymap(self[name])
+			logger.warning("%s, keymap %s loaded from its module" % (e, name))
+
+		if len(names) >= self._cache_size:
+			names.pop()
+			maps.pop()
+		names.insert(0, name)
+		maps.insert(0, actionmaps)
+		return actionmaps
+
+	def _source_stamp(self):
+		# see keyboard/keymap_blob.py, None if the sources can't be read
+		if self._stamp == -1:
+			try:
+				self._stamp = keymap_source_stamp(self._source_dir)
+			except OSError:
+				self._stamp = None
+		return self._stamp
+
+	def clear(self):
+		self._cache_names.clear()
+		self._cache_maps.clear()
@@ -0,0 +1,331 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Keystroke traces: record the raw key events of a real typing session,
+# replay them later through `Keyboard`, on the device or on the host.
+#
+# Both classes wrap a KeyboardHardware and are KeyboardHardware themselves,
+# anything they don't implement(backlight, ...) comes from the wrapped one.
+#
+#   keyboard.register_hardware(lambda: KeyTraceRecorder(m60.KeyboardHardware()))
+#   keyboard.register_hardware(lambda: KeyTraceReplayer("/keytrace.bin", m60.KeyboardHardware()))
+#
+# File format:
+#   header: b"KTRC", version(1 byte), key_count(1 byte)
+#   records: delta(varint), event(1 byte)
+#     delta: ms since the previous record(since the first scan for the first
+#       one), little endian base 128, bit 7 set on every byte but the last,
+#       so deltas below 128ms take 1 byte
+#     event: same as KeyboardHardware's, bit 7 set if released, bit 6~0 key ID
+#   events found in the same scan have a delta of 0
+
+from adafruit_logging import getLogger
+
+from . import clock
+
+logger = getLogger("KeyTrace")
+
+KEYTRACE_MAGIC = b"KTRC"
+KEYTRACE_VERSION = 1
+KEYTRACE_HEADER_SIZE = 6
+
+
+class ReplayFinished(Exception):
+	# raised by `KeyTraceReplayer.get_keys` at the end of the trace
+	pass
+
+
+def keytrace_header(key_count):
+	return KEYTRACE_MAGIC + bytes((KEYTRACE_VERSION, key_count))
+
+
+def decode_keytrace(data):
+	# generate (time_ms, event) from a whole trace(header included)
+	# time_ms is relative to the start of the recording
+	check_keytrace_header(data)
+	timestamp = 0
+	position = KEYTRACE_HEADER_SIZE
+	length = len(data)
+	while position < length:
+		delta = 0
+		shift = 0
+		while True:
+			byte = data[position]
+			position += 1
+			delta |= (byte & 0x7F) << shift
+			shift += 7
+			if byte & 0x80 == 0:
+				break
+		timestamp += delta
+		yield (timestamp, data[position])
+		position += 1
+
+
+def check_keytrace_header(data):
+	# return the key count of the trace
+	if len(data) < KEYTRACE_HEADER_SIZE or data[:4] != KEYTRACE_MAGIC:
+		raise ValueError("Not a key trace")
+	if data[4] != KEYTRACE_VERSION:
+		raise ValueError("Unsupported key trace version: %d" % data[4])
+	return data[5]
+
+
+class _HardwareWrapper:
+	# forwards everything not overridden to the wrapped hardware
+
+	def __init__(self, hardware):
+		self.hardware = hardware
+
+	def __getattr__(self, name):
+		# only called if normal lookup fails
+		return getattr(self.hardware, name)
+
+	def get_all_tasks(self):
+		return self.hardware.get_all_tasks()
+
+	def register_hid_info(self, hid_info):
+		self.hardware.register_hid_info(hid_info)
+
+	def key_name(self, key_id):
+		if hasattr(self.hardware, "key_name"):
+			return self.hardware.key_name(key_id)
+		return "Unknown"
+
+	@property
+	def hardware_spec(self):
+		return self.hardware.hardware_spec
+
+	@property
+	def key_count(self):
+		return self.hardware.key_count
+
+	async def suspend(self):
+		return await self.hardware.suspend()
+
+
+class KeyTraceRecorder(_HardwareWrapper):
+	# records the events of the wrapped hardware into a preallocated buffer
+	# when the buffer is full, recording stops and the trace is saved to `path`
+	# (if `save_when_full`), the drive must be writable for the code, see
+	# USB_STORAGE_MODE in keyboard_config.py
+	# `save` can also be called at any time, e.g. from a macro
+
+	def __init__(self, hardware, size = 4096, path = "/keytrace.bin", save_when_full = True):
+		super().__init__(hardware)
+		self._buffer = bytearray(size)
+		self._length = 0
+		self._last_time = None
+		self._scan_time = 0
+		self._iter = None
+		self.path = path
+		self.save_when_full = save_when_full
+		self.recording = True
+		self.full = False
+		self.saved = False
+		self.dropped = 0 # events not recorded since the buffer is full
+
+	async def get_keys(self):
+		if self.full and self.save_when_full and not self.saved:
+			# out of the event loop of the previous scan
+			self.save()
+		count = await self.hardware.get_keys()
+		self._scan_time = clock.ms()
+		if self._last_time is None:
+			self._last_time = self._scan_time
+		return count
+
+	def __iter__(self):
+		self._iter = iter(self.hardware)
+		return self
+
+	def __next__(self):
+		event = next(self._iter)
+		if self.recording:
+			self.record(self._scan_time, event)
+		return event
+
+	def record(self, timestamp, event):
+		buffer = self._buffer
+		position = self._length
+		delta = (timestamp - self._last_time) & 0x7FFFFFFF
+		# a 31 bit delta takes 5 bytes at most, plus the event
+		if position + 6 > len(buffer):
+			if not self.full:
+				self.full = True
+				logger.info("Key trace buffer full, %d bytes" % position)
+			self.dropped += 1
+			return
+		while delta > 0x7F:
+			buffer[position] = (delta & 0x7F) | 0x80
+			delta >>= 7
+			position += 1
+		buffer[position] = delta
+		buffer[position + 1] = event
+		self._length = position + 2
+		self._last_time = timestamp
+
+	def trace(self):
+		# the trace recorded so far, header included
+		return keytrace_header(self.hardware.key_count) + self._buffer[:self._length]
+
+	def save(self, path = None):
+		# write the trace to the drive, return True on success
+		path = self.path if path is None else path
+		try:
+			with open(path, "wb") as f:
+				f.write(keytrace_header(self.hardware.key_count))
+				f.write(memoryview(self._buffer)[:self._length])
+		except OSError as e:
+			# read-only filesystem most likely
+			logger.error("Cannot save the key trace to %s: %s" % (path, e))
+			return False
+		self.saved = True
+		logger.info("Key trace saved to %s, %d bytes" % (path, self._length + KEYTRACE_HEADER_SIZE))
+		return True
+
+	def clear(self):
+		self._length = 0
+		self._last_time = None
+		self.full = False
+		self.saved = False
+		self.dropped = 0
+
+	def __len__(self):
+		return self._length
+
+
+class KeyTraceReplayer(_HardwareWrapper):
+	# feeds a recorded trace to the keyboard instead of the wrapped hardware's
+	# events, keeping the recorded timing
+	# `trace`: the trace(bytes) or a path to it
+	# `hardware`: optional, provides the tasks, backlight, etc
+	# `key_count`: if no hardware, defaults to the trace's
+	# `speed`: timing scale, 2 replays twice as fast, 0 as fast as possible
+	# `loop`: start over at the end, otherwise get_keys raises ReplayFinished
+	#   (or returns 0 forever if `stop_at_end` is False)
+
+	# the keyboard polls the replayer on every pass, the events of the
+	# wrapped hardware are ignored
+	events_ready = None
+
+	def __init__(self, trace, hardware = None, key_count = None, speed = 1,
+			loop = False, stop_at_end = True):
+		super().__init__(hardware)
+		if isinstance(trace, str):
+			with open(trace, "rb") as f:
+				trace = f.read()
+		trace_key_count = check_keytrace_header(trace)
+		if hardware is not None:
+			key_count = hardware.key_count
+		elif key_count is None:
+			key_count = trace_key_count
+		if trace_key_count > key_count:
+			raise ValueError("The trace has %d keys, the keyboard %d" % (trace_key_count, key_count))
+		self._trace = trace
+		self._key_count = key_count
+		self.speed = speed
+		self.loop = loop
+		self.stop_at_end = stop_at_end
+		self._pending = bytearray(128)
+		self._pending_count = 0
+		self._pending_index = 0
+		self.replayed = 0
+		self.finished = False
+		self._rewind()
+
+	def _rewind(self):
+		self._position = KEYTRACE_HEADER_SIZE
+		self._start_time = None
+		self._next_time = 0
+		self._next_event = -1
+		self._decode_next()
+
+	def _decode_next(self):
+		# decode the next record into _next_time and _next_event
+		trace = self._trace
+		position = self._position
+		if position >= len(trace):
+			self._next_event = -1
+			return
+		delta = 0
+		shift = 0
+		while True:
+			byte = trace[position]
+			position += 1
+			delta |= (byte & 0x7F) << shift
+			shift += 7
+			if byte & 0x80 == 0:
+				break
+		self._next_time += delta
+		self._next_event = trace[position]
+		self._position = position + 1
+
+	async def get_keys(self):
+		now = clock.ms()
+		if self._start_time is None:
+			self._start_time = now
+		if self._next_event < 0:
+			if self.loop:
+				self._rewind()
+				return 0
+			if not self.finished:
+				self.finished = True
+				logger.info("Replay finished, %d events" % self.replayed)
+			if self.stop_at_end:
+				raise ReplayFinished()
+			return 0
+		elapsed = (now - self._start_time) & 0x7FFFFFFF
+		if self.speed == 0:
+			# one recorded scan per call
+			due = self._next_time
+		else:
+			due = elapsed * self.speed
+		pending = self._pending
+		count = 0
+		while self._next_event >= 0 and count < len(pending) and self._next_time <= due:
+			pending[count] = self._next_event
+			count += 1
+			self._decode_next()
+		self._pending_count = count
+		self._pending_index = 0
+		self.replayed += count
+		return count
+
+	def __iter__(self):
+		return self
+
+	def __next__(self):
+		i = self._pending_index
+		if i >= self._pending_count:
+			raise StopIteration
+		self._pending_index = i + 1
+		return self._pending[i]
+
+	def get_all_tasks(self):
+		if self.hardware is None:
+			return []
+		return self.hardware.get_all_tasks()
+
+	def register_hid_info(self, hid_info):
+		if self.hardware is not None:
+			self.hardware.register_hid_info(hid_info)
+
+	def key_name(self, key_id):
+		if self.hardware is None:
+			return "Unknown"
+		return super().key_name(key_id)
+
+	@property
+	def hardware_spec(self):
+		if self.hardware is None:
+			return 0
+		return self.hardware.hardware_spec
+
+	@property
+	def key_count(self):
+		return self._key_count
+
+	async def suspend(self):
+		if self.hardware is None:
+			return 0
+		return await self.hardware.suspend()
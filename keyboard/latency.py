@@ -0,0 +1,70 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Scan-to-report latency histogram
+#
+# The keyboard stamps the time `get_keys()` returned with events, each HID
+# interface records the time elapsed when it actually sends a report for
+# them. Counts go to fixed buckets in a preallocated array, nothing is
+# allocated when recording.
+#
+# Read it with the LATENCY command(prints every interface's histogram) or
+# `HIDInfo.latency_histogram()`.
+
+import array
+
+# upper bounds of the buckets in ms, the last bucket takes everything above
+# resolution is 1ms(see `keyboard.clock.ms`), 0 means less than 1ms
+LATENCY_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 16, 24, 32, 48, 64, 96, 128)
+
+
+class LatencyHistogram:
+
+	def __init__(self, name = ""):
+		self.name = name
+		self.bounds = LATENCY_BUCKETS
+		self.counts = array.array("L", [0] * (len(LATENCY_BUCKETS) + 1))
+		self.max = 0
+
+	def record(self, latency):
+		bounds = self.bounds
+		i = 0
+		n = len(bounds)
+		while i < n and latency > bounds[i]:
+			i += 1
+		self.counts[i] += 1
+		if latency > self.max:
+			self.max = latency
+
+	def clear(self):
+		counts = self.counts
+		for i in range(len(counts)):
+			counts[i] = 0
+		self.max = 0
+
+	@property
+	def total(self):
+		return sum(self.counts)
+
+	def percentile(self, q):
+		# upper bound(ms) of the bucket holding the `q`(0~1) quantile
+		# `max` if that's the last bucket, -1 if empty
+		total = self.total
+		if total == 0:
+			return -1
+		target = q * total
+		seen = 0
+		for i in range(len(self.bounds)):
+			seen += self.counts[i]
+			if seen >= target:
+				return self.bounds[i]
+		return self.max
+
+	def __str__(self):
+		# e.g. "ble: 120 reports, p50<=8ms p99<=32ms max 40ms | <=0ms:0 <=1ms:3 ..."
+		bounds = self.bounds
+		counts = self.counts
+		buckets = " ".join("<=%dms:%d" % (bounds[i], counts[i]) for i in range(len(bounds)))
+		return "%s: %d reports, p50<=%dms p99<=%dms max %dms | %s >%dms:%d" % (
+			self.name, self.total, self.percentile(0.5), self.percentile(0.99), self.max,
+			buckets, bounds[-1], counts[-1])
@@ -0,0 +1,103 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Leader key sequences
+#
+# After the LEADER key, the next key presses are not typed but matched
+# against sequences, e.g. LEADER, g, c for MACRO(3). A sequence is given as
+# the keys of the base layer(like in a keymap), and compiled into a trie of
+# those keys, symbols, once. A step is one lookup in a flat array, nothing
+# is allocated:
+#   next node = transitions[node * symbols + symbol of the position]
+# Positions are mapped to symbols by `map_layer`, from the base layer of the
+# actionmap in use, again whenever it changes(another keymap or profile),
+# only the keys used by sequences get a symbol, so the table stays small.
+#
+# A sequence fires as soon as it's complete, or when the timeout expires if
+# a longer one starts with it. A key that leads nowhere ends the capture.
+
+import array
+
+from .action_code import get_action_code, ACT_MODS_TAP, ACT_LAYER_TAP
+
+from adafruit_logging import getLogger
+
+logger = getLogger("Leader")
+
+
+class LeaderTrie:
+
+	def __init__(self, sequences, layer = None):
+		# `sequences`: ((keys, action), ...), keys and action like in a keymap
+		# `layer`: action codes by position, the base layer, see `map_layer`
+		codes = []
+		for keys, _ in sequences:
+			for key in keys:
+				code = get_action_code(key)
+				if code not in codes:
+					codes.append(code)
+		symbol_count = len(codes)
+		self._codes = codes
+		# by key id(7 bits, combos included), symbol + 1, 0 for keys used by
+		# no sequence
+		self.symbols = bytearray(0x80)
+
+		# node 0 is the root, no transition leads to it, 0 means none
+		children = [{}]
+		actions = [0]
+		for keys, action in sequences:
+			node = 0
+			for key in keys:
+				symbol = codes.index(get_action_code(key))
+				if symbol not in children[node]:
+					children[node][symbol] = len(children)
+					children.append({})
+					actions.append(0)
+				node = children[node][symbol]
+			actions[node] = get_action_code(action)
+
+		node_count = len(children)
+		self.symbol_count = symbol_count
+		# bytes while node ids fit
+		size = node_count * symbol_count
+		if node_count < 0x100:
+			self.transitions = bytearray(size)
+		else:
+			self.transitions = array.array("H", bytearray(size * 2))
+		self.actions = array.array("H", actions)
+		# 1 if a longer sequence goes on from the node
+		self.branches = bytearray(node_count)
+		for node in range(node_count):
+			for symbol, child in children[node].items():
+				self.transitions[node * symbol_count + symbol] = child
+				self.branches[node] = 1
+		if layer is not None:
+			self.map_layer(layer)
+
+	def map_layer(self, layer):
+		# map the positions of `layer`(action codes, the base layer of the
+		# actionmap in use) to symbols
+		codes = self._codes
+		symbols = self.symbols
+		for position in range(len(symbols)):
+			symbols[position] = 0
+		found = [False] * len(codes)
+		for position in range(len(layer)):
+			code = layer[position]
+			kind = code >> 13 << 1 # tap keys, both variants
+			if kind == ACT_MODS_TAP or kind == ACT_LAYER_TAP:
+				code &= 0xFF # the key it taps
+			if code in codes:
+				symbol = codes.index(code)
+				symbols[position] = symbol + 1
+				found[symbol] = True
+		for symbol in range(len(codes)):
+			if not found[symbol]:
+				logger.warning("Leader key %s is not on the base layer" % hex(codes[symbol]))
+
+	def step(self, node, position):
+		# the next node, 0 if the key leads nowhere
+		symbol = self.symbols[position]
+		if symbol == 0:
+			return 0
+		return self.transitions[node * self.symbol_count + symbol - 1]
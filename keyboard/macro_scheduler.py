@@ -0,0 +1,107 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Macros run in a task of their own
+#
+# The main loop only queues the macro key events(`put`), `run` calls the
+# macro handler for them one after another, so a long `send_text` doesn't
+# hold back the key events, the tap keys and the timers meanwhile. The keys
+# typed meanwhile go out between the reports of the macro.
+#
+# The queue is a small ring buffer, a press is dropped if the queue is full,
+# and its release as well. A slot is kept for the release of every press
+# queued, so a macro always gets its release.
+#
+# With `cancel_on_release`, releasing the key of the macro running stops it,
+# a text being typed stops with the keys held by the user pressed again
+# (`send_text`), the handler gets the release as usual and releases its own
+# keys. Nothing is released from here, the main loop sends reports
+# meanwhile. A macro still waiting in the queue runs anyway. Each press runs
+# in a task of its own then, to be cancelled, otherwise the handler is
+# awaited directly, nothing is allocated per macro.
+
+import array
+import asyncio
+
+from adafruit_logging import getLogger
+
+logger = getLogger("Macros")
+
+
+class MacroScheduler:
+
+	def __init__(self, size = 8, cancel_on_release = False):
+		if size < 2:
+			raise ValueError("The macro queue needs 2 slots at least")
+		self.handler = None # async handler(interface, index, press)
+		self.interface = None # a `MacroInterface`, shared by all the calls
+		self.cancel_on_release = cancel_on_release
+		self.dropped = 0
+		self._keys = bytearray(size)
+		self._macros = array.array("H", bytearray(size * 2)) # macro index, 0x8000 for press
+		self._head = 0
+		self._count = 0
+		self._reserved = 0 # slots kept for releases
+		self._accepted = bytearray(0x80) # 1 if the press of a key id is queued or ran
+		self._ready = asyncio.Event()
+		self._running_key = -1 # key id of the press running, if it can be cancelled
+		self._task = None
+
+	def put(self, key_id, index, press):
+		# queue a macro key event, return False if it's dropped
+		size = len(self._keys)
+		if press:
+			if self._count + self._reserved + 2 > size:
+				self.dropped += 1
+				logger.warning("Macro queue full, MACRO(%d) dropped" % index)
+				return False
+			self._accepted[key_id] = 1
+			self._reserved += 1
+		else:
+			if not self._accepted[key_id]: # press dropped
+				return False
+			self._accepted[key_id] = 0
+			self._reserved -= 1
+			if self._running_key == key_id:
+				self._running_key = -1
+				self._task.cancel()
+		i = (self._head + self._count) % size
+		self._keys[i] = key_id
+		self._macros[i] = 0x8000 | index if press else index
+		self._count += 1
+		self._ready.set()
+		return True
+
+	async def run(self):
+		# the task running the macros
+		keys = self._keys
+		macros = self._macros
+		while True:
+			await self._ready.wait()
+			while self._count > 0:
+				key_id = keys[self._head]
+				macro = macros[self._head]
+				self._head = (self._head + 1) % len(keys)
+				self._count -= 1
+				press = macro & 0x8000 != 0
+				if press and self.cancel_on_release:
+					await self._run_cancellable(key_id, macro & 0x7FFF)
+				else:
+					await self._call(macro & 0x7FFF, press)
+			self._ready.clear()
+
+	async def _run_cancellable(self, key_id, index):
+		self._running_key = key_id
+		self._task = asyncio.create_task(self._call(index, True))
+		try:
+			await self._task
+		except asyncio.CancelledError:
+			logger.debug("MACRO(%d) cancelled" % index)
+		self._running_key = -1
+		self._task = None
+
+	async def _call(self, index, press):
+		try:
+			await self.handler(self.interface, index, press)
+		except Exception as e:
+			print(e)
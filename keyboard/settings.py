@@ -0,0 +1,80 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Persistent settings
+#
+# A few values that should survive a reset(the BLE ID, the keymap, the
+# backlight), kept in a record log on nvm(see keyboard/storage.py). They are
+# read once at boot, `set` only changes them in RAM and the keyboard calls
+# `flush` a minute after the last change and before suspending or
+# resetting, so stepping through backlight colors costs one write, not one
+# per key press. A flush is one write of all the changed settings, one erase
+# of a flash page(two when the log is compacted, see
+# keyboard/storage.py), the page stands about 10000 of them.
+#
+# One record per change, the tag is the setting, the last record of a tag
+# wins. payload: version(1 byte), value. A record of an unknown version is
+# skipped, the setting then keeps its default.
+#   SETTING_BLE_ID: id(1 byte)
+#   SETTING_KEYMAP: name(utf-8)
+#   SETTING_BACKLIGHT: enabled, mode, hue, saturation, value, brightness
+#     (1 byte each)
+
+from adafruit_logging import getLogger
+
+logger = getLogger("Settings")
+
+SETTING_BLE_ID = 1
+SETTING_KEYMAP = 2
+SETTING_BACKLIGHT = 3
+
+SETTINGS_VERSION = 1
+
+
+class Settings:
+
+	def __init__(self, log):
+		# `log`: a `RecordLog`, None to keep the settings in RAM only
+		self._log = log
+		self._values = {} # tag: value(bytes)
+		self._dirty = [] # tags changed since the last flush
+
+	def load(self):
+		if self._log is None:
+			return
+		values = self._values
+		for tag, payload in self._log.records():
+			if len(payload) > 0 and payload[0] == SETTINGS_VERSION:
+				values[tag] = bytes(payload[1:])
+		logger.debug("Settings loaded: %s" % values)
+
+	def get(self, tag, default = None):
+		return self._values.get(tag, default)
+
+	def set(self, tag, value):
+		# return True if changed, `flush` it later
+		value = bytes(value)
+		if self._values.get(tag, None) == value:
+			return False
+		self._values[tag] = value
+		if tag not in self._dirty:
+			self._dirty.append(tag)
+		return True
+
+	@property
+	def dirty(self):
+		return len(self._dirty) > 0
+
+	def flush(self):
+		# write the changed settings, return True if written
+		if self._log is None or not self._dirty:
+			return False
+		if not self._log.extend([(tag, self._record(tag)) for tag in self._dirty]):
+			# the half is full, keep the latest value of each setting
+			self._log.compact([(tag, self._record(tag)) for tag in self._values])
+			logger.debug("Settings log compacted")
+		self._dirty.clear()
+		return True
+
+	def _record(self, tag):
+		return bytes((SETTINGS_VERSION,)) + self._values[tag]
@@ -0,0 +1,172 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Append-only record log on non-volatile memory(`microcontroller.nvm`)
+#
+# A log has two halves, only one is in use. Records are appended to it,
+# nothing written is ever rewritten in place. When the half is full, the
+# owner writes a compact snapshot of its state to the other half(`compact`),
+# which then takes over with a newer generation, the old half stays as it is
+# until the next compaction.
+#
+# half:    magic b"RL", generation(2 bytes, little endian), records...
+# record:  tag(1 byte, 1~254), length(1 byte), payload, checksum(1 byte)
+# the first byte that isn't a valid tag(erased 0xFF or 0x00) ends the log,
+# so does a bad checksum(a record cut by a reset)
+#
+# The nvm of the nRF52840 is two 4KB flash pages, and CircuitPython erases
+# and rewrites every page a slice assignment touches. So the two halves of a
+# log are in different pages: each `append` is one erase of the page in use,
+# each `compact` two of the other page, and the erases move from one page to
+# the other at every compaction, both pages wear evenly. A compaction cut by
+# a reset can't harm the half in use either, it's in the other page. The
+# logs share the pages though, an erase cut by a reset can lose the half in
+# use of the other log, which then falls back to its older half.
+# A page stands about 10000 erases, this only doubles it, so owners batch
+# their changes and write only on rare occasions(before suspending or
+# resetting, on a command, a while after a settings change), never on a
+# timer that runs while typing.
+
+NVM_PAGE_SIZE = 4096
+NVM_SIZE = 2 * NVM_PAGE_SIZE
+
+# the logs, (offset of the first half, offset of the second, half size)
+# the first halves in the first page, the second ones in the other
+NVM_HEATMAP = (0, NVM_PAGE_SIZE, 2048)
+NVM_SETTINGS = (2048, NVM_PAGE_SIZE + 2048, 512)
+
+RECORD_LOG_MAGIC = b"RL"
+RECORD_LOG_HEADER_SIZE = 4
+RECORD_MAX_PAYLOAD = 255
+
+
+def _checksum(tag, payload):
+	total = tag + len(payload)
+	for byte in payload:
+		total += byte
+	return (total & 0xFF) ^ 0xA5
+
+
+class RecordLog:
+
+	def __init__(self, storage, first, second, half_size):
+		# `first`, `second`: offsets of the halves, see NVM_HEATMAP
+		self._storage = storage
+		self._half_size = half_size
+		self._halves = (first, second)
+		self._active = 0
+		self._generation = 0
+		self._end = RECORD_LOG_HEADER_SIZE # write position in the active half
+		self._find_active_half()
+
+	def _read_generation(self, half):
+		start = self._halves[half]
+		header = self._storage[start:start + RECORD_LOG_HEADER_SIZE]
+		if header[:2] != RECORD_LOG_MAGIC:
+			return -1
+		return header[2] | (header[3] << 8)
+
+	def _find_active_half(self):
+		generations = (self._read_generation(0), self._read_generation(1))
+		if generations[0] < 0 and generations[1] < 0:
+			# never used
+			self._active = -1
+			return
+		if generations[0] < 0:
+			active = 1
+		elif generations[1] < 0:
+			active = 0
+		else:
+			# the newer one, generations wrap around at 16 bits
+			active = 1 if (generations[1] - generations[0]) & 0xFFFF < 0x8000 else 0
+		self._active = active
+		self._generation = generations[active]
+		for _, _, end in self._read():
+			self._end = end
+
+	def records(self):
+		# generate (tag, payload) of every valid record, oldest first
+		for tag, payload, _ in self._read():
+			yield tag, payload
+
+	def _read(self):
+		# generate (tag, payload, end of the record)
+		if self._active < 0:
+			return
+		start = self._halves[self._active]
+		data = self._storage[start:start + self._half_size]
+		position = RECORD_LOG_HEADER_SIZE
+		while position + 3 <= len(data):
+			tag = data[position]
+			if tag == 0x00 or tag == 0xFF:
+				break
+			length = data[position + 1]
+			end = position + 2 + length
+			if end >= len(data):
+				break
+			payload = data[position + 2:end]
+			if data[end] != _checksum(tag, payload):
+				break
+			position = end + 1
+			yield tag, payload, position
+
+	def room(self):
+		# payload bytes the next record can hold
+		if self._active < 0:
+			return 0
+		return max(0, min(RECORD_MAX_PAYLOAD, self._half_size - self._end - 3))
+
+	def append(self, tag, payload):
+		# return False if there's no room, `compact` then
+		return self.extend(((tag, payload),))
+
+	def extend(self, records):
+		# append `records`, a list of (tag, payload), in one write(one erase)
+		# return False if they don't all fit, nothing is written then
+		if self._active < 0:
+			return False
+		size = 0
+		for _, payload in records:
+			if len(payload) > RECORD_MAX_PAYLOAD:
+				return False
+			size += len(payload) + 3
+		if self._end + size > self._half_size:
+			return False
+		data = bytearray(size)
+		position = 0
+		for tag, payload in records:
+			length = len(payload)
+			data[position] = tag
+			data[position + 1] = length
+			data[position + 2:position + 2 + length] = payload
+			data[position + 2 + length] = _checksum(tag, payload)
+			position += length + 3
+		start = self._halves[self._active] + self._end
+		self._storage[start:start + size] = data
+		self._end += size
+		return True
+
+	def compact(self, records):
+		# replace everything with `records`, a list of (tag, payload)
+		# written to the other half, the header last, so it's only found
+		# once complete, the old half is left as it is, older
+		half = 0 if self._active < 0 else 1 - self._active
+		generation = (self._generation + 1) & 0xFFFF
+		data = bytearray(self._half_size)
+		position = RECORD_LOG_HEADER_SIZE
+		for tag, payload in records:
+			length = len(payload)
+			if position + length + 3 > self._half_size:
+				raise ValueError("Records don't fit in the log")
+			data[position] = tag
+			data[position + 1] = length
+			data[position + 2:position + 2 + length] = payload
+			data[position + 2 + length] = _checksum(tag, payload)
+			position += length + 3
+		start = self._halves[half]
+		# no magic yet, an interrupted compaction leaves the old half in use
+		self._storage[start + RECORD_LOG_HEADER_SIZE:start + self._half_size] = data[RECORD_LOG_HEADER_SIZE:]
+		self._storage[start:start + RECORD_LOG_HEADER_SIZE] = RECORD_LOG_MAGIC + bytes((generation & 0xFF, generation >> 8))
+		self._active = half
+		self._generation = generation
+		self._end = position
@@ -0,0 +1,166 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Adaptive tap-hold timing
+#
+# Keeps running histograms of how long tap keys are held when tapped, and of
+# the intervals between key presses, then slowly moves the keyboard's
+# TIME_TAP_THRESH and TIME_TAP_DELAY inside configured bounds:
+#   tap_thresh: the 95th percentile of tap durations, plus a margin, so
+#     real taps are not taken as holds
+#   tap_delay: the 75th percentile of the intervals between presses, so a
+#     roll onto the next key at the usual typing speed stays a tap
+# Values move by at most `step` ms every `update_interval` taps, and the
+# counts are halved once a histogram is full, old typing fades out.
+#
+# Print it with the TAP_TIMING command key, which also saves the learned
+# values to `path`, they are loaded back when the keyboard starts. The drive
+# must be writable for the code, see USB_STORAGE_MODE in keyboard_config.py
+
+import array
+import json
+
+from adafruit_logging import getLogger
+
+logger = getLogger("TapTiming")
+
+# linear buckets, the last one takes everything above
+TAP_TIMING_BUCKET_MS = 10
+TAP_TIMING_BUCKETS = 32
+# total count of a histogram before it's halved
+TAP_TIMING_HISTORY = 1024
+
+
+class TimingHistogram:
+
+	def __init__(self):
+		self.counts = array.array("L", [0] * TAP_TIMING_BUCKETS)
+		self.total = 0
+
+	def record(self, ms):
+		i = ms // TAP_TIMING_BUCKET_MS
+		if i >= TAP_TIMING_BUCKETS:
+			i = TAP_TIMING_BUCKETS - 1
+		self.counts[i] += 1
+		self.total += 1
+		if self.total >= TAP_TIMING_HISTORY:
+			counts = self.counts
+			total = 0
+			for i in range(len(counts)):
+				counts[i] >>= 1
+				total += counts[i]
+			self.total = total
+
+	def percentile(self, q):
+		# upper bound(ms) of the bucket holding the `q`(0~1) quantile, -1 if empty
+		if self.total == 0:
+			return -1
+		target = q * self.total
+		seen = 0
+		counts = self.counts
+		for i in range(len(counts)):
+			seen += counts[i]
+			if seen >= target:
+				return (i + 1) * TAP_TIMING_BUCKET_MS
+		return len(counts) * TAP_TIMING_BUCKET_MS
+
+	def clear(self):
+		counts = self.counts
+		for i in range(len(counts)):
+			counts[i] = 0
+		self.total = 0
+
+
+class AdaptiveTapTiming:
+
+	def __init__(self, tap_thresh, tap_delay,
+			thresh_range = (120, 250),
+			delay_range = (40, 120),
+			margin = 20,
+			step = 2,
+			update_interval = 32,
+			path = "/tap_timing.json"):
+		self.tap_thresh = tap_thresh
+		self.tap_delay = tap_delay
+		self.thresh_range = thresh_range
+		self.delay_range = delay_range
+		self.margin = margin
+		self.step = step
+		self.update_interval = update_interval
+		self.path = path
+		self.durations = TimingHistogram()
+		self.intervals = TimingHistogram()
+		self._new_taps = 0
+
+	def record_tap(self, duration):
+		# a tap key pressed and released as `tap`
+		# return True if tap_thresh or tap_delay changed
+		self.durations.record(duration)
+		self._new_taps += 1
+		if self._new_taps < self.update_interval:
+			return False
+		self._new_taps = 0
+		return self.update()
+
+	def record_interval(self, interval):
+		# between two key presses, pauses are left out
+		if interval < TAP_TIMING_BUCKETS * TAP_TIMING_BUCKET_MS:
+			self.intervals.record(interval)
+
+	def update(self):
+		# move the values one step towards their targets
+		old = (self.tap_thresh, self.tap_delay)
+		p95 = self.durations.percentile(0.95)
+		if p95 >= 0:
+			self.tap_thresh = self._approach(self.tap_thresh, p95 + self.margin, self.thresh_range)
+		p75 = self.intervals.percentile(0.75)
+		if p75 >= 0:
+			low, high = self.delay_range
+			# a delay past the threshold means nothing
+			high = min(high, self.tap_thresh - TAP_TIMING_BUCKET_MS)
+			self.tap_delay = self._approach(self.tap_delay, p75, (low, high))
+		return (self.tap_thresh, self.tap_delay) != old
+
+	def _approach(self, value, target, bounds):
+		low, high = bounds
+		target = max(low, min(high, target))
+		step = self.step
+		if target > value + step:
+			return value + step
+		if target < value - step:
+			return value - step
+		return target
+
+	def load(self, path = None):
+		# read the learned values, return True on success
+		path = self.path if path is None else path
+		try:
+			with open(path, "r") as f:
+				values = json.load(f)
+			low, high = self.thresh_range
+			self.tap_thresh = max(low, min(high, int(values["tap_thresh"])))
+			low, high = self.delay_range
+			self.tap_delay = max(low, min(high, int(values["tap_delay"])))
+		except (OSError, ValueError, KeyError) as e:
+			logger.info("No tap timing loaded from %s: %s" % (path, e))
+			return False
+		return True
+
+	def save(self, path = None):
+		# write the learned values, return True on success
+		path = self.path if path is None else path
+		try:
+			with open(path, "w") as f:
+				json.dump({"tap_thresh": self.tap_thresh, "tap_delay": self.tap_delay}, f)
+		except OSError as e:
+			# read-only filesystem most likely
+			logger.error("Cannot save the tap timing to %s: %s" % (path, e))
+			return False
+		logger.info("Tap timing saved to %s" % path)
+		return True
+
+	def __str__(self):
+		return "tap_thresh %dms, tap_delay %dms | %d taps, p95 %dms | %d intervals, p75 %dms" % (
+			self.tap_thresh, self.tap_delay,
+			self.durations.total, self.durations.percentile(0.95),
+			self.intervals.total, self.intervals.percentile(0.75))
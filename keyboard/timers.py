@@ -0,0 +1,135 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Shared timer service
+#
+# A fixed table of deadlines on ms ticks(see `keyboard.clock.ms`), shared by
+# the keyboard core(tap keys, mouse keys), the HID manager(BLE advertising
+# timeout) and the hardware(backlight effects, battery level). The main loop
+# sleeps until a key event or the next deadline(see `run`), then runs the
+# callbacks of the expired timers, nobody polls.
+#
+#   timer = timers.add(callback)      # once, at initialization
+#   timers.start(timer, 60000)        # callback() is awaited in 60s
+#   timers.stop(timer)
+#
+# A timer without a callback only wakes the main loop, its owner checks
+# `pending(timer)`. There are only a handful of timers, a linear scan of the
+# table is cheaper than a heap or a wheel here, and nothing is allocated
+# once they are added.
+
+import asyncio
+
+from .clock import ms
+
+_STOPPED = -1
+
+
+def _due(deadline, now):
+	# deadline <= now, ticks wrap around at 31 bits
+	return (now - deadline) & 0x7FFFFFFF < 0x40000000
+
+
+class Timers:
+
+	def __init__(self, size = 16):
+		self._deadlines = [_STOPPED] * size
+		self._callbacks = [None] * size
+		self._count = 0
+		# deadline `run` sleeps until, and the event to wake it up if a
+		# timer is started before that
+		self._next = _STOPPED
+		self._changed = asyncio.Event()
+
+	def add(self, callback = None):
+		# register a timer, return its ID
+		# `callback`: async function without arguments, or None
+		if self._count >= len(self._deadlines):
+			raise RuntimeError("Too many timers")
+		timer = self._count
+		self._callbacks[timer] = callback
+		self._count += 1
+		return timer
+
+	def start(self, timer, delay):
+		# (re)start the timer, expires in `delay` ms
+		self.start_at(timer, ms() + delay)
+
+	def start_at(self, timer, deadline):
+		# (re)start the timer, expires at `deadline`(ms ticks)
+		deadline &= 0x7FFFFFFF
+		self._deadlines[timer] = deadline
+		if self._next == _STOPPED or _due(deadline, self._next):
+			self._changed.set()
+
+	def stop(self, timer):
+		deadline = self._deadlines[timer]
+		self._deadlines[timer] = _STOPPED
+		# if `run` waits for this one, due or not, it looks for the next
+		# deadline, `dispatch` won't find it expired to wake it up
+		if deadline != _STOPPED and self._next != _STOPPED and _due(deadline, self._next):
+			self._changed.set()
+
+	def pending(self, timer):
+		# started and not expired yet
+		return self._deadlines[timer] != _STOPPED
+
+	def timeout(self, now = None):
+		# ms until the next deadline, 0 if one is due, -1 if none
+		if now is None:
+			now = ms()
+		deadlines = self._deadlines
+		timeout = -1
+		for timer in range(self._count):
+			deadline = deadlines[timer]
+			if deadline == _STOPPED:
+				continue
+			if _due(deadline, now):
+				return 0
+			remaining = (deadline - now) & 0x7FFFFFFF
+			if timeout < 0 or remaining < timeout:
+				timeout = remaining
+		return timeout
+
+	async def run(self, wakeup):
+		# task setting `wakeup` at every deadline, for a main loop that
+		# sleeps on it and calls `dispatch` when woken up
+		# it only wakes up itself when the earliest deadline moves, not on
+		# every key event
+		changed = self._changed
+		while True:
+			now = ms()
+			timeout = self.timeout(now)
+			changed.clear()
+			if timeout == 0:
+				# until `dispatch` has run
+				self._next = now
+				wakeup.set()
+				await changed.wait()
+			elif timeout < 0:
+				self._next = _STOPPED
+				await changed.wait()
+			else:
+				self._next = (now + timeout) & 0x7FFFFFFF
+				try:
+					await asyncio.wait_for(changed.wait(), timeout / 1000)
+				except asyncio.TimeoutError:
+					pass
+
+	async def dispatch(self, now = None):
+		# stop the expired timers and run their callbacks
+		if now is None:
+			now = ms()
+		deadlines = self._deadlines
+		callbacks = self._callbacks
+		expired = False
+		for timer in range(self._count):
+			deadline = deadlines[timer]
+			if deadline != _STOPPED and _due(deadline, now):
+				deadlines[timer] = _STOPPED
+				expired = True
+				callback = callbacks[timer]
+				if callback is not None:
+					await callback()
+		if expired:
+			self._changed.set()
@@ -0,0 +1,82 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Tracing for the keystroke hot path
+#
+# Every trace point is guarded by a plain attribute check, e.g.
+#
+#   if tracer.text:
+#       tracer.debug("Event: %d | %d", key_id, press)
+#
+# so a disabled trace point costs one boolean check and never formats
+# its arguments or calls anything.
+#
+# The binary mode records (timestamp, event, action_code) into a
+# preallocated ring buffer instead of producing any text.
+#   timestamp: ms, see `keyboard.utils.ms`
+#   event: the key event, bit 7 set if released, bit 6~0 the key ID
+#   action_code: the action code the event resolved to
+
+import array
+
+TRACE_OFF = 0
+TRACE_TEXT = 1 << 0
+TRACE_BINARY = 1 << 1
+
+
+class Tracer:
+
+	def __init__(self, logger, mode = TRACE_OFF, size = 128):
+		self._logger = logger
+		self.capacity = size
+		self._timestamps = array.array("L", [0] * size)
+		self._events = bytearray(size)
+		self._action_codes = array.array("H", [0] * size)
+		self._head = 0
+		self.length = 0
+		# flags checked at trace points
+		self.text = False
+		self.binary = False
+		self.set_mode(mode)
+
+	def set_mode(self, mode):
+		self.text = mode & TRACE_TEXT != 0
+		self.binary = mode & TRACE_BINARY != 0
+
+	@property
+	def mode(self):
+		return (TRACE_TEXT if self.text else 0) | (TRACE_BINARY if self.binary else 0)
+
+	## text mode, arguments are only formatted here
+
+	def debug(self, message, *args):
+		self._logger.debug(message % args if args else message)
+
+	def info(self, message, *args):
+		self._logger.info(message % args if args else message)
+
+	## binary mode
+
+	def record(self, timestamp, event, action_code):
+		# overwrite the oldest record if full
+		i = (self._head + self.length) % self.capacity
+		self._timestamps[i] = timestamp & 0xFFFFFFFF
+		self._events[i] = event
+		self._action_codes[i] = action_code
+		if self.length < self.capacity:
+			self.length += 1
+		else:
+			self._head = (self._head + 1) % self.capacity
+
+	def records(self):
+		# generate records from the oldest to the newest
+		for n in range(self.length):
+			i = (self._head + n) % self.capacity
+			yield (self._timestamps[i], self._events[i], self._action_codes[i])
+
+	def clear(self):
+		self._head = 0
+		self.length = 0
+
+	def __len__(self):
+		return self.length
@@ -2,7 +2,7 @@
 # vim: ts=4 noexpandtab
 
 import supervisor
-import time
+from .clock import ms
 
 
 def is_usb_connected():
@@ -20,10 +20,6 @@ def do_nothing(*args, **kargs):
 	pass
 
 
-def ms():
-	return time.monotonic_ns() // 1000000 & 0x7FFFFFFF
-
-
 def async_no_fail(func):
 	# for async functions
 	async def saved_func(*args, **kwargs):
@@ -92,3 +88,65 @@ class LightQueue:
 		else:
 			raise IndexError
 
+
+
+# (idle time ms, scan interval ms), see `ScanRateGovernor`
+DEFAULT_SCAN_RATE_TIERS = ((500, 2), (5000, 8), (60000, 16))
+
+
+class ScanRateGovernor:
+	# adaptive matrix scan rate for a scanning loop:
+	#
+	#   while True:
+	#       matrix.scan()
+	#       if <keys held or events generated>:
+	#           governor.active()
+	#       await asyncio.sleep(governor.next_interval())
+	#
+	# full speed(sleep(0)) while active, then each tier applies once idle
+	# for its idle time, tiers must be sorted by idle time
+	# after every slow sleep, `probe_scans` scans run at full speed so a key
+	# found pressed is debounced right away and the first keypress is not
+	# lost, as long as it's held longer than the slowest interval
+
+	def __init__(self, tiers = DEFAULT_SCAN_RATE_TIERS, probe_scans = 3):
+		self.probe_scans = probe_scans
+		self._probe = 0
+		self._active = False
+		self._last_active = ms()
+		self.set_tiers(tiers)
+
+	def set_tiers(self, tiers):
+		# empty to always scan at full speed
+		self._tiers = tuple((idle_ms, interval_ms / 1000) for idle_ms, interval_ms in tiers)
+
+	def active(self):
+		# called on every scan while keys are held, so no time reading here
+		self._active = True
+
+	def next_interval(self):
+		# seconds to sleep before the next scan
+		if self._active:
+			self._active = False
+			self._last_active = -1 # idle from the next scan on
+			self._probe = 0
+			return 0
+		if self._probe > 0:
+			self._probe -= 1
+			return 0
+		if not self._tiers:
+			return 0
+		now = ms()
+		if self._last_active < 0:
+			self._last_active = now
+			return 0
+		idle = (now - self._last_active) & 0x7FFFFFFF
+		interval = 0
+		for idle_ms, interval_s in self._tiers:
+			if idle < idle_ms:
+				break
+			interval = interval_s
+		if interval > 0:
+			# the scan right after the sleep is the first probe scan
+			self._probe = self.probe_scans - 1
+		return interval
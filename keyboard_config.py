@@ -2,6 +2,65 @@
 # if False, use legacy 6-key roll over mode over usb
 NKRO = True
 
+# HID report coalescing
+# if True, key changes found in one pass of the main loop are sent as one report
+# per report type(keyboard, mouse, consumer control), which reduces BLE traffic
+COALESCE_REPORTS = False
+
+# scan-to-report latency histograms, per interface(USB, BLE)
+# print them with the LATENCY command key
+LATENCY_HISTOGRAM = False
+
+# matrix scan rate when idle, ((idle time, scan interval), ...) in millisecond
+# the matrix is scanned at full speed while keys are held, then slower and
+# slower as the keyboard stays idle, to save power
+# keep the slowest interval well below the shortest key tap
+# () to always scan at full speed
+SCAN_RATE_TIERS = ((500, 2), (5000, 8), (60000, 16))
+
+# keep the heatmap(key press counters) across resets, on the nvm
+# written before suspending or resetting and by the HEATMAP command key, each
+# write erases a flash page, which stands about 10000 erases
+PERSISTENT_HEATMAP = False
+
+# count key transitions(which key follows which), see keyboard/bigram.py
+# about 7.5KB of RAM, the BIGRAM command key exports them to /bigram.bin
+BIGRAM_STATS = False
+
+# keep the BLE ID, the keymap and the backlight across resets, on the nvm
+# written a minute after the last change and before suspending or resetting,
+# each write erases a flash page, which stands about 10000 erases
+PERSISTENT_SETTINGS = False
+
+# keymaps used automatically on a BLE ID(0~9) or an interface("usb", "ble"),
+# a BLE ID's wins over "ble"'s, e.g. {"usb": "qwerty_mod", 2: "dvorak"}
+# the keymap registered by code.py is used everywhere else
+PROFILES = {}
+
+# ms to press all the keys of a combo, see `register_combos` in code.py
+COMBO_TERM = 50
+
+# ms to type the next key of a sequence after the LEADER key, see
+# `register_leader_sequences` in code.py
+LEADER_TIMEOUT = 1000
+
+# ms between the reports of the text typed by macros, by interface
+# BLE drops reports sent too fast, raise it if characters go missing
+TEXT_REPORT_INTERVAL = {"usb": 1, "ble": 10}
+
+# macros run in a task of their own, the keys keep working while one types
+# MACRO_QUEUE_SIZE: macro key events waiting to run, more presses are dropped
+# CANCEL_MACRO_ON_RELEASE: if True, releasing a macro key stops its macro if
+#   it's still running, for macros typing only while the key is held
+MACRO_QUEUE_SIZE = 8
+CANCEL_MACRO_ON_RELEASE = False
+
+# keystroke trace recorder, see keyboard/keytrace.py
+# buffer size in bytes, 0 to disable, about 2 bytes per key event
+# the trace is written to /keytrace.bin once the buffer is full, which needs
+# the drive to be writable for the code(USB_STORAGE_MODE = 1)
+KEYTRACE_SIZE = 0
+
 # USB storage mode
 # 0 = default, no action, that's read-write for host
 # 1 = read-only for host
@@ -10,17 +69,32 @@ USB_STORAGE_MODE = 0
 
 # keyboard timing, in millisecond
 # TIME_TAP_THRESH: tap keys held longer than this will trigger their "hold" action
-# TIME_TAP_DELAY: tap keys followed by a key event within this delay will trigger their "tap" action
+# TIME_TAP_DELAY: tap keys followed by a key press within this delay will trigger their "tap" action
 #  press    delay     thresh
 #  |        ^         ^
 #  v   1    |    2    |    3
 # ----------+---------+---------> t
-# 1: any key action will trigger `tap`
-# 2: any `pressed` action will trigger `hold`, any `release` action will trigger `tap`
+# 1: releasing the tap key will trigger `tap`, so will pressing another key
+# 2: releasing the tap key will trigger `tap`, see TAP_HOLD_MODE for other keys
 # 3: `hold` is triggered
 TIME_TAP_THRESH = 170
 TIME_TAP_DELAY = 87
 
+# what makes a tap key "hold" before TIME_TAP_THRESH, when other keys are used
+# "hold_on_other_key_press": pressing another key(after TIME_TAP_DELAY)
+# "permissive_hold": pressing and releasing another key, before releasing the
+#   tap key, good for home row modifiers, TIME_TAP_DELAY is not used
+# "timeout": nothing, only TIME_TAP_THRESH
+TAP_HOLD_MODE = "hold_on_other_key_press"
+
+# adaptive tap timing, see keyboard/tap_timing.py
+# if True, TIME_TAP_THRESH and TIME_TAP_DELAY are only the starting values,
+# they follow the typing speed within the ranges below, (min, max) in millisecond
+# the TAP_TIMING command key prints the statistics and saves the learned values
+ADAPTIVE_TAP_TIMING = False
+TAP_THRESH_RANGE = (120, 250)
+TAP_DELAY_RANGE = (40, 120)
+
 # verbosity
 VERBOSE = False
 
@@ -1,15 +1,11 @@
-from .default import keymap as default_map
-from .default import kb_layer1_function
-from .qwerty_mod import keymap as qwerty_map
-from .qwerty_mod import keymap_plain as qwerty_map_plain
-from .dvorak import keymap as dvorak_map
-from .norman import keymap as norman_map
+from keyboard.keymap_registry import KeymapRegistry
 
-
-keymaps = {
-    'default': default_map,
-    'qwerty_mod': qwerty_map,
-    'qwerty_plain': qwerty_map_plain,
-    'dvorak': dvorak_map,
-    'norman': norman_map
-}
+# name: (module, attribute), a module is imported only when one of its
+# keymaps is used, see keyboard/keymap_registry.py
+keymaps = KeymapRegistry(__name__, {
+    'default': ('default', 'keymap'),
+    'qwerty_mod': ('qwerty_mod', 'keymap'),
+    'qwerty_plain': ('qwerty_mod', 'keymap_plain'),
+    'dvorak': ('dvorak', 'keymap'),
+    'norman': ('norman', 'keymap')
+})
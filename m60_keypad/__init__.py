@@ -3,7 +3,6 @@
 
 import asyncio
 import keypad
-import time
 
 from .bsm import (
 	MATRIX_COLS,
@@ -15,6 +14,9 @@ from .bsm import (
 )
 
 
+# ms between two checks of a dynamic backlight mode
+LED_CHECK_INTERVAL = 20
+
 KEY_NAME =  (
 	'ESC', '1', '2', '3', '4', '5', '6', '7', '8', '9', '0', '-', '=', 'BACKSPACE',
 	'TAB', 'Q', 'W', 'E', 'R', 'T', 'Y', 'U', 'I', 'O', 'P', '[', ']', '|',
@@ -49,6 +51,12 @@ class KeyboardHardware:
 		self._key_events_head = 0
 		self._key_events_tail = 0
 		self._hid_info = None
+		# set when key events are queued, see `_scan_routine`
+		self.events_ready = asyncio.Event()
+		# set when the backlight has something to show: key events, the
+		# keyboard LEDs or the BLE state changed, see `_backlight_routine`
+		self.backlight_ready = asyncio.Event()
+		self.backlight_ready.set()
 
 	def _put(self, value):
 		if self._key_events_length < self._key_count:
@@ -107,20 +115,41 @@ class KeyboardHardware:
 				pressed = 0x00 if event.pressed else 0x80
 				encoded_event = COORDS[key_number] | pressed
 				self._put(encoded_event)
-				await asyncio.sleep(0)
+				self.events_ready.set()
+			# `get` doesn't block, always give other tasks a chance
+			await asyncio.sleep(0)
 
 	async def _backlight_routine(self):
 		# because the scan will block every coroutine, I decided to not enable the fancy
 		# backlight in this implementation(not calling backlight.check()).
 		hid_info = self._hid_info
 		backlight = self.backlight
-		battery_update_time = time.time()
 
 		if hid_info is None:
 			return
 
+		# slow work runs on the keyboard's timers, see keyboard/timers.py
+		timers = hid_info.timers
+
+		async def update_battery_level():
+			hid_info.set_battery_level(battery_level())
+			timers.start(battery_timer, 300000)  # update every 5 min
+
+		async def check_backlight():
+			backlight.check()
+			if backlight.enabled and backlight.dynamic:
+				timers.start(led_check_timer, LED_CHECK_INTERVAL)
+
+		battery_timer = timers.add(update_battery_level)
+		led_check_timer = timers.add(check_backlight)
+		timers.start(battery_timer, 0)
+		hid_info.add_status_event(self.backlight_ready)
+
+		# nothing to do between the events, the dynamic modes run on the timers
+		backlight_ready = self.backlight_ready
 		while True:
-			await asyncio.sleep(0)
+			await backlight_ready.wait()
+			backlight_ready.clear()
 			# ble led
 			if hid_info.ble_advertising:
 				backlight.set_bt_led(self._hid_info.ble_id)
@@ -130,12 +159,9 @@ class KeyboardHardware:
 			# hid led
 			backlight.set_hid_leds(hid_info.keyboard_led)
 
-			# battery level, in a backlight coroutine hahaha(not that good)
-			if time.time() > battery_update_time:
-				hid_info.set_battery_level(battery_level())
-				battery_update_time = time.time() + 300  # update every 5 min
-
-			backlight.check()
+			# dynamic modes are checked every LED_CHECK_INTERVAL
+			if backlight.enabled and backlight.dynamic and not timers.pending(led_check_timer):
+				timers.start(led_check_timer, LED_CHECK_INTERVAL)
 
 	async def get_keys(self):
 		# get key events count
@@ -2,7 +2,8 @@
 # vim: ts=4 noexpandtab
 
 import asyncio
-import time
+from keyboard import clock
+from keyboard.utils import ScanRateGovernor
 
 from matrix2 import Matrix2
 from .bsm import (
@@ -16,6 +17,9 @@ from .bsm import (
 from .light_queue import LightQueue
 
 
+# ms between two checks of a dynamic backlight mode
+LED_CHECK_INTERVAL = 20
+
 KEY_NAME =  (
 	'ESC', '1', '2', '3', '4', '5', '6', '7', '8', '9', '0', '-', '=', 'BACKSPACE',
 	'TAB', 'Q', 'W', 'E', 'R', 'T', 'Y', 'U', 'I', 'O', 'P', '[', ']', '|',
@@ -32,13 +36,14 @@ def key_name(key):
 
 
 def ms():
-	return (time.monotonic_ns() // 1000000) & 0x7FFFFFFF
+	return clock.ms()
 
 
 class KeyEventIterator:
-	def __init__(self, matrix, queue):
-		self._matrix_iter = iter(matrix)
-		self._queue = queue
+	def __init__(self, hardware):
+		self._matrix_iter = iter(hardware._matrix)
+		self._queue = hardware.light_queue
+		self._hardware = hardware
 	
 	def __next__(self):
 		# convert the event's key ID to location on the keymap
@@ -46,6 +51,11 @@ class KeyEventIterator:
 		# also triggers hardware's key handler
 		event = next(self._matrix_iter)
 		self._queue.put(event)
+		# count the keys held, for the scan rate governor
+		if event & 0x80:
+			self._hardware.keys_held -= 1
+		else:
+			self._hardware.keys_held += 1
 		event = COORDS[event & 0x7F] | (event & 0x80)
 		return event
 
@@ -67,6 +77,15 @@ class KeyboardHardware:
 		self.light_queue = LightQueue(self._matrix.key_count)
 		self.key_name = key_name
 		self._hid_info = None
+		# set when key events are queued, see `_scan_routine`
+		self.events_ready = asyncio.Event()
+		# set when the backlight has something to show: key events, the
+		# keyboard LEDs or the BLE state changed, see `_backlight_routine`
+		self.backlight_ready = asyncio.Event()
+		self.backlight_ready.set()
+		# slows the scanning down when idle, see `set_scan_rate_tiers`
+		self.scan_governor = ScanRateGovernor(probe_scans = 3)
+		self.keys_held = 0
 	
 	def get(self):
 		self._matrix.get()
@@ -78,7 +97,13 @@ class KeyboardHardware:
 		return self._matrix[key]
 
 	def __iter__(self):
-		return KeyEventIterator(self._matrix, self.light_queue)
+		if self.__len__() > 0: # for the key reactive mode
+			self.backlight_ready.set()
+		return KeyEventIterator(self)
+
+	def set_scan_rate_tiers(self, tiers):
+		# ((idle time ms, scan interval ms), ...), see keyboard_config.py
+		self.scan_governor.set_tiers(tiers)
 
 	def get_all_tasks(self):
 		# return a list of tasks
@@ -92,22 +117,51 @@ class KeyboardHardware:
 		self._hid_info = hid_info
 
 	async def _scan_routine(self):
+		matrix = self._matrix
+		events_ready = self.events_ready
+		governor = self.scan_governor
 		while True:
-			self._matrix.scan()
-			await asyncio.sleep(0)
+			matrix.scan()
+			# let the core know, it sleeps until then
+			if matrix.generate_events() > 0:
+				events_ready.set()
+				governor.active()
+			elif self.keys_held > 0:
+				governor.active()
+			# full speed while active, slower when idle
+			# matrix2 debounces over 3 scans(active_bit_count = 2), the
+			# governor runs that many after a slow sleep, see ScanRateGovernor
+			await asyncio.sleep(governor.next_interval())
 
 	async def _backlight_routine(self):
 		hid_info = self._hid_info
 		backlight = self.backlight
-		battery_update_time = time.time()
-		led_check_counter = 1
-		led_check_thresh = 1 << 8
 
 		if hid_info is None:
 			return
 
+		# slow work runs on the keyboard's timers, see keyboard/timers.py
+		timers = hid_info.timers
+
+		async def update_battery_level():
+			hid_info.set_battery_level(battery_level())
+			timers.start(battery_timer, 300000)  # update every 5 min
+
+		async def check_backlight():
+			backlight.check() # high CPU usage
+			if backlight.enabled and backlight.dynamic:
+				timers.start(led_check_timer, LED_CHECK_INTERVAL)
+
+		battery_timer = timers.add(update_battery_level)
+		led_check_timer = timers.add(check_backlight)
+		timers.start(battery_timer, 0)
+		hid_info.add_status_event(self.backlight_ready)
+
+		# nothing to do between the events, the dynamic modes run on the timers
+		backlight_ready = self.backlight_ready
 		while True:
-			await asyncio.sleep(0)
+			await backlight_ready.wait()
+			backlight_ready.clear()
 			# ble led
 			if hid_info.ble_advertising:
 				backlight.set_bt_led(self._hid_info.ble_id)
@@ -117,24 +171,16 @@ class KeyboardHardware:
 			# hid led
 			backlight.set_hid_leds(hid_info.keyboard_led)
 
-			# battery level, in a backlight coroutine hahaha(not that good)
-			if time.time() > battery_update_time:
-				hid_info.set_battery_level(battery_level())
-				battery_update_time = time.time() + 300  # update every 5 min
-
 			# for a special backlight mode
 			for event in self.light_queue:
 				key = event & 0x7F
 				pressed = event & 0x80 == 0
 				backlight.handle_key(key, pressed)
 
-			if led_check_counter > led_check_thresh:
-				backlight.check() # high CPU usage
-				led_check_counter = 1
-			else:
-				led_check_counter <<= 1
-
-			backlight.update()
+			# dynamic modes are checked every LED_CHECK_INTERVAL
+			if backlight.enabled and backlight.dynamic and not timers.pending(led_check_timer):
+				timers.start(led_check_timer, LED_CHECK_INTERVAL)
+			# the changes above are written to the LED driver already
 
 	async def get_keys(self):
 		# generate key events and return events count
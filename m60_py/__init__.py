@@ -2,7 +2,8 @@
 # vim: ts=4 noexpandtab
 
 import asyncio
-import time
+from keyboard.utils import ScanRateGovernor
+from keyboard import clock
 
 from .matrix import Matrix
 from .bsm import (
@@ -21,6 +22,9 @@ Matrix.ROWS = MATRIX_ROWS
 Matrix.ROW2COL = MATRIX_ROW2COL
 
 
+# ms between two checks of a dynamic backlight mode
+LED_CHECK_INTERVAL = 20
+
 KEY_NAME =  (
 	'ESC', '1', '2', '3', '4', '5', '6', '7', '8', '9', '0', '-', '=', 'BACKSPACE',
 	'TAB', 'Q', 'W', 'E', 'R', 'T', 'Y', 'U', 'I', 'O', 'P', '[', ']', '|',
@@ -37,7 +41,7 @@ def key_name(key):
 
 
 def ms():
-	return (time.monotonic_ns() // 1000000) & 0x7FFFFFFF
+	return clock.ms()
 
 
 class KeyEventIterator:
@@ -75,6 +79,16 @@ class KeyboardHardware:
 		self._key_events = [0] * self._key_count
 		self._key_events_head = 0
 		self._key_events_tail = 0
+		# set when the matrix may have key events, see `Matrix.changed`
+		self.events_ready = asyncio.Event()
+		# set when the backlight has something to show: key events, the
+		# keyboard LEDs or the BLE state changed, see `_backlight_routine`
+		self.backlight_ready = asyncio.Event()
+		self.backlight_ready.set()
+		self._matrix.changed = self.events_ready
+		# slows the scanning down when idle, see `set_scan_rate_tiers`
+		# any change of the raw key values counts as active, no probe needed
+		self._matrix.governor = ScanRateGovernor(probe_scans = 1)
 
 	def _put(self, value):
 		if self._key_events_length < self._key_count:
@@ -109,6 +123,8 @@ class KeyboardHardware:
 			raise IndexError
 
 	def __iter__(self):
+		if self._key_events_length > 0: # for the key reactive mode
+			self.backlight_ready.set()
 		return KeyEventIterator(self, self.queue)
 
 	def get_all_tasks(self):
@@ -118,21 +134,42 @@ class KeyboardHardware:
 		tasks.append(asyncio.create_task(self._backlight_routine()))
 		return tasks
 
+	def set_scan_rate_tiers(self, tiers):
+		# ((idle time ms, scan interval ms), ...), see keyboard_config.py
+		self._matrix.governor.set_tiers(tiers)
+
 	def register_hid_info(self, hid_info):
 		self._hid_info = hid_info
 
 	async def _backlight_routine(self):
 		hid_info = self._hid_info
 		backlight = self.backlight
-		battery_update_time = time.time()
-		led_check_counter = 1
-		led_check_thresh = 1 << 8
 
 		if hid_info is None:
 			return
 
+		# slow work runs on the keyboard's timers, see keyboard/timers.py
+		timers = hid_info.timers
+
+		async def update_battery_level():
+			hid_info.set_battery_level(battery_level())
+			timers.start(battery_timer, 300000)  # update every 5 min
+
+		async def check_backlight():
+			backlight.check() # high CPU usage
+			if backlight.enabled and backlight.dynamic:
+				timers.start(led_check_timer, LED_CHECK_INTERVAL)
+
+		battery_timer = timers.add(update_battery_level)
+		led_check_timer = timers.add(check_backlight)
+		timers.start(battery_timer, 0)
+		hid_info.add_status_event(self.backlight_ready)
+
+		# nothing to do between the events, the dynamic modes run on the timers
+		backlight_ready = self.backlight_ready
 		while True:
-			await asyncio.sleep(0)
+			await backlight_ready.wait()
+			backlight_ready.clear()
 			# ble led
 			if hid_info.ble_advertising:
 				backlight.set_bt_led(self._hid_info.ble_id)
@@ -142,24 +179,16 @@ class KeyboardHardware:
 			# hid led
 			backlight.set_hid_leds(hid_info.keyboard_led)
 
-			# battery level, in a backlight coroutine hahaha(not that good)
-			if time.time() > battery_update_time:
-				hid_info.set_battery_level(battery_level())
-				battery_update_time = time.time() + 300  # update every 5 min
-
 			# for a special backlight mode
 			for event in self.queue:
 				key = event & 0x7F
 				pressed = event & 0x80 == 0
 				backlight.handle_key(key, pressed)
 
-			if led_check_counter > led_check_thresh:
-				backlight.check() # high CPU usage
-				led_check_counter = 1
-			else:
-				led_check_counter <<= 1
-
-			backlight.update()
+			# dynamic modes are checked every LED_CHECK_INTERVAL
+			if backlight.enabled and backlight.dynamic and not timers.pending(led_check_timer):
+				timers.start(led_check_timer, LED_CHECK_INTERVAL)
+			# the changes above are written to the LED driver already
 
 	async def get_keys(self):
 		# generate key events and return events count
@@ -34,6 +34,11 @@ class Matrix:
 		self.pressed = bool(self.ROW2COL)
 		self.mask = 0 # remeber last state, for noise filtering
 		self.key_val = [0] * self.key_count # for noise filtering
+		# set when a filtered key value changes, so the key mask may change
+		# None to disable
+		self.changed = None
+		# optional `keyboard.utils.ScanRateGovernor`, full speed if None
+		self.governor = None
 
 	async def scan_routine(self):
 		pressed = self.pressed
@@ -43,6 +48,7 @@ class Matrix:
 
 		# scan every key
 		key_index = -1
+		changed = False
 		while True:
 			for row in rows:
 				row.value = pressed
@@ -51,14 +57,26 @@ class Matrix:
 					# TODO: make parameter variable
 					# here, 2 bit to filter the noise(python scan is a little slow)
 					# if use C, can be made longer
+					value = key_val[key_index]
 					if col.value == pressed:
-						key_val[key_index] = ((key_val[key_index] << 1) | 1) & 0x3
+						key_val[key_index] = ((value << 1) | 1) & 0x3
 					else:
-						key_val[key_index] >>= 1
+						key_val[key_index] = value >> 1
+					if key_val[key_index] != value:
+						changed = True
 				row.value = not pressed
 			key_index = -1
+			governor = self.governor
+			if changed:
+				changed = False
+				if self.changed is not None:
+					self.changed.set()
+				if governor is not None:
+					governor.active()
+			elif governor is not None and self.mask != 0: # keys held
+				governor.active()
 			# switch task
-			await asyncio.sleep(0)
+			await asyncio.sleep(governor.next_interval() if governor is not None else 0)
 
 	async def get_raw_keys(self):
 		# get current key status
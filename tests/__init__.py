@@ -0,0 +1,5 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Behaviour tests, run on the host with the simulated hardware(host_sim)
+#   python -m unittest discover -s tests -t .
@@ -0,0 +1,105 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Runs the firmware on the simulated hardware for the tests
+#
+#   keyboard = make_keyboard({60: MACRO(1)})
+#   reports = run(keyboard, [(100, 60, True), (150, 60, False)])
+#
+# Keys are given by their position on the default keymap, times in ms from
+# the start of the script, the keyboard reports sent come back as
+# (ms, bytes), on the same time base.
+
+import importlib
+import logging
+
+import host_sim
+
+host_sim.install()
+logging.disable(logging.WARNING)
+
+BACKEND = "m60_matrix2"
+
+# positions on the default keymap
+A = 29
+L5S = 30 # LAYER_TAP(5, S)
+L2D = 31 # LAYER_TAP(2, D)
+F = 32
+G = 33
+H = 34
+J = 35
+K = 36
+L = 37
+SCC = 38 # MODS_TAP(RCTRL, ';')
+Z = 42
+X = 43
+C = 44
+LCTRL = 53
+LGUI = 54
+LALT = 55
+SPACE = 56
+RCTRL = 60
+
+
+def default_keymap(changes = None):
+	# the default keymap, with `changes`({position: key}) on the base layer
+	layers = importlib.import_module("keymaps.default").keymap
+	keymap = [list(layer) for layer in layers]
+	if changes:
+		for position, key in changes.items():
+			keymap[0][position] = key
+	return tuple(tuple(layer) for layer in keymap)
+
+
+def make_keyboard(changes = None, **kwargs):
+	# a `Keyboard` on the simulated matrix and a fresh virtual clock
+	from keyboard import Keyboard
+	board = importlib.import_module(BACKEND)
+	host_sim.use_virtual_time()
+	host_sim.MATRIX.release_all()
+	host_sim.RECORDER.clear()
+	keyboard = Keyboard(**kwargs)
+	keyboard.register_hardware(board.KeyboardHardware)
+	keyboard.register_keymap(default_keymap(changes))
+	return keyboard
+
+
+def tap(t, position, hold = 20):
+	return [(t, position, True), (t + hold, position, False)]
+
+
+def run(keyboard, script, stop_after = 300):
+	# play `script`((ms, position, pressed), ...) until `stop_after` ms after
+	# its last event, return the keyboard reports
+	coords = importlib.import_module(BACKEND + ".bsm").COORDS
+	host_sim.MATRIX.play([(t, coords.index(position), pressed)
+			for t, position, pressed in script], stop_after = stop_after)
+	start = host_sim.hardware.monotonic_ns()
+	try:
+		keyboard.run()
+	except host_sim.SimulationDone:
+		pass
+	return [((r[0] - start) // 1000000, r[3])
+			for r in host_sim.RECORDER.filter(kind = "keyboard")]
+
+
+def keys(report):
+	# the keycodes pressed in a 6KRO `report`
+	return bytes(k for k in report[2:] if k)
+
+
+def states(reports):
+	# (modifiers, keycodes) of each report
+	return [(r[0], keys(r)) for _, r in reports]
+
+
+def typed(reports):
+	# (modifiers, keycode) of each key press, in order
+	result = []
+	pressed = b""
+	for modifiers, now in states(reports):
+		for keycode in now:
+			if keycode not in pressed:
+				result.append((modifiers, keycode))
+		pressed = now
+	return result
@@ -0,0 +1,98 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Combos(ComboEngine), in front of the tap-hold buffer, combo term 50ms
+
+import unittest
+
+from .sim import make_keyboard, run, states, typed, tap, A, F, J, K, L, X, RCTRL
+
+from keyboard.action_code import ESC, CAPS, MACRO, MODS, MODS_TAP, LCTRL
+
+KEY_ESC = 0x29
+KEY_CAPS = 0x39
+KEY_J = 0x0D
+KEY_K = 0x0E
+KEY_X = 0x1B
+LCTRL_BIT = 0x01
+
+COMBOS = (
+	((J, K), ESC),
+	((J, K, L), CAPS),
+	((A, F), MODS_TAP(MODS(LCTRL), "x")),
+)
+
+
+def make_combo_keyboard(combos = COMBOS, **kwargs):
+	keyboard = make_keyboard(**kwargs)
+	keyboard.register_combos(combos)
+	return keyboard
+
+
+class ComboTest(unittest.TestCase):
+
+	def test_combo(self):
+		reports = run(make_combo_keyboard(),
+				[(100, J, True), (110, K, True), (200, J, False), (210, K, False)])
+		self.assertEqual(typed(reports), [(0, KEY_ESC)])
+		self.assertEqual(states(reports)[-1], (0, b""))
+
+	def test_released_with_its_first_key(self):
+		reports = run(make_combo_keyboard(),
+				[(100, J, True), (110, K, True), (200, J, False), (250, K, False)])
+		released = [t for t, r in reports if r == bytes(8)]
+		self.assertTrue(200 <= released[0] < 210, released)
+
+	def test_longer_combo_wins(self):
+		reports = run(make_combo_keyboard(), [(100, J, True), (110, K, True),
+				(120, L, True), (200, J, False), (210, K, False), (220, L, False)])
+		self.assertEqual(typed(reports), [(0, KEY_CAPS)])
+
+	def test_shorter_combo_after_term(self):
+		# J K complete, but held back for J K L until the term expires
+		reports = run(make_combo_keyboard(),
+				[(100, J, True), (110, K, True), (300, J, False), (310, K, False)])
+		self.assertEqual(typed(reports), [(0, KEY_ESC)])
+		pressed = [t for t, r in reports if KEY_ESC in r]
+		self.assertTrue(150 <= pressed[0] < 200, pressed)
+
+	def test_key_alone_after_term(self):
+		reports = run(make_combo_keyboard(), tap(100, J, 200))
+		self.assertEqual(typed(reports), [(0, KEY_J)])
+		pressed = [t for t, r in reports if KEY_J in r]
+		self.assertTrue(150 <= pressed[0] < 200, pressed)
+
+	def test_released_before_term(self):
+		# typing: the held press goes on at once with its release
+		reports = run(make_combo_keyboard(), tap(100, J) + tap(130, K))
+		self.assertEqual(typed(reports), [(0, KEY_J), (0, KEY_K)])
+
+	def test_other_key_goes_on(self):
+		reports = run(make_combo_keyboard(),
+				[(100, J, True), (110, X, True), (130, J, False), (150, X, False)])
+		self.assertEqual(typed(reports), [(0, KEY_J), (0, KEY_X)])
+
+	def test_combo_tap_key(self):
+		reports = run(make_combo_keyboard(),
+				[(100, A, True), (110, F, True), (150, A, False), (160, F, False)])
+		self.assertEqual(typed(reports), [(0, KEY_X)])
+		reports = run(make_combo_keyboard(), [(100, A, True), (110, F, True)]
+				+ tap(400, J) + [(500, A, False), (510, F, False)])
+		self.assertEqual(typed(reports), [(LCTRL_BIT, KEY_J)])
+
+	def test_without_combos(self):
+		reports = run(make_combo_keyboard(()),
+				[(100, J, True), (110, K, True), (200, J, False), (210, K, False)])
+		self.assertEqual(typed(reports), [(0, KEY_J), (0, KEY_K)])
+
+	def test_registered_while_running(self):
+		# set up on the first pass without a key down
+		keyboard = make_keyboard({RCTRL: MACRO(1)})
+
+		async def handler(dev, index, press):
+			if press:
+				keyboard.register_combos(COMBOS[:1])
+		keyboard.register_macro_handler(handler)
+		reports = run(keyboard, [(100, A, True)] + tap(150, RCTRL) + [(300, A, False),
+				(400, J, True), (410, K, True), (450, J, False), (460, K, False)])
+		self.assertEqual(typed(reports), [(0, 0x04), (0, KEY_ESC)])
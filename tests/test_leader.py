@@ -0,0 +1,128 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# LEADER key sequences(LeaderTrie), leader timeout 1000ms
+
+import importlib
+import unittest
+
+from .sim import make_keyboard, run, typed, tap, default_keymap, A, G, C, X, Z, L5S, L2D, F, RCTRL
+
+from keyboard.action_code import ESC, CAPS, LEADER, MACRO, get_action_code
+from keyboard.keymap_blob import compile_keymap
+from keyboard.leader import LeaderTrie
+
+SEQUENCES = (
+	(("g", "c"), MACRO(3)),
+	(("g",), ESC),
+	(("s", "d", "f"), CAPS),
+	(("z",), "q"),
+)
+
+KEY_A = 0x04
+KEY_C = 0x06
+KEY_Q = 0x14
+KEY_ESC = 0x29
+KEY_CAPS = 0x39
+
+
+def dvorak_keymap():
+	# the dvorak keymap, with LEADER on RCTRL
+	layers = importlib.import_module("keymaps.dvorak").keymap
+	keymap = [list(layer) for layer in layers]
+	keymap[0][RCTRL] = LEADER
+	return tuple(tuple(layer) for layer in keymap)
+
+
+def make_leader_keyboard(profile = None):
+	keyboard = make_keyboard({RCTRL: LEADER})
+	keyboard.register_leader_sequences(SEQUENCES)
+	if profile is not None:
+		keyboard.register_profile("usb", profile)
+	macros = []
+
+	async def handler(dev, index, press):
+		macros.append((index, press))
+	keyboard.register_macro_handler(handler)
+	return keyboard, macros
+
+
+class LeaderTrieTest(unittest.TestCase):
+
+	def setUp(self):
+		self.layer = compile_keymap(default_keymap())[0]
+		self.trie = LeaderTrie(SEQUENCES, self.layer)
+
+	def test_steps(self):
+		trie = self.trie
+		node = trie.step(0, G)
+		self.assertNotEqual(node, 0)
+		self.assertEqual(trie.actions[node], get_action_code(ESC))
+		self.assertTrue(trie.branches[node]) # g c may follow
+		node = trie.step(node, C)
+		self.assertEqual(trie.actions[node], get_action_code(MACRO(3)))
+		self.assertFalse(trie.branches[node])
+
+	def test_tap_keys_match_the_key_they_tap(self):
+		trie = self.trie
+		node = trie.step(trie.step(trie.step(0, L5S), L2D), F)
+		self.assertEqual(trie.actions[node], get_action_code(CAPS))
+
+	def test_no_sequence(self):
+		self.assertEqual(self.trie.step(0, A), 0)
+		self.assertEqual(self.trie.step(self.trie.step(0, G), X), 0)
+
+	def test_map_layer(self):
+		# the same keys, found at other positions
+		trie = LeaderTrie(SEQUENCES)
+		self.assertEqual(trie.step(0, G), 0)
+		layer = compile_keymap(dvorak_keymap())[0]
+		trie.map_layer(layer)
+		g = list(layer).index(get_action_code("g"))
+		self.assertEqual(trie.actions[trie.step(0, g)], get_action_code(ESC))
+		self.assertEqual(trie.step(0, G), 0) # qwerty's g, dvorak's i
+
+
+class LeaderKeyTest(unittest.TestCase):
+
+	def test_sequence(self):
+		keyboard, macros = make_leader_keyboard()
+		reports = run(keyboard, tap(100, RCTRL) + tap(150, G) + tap(200, C) + tap(600, A))
+		self.assertEqual(macros, [(3, True), (3, False)])
+		self.assertEqual(typed(reports), [(0, KEY_A)]) # nothing typed meanwhile
+
+	def test_prefix_fires_at_timeout(self):
+		keyboard, macros = make_leader_keyboard()
+		reports = run(keyboard, tap(100, RCTRL) + tap(150, G), stop_after = 1500)
+		self.assertEqual(typed(reports), [(0, KEY_ESC)])
+		fired = [t for t, r in reports if KEY_ESC in r]
+		self.assertTrue(1150 <= fired[0] < 1250, fired)
+
+	def test_tap_keys(self):
+		keyboard, _ = make_leader_keyboard()
+		reports = run(keyboard, tap(100, RCTRL) + tap(150, L5S) + tap(200, L2D) + tap(250, F))
+		self.assertEqual(typed(reports), [(0, KEY_CAPS)])
+
+	def test_key_action(self):
+		keyboard, _ = make_leader_keyboard()
+		reports = run(keyboard, tap(100, RCTRL) + tap(150, Z))
+		self.assertEqual(typed(reports), [(0, KEY_Q)])
+
+	def test_no_sequence_ends_capture(self):
+		keyboard, macros = make_leader_keyboard()
+		reports = run(keyboard, tap(100, RCTRL) + tap(150, A) + tap(200, A))
+		self.assertEqual(typed(reports), [(0, KEY_A)]) # the second one only
+		self.assertEqual(macros, [])
+
+	def test_profile_keymap(self):
+		# the sequences follow the keys to their positions on the profile
+		keyboard, macros = make_leader_keyboard(dvorak_keymap())
+		layer = compile_keymap(dvorak_keymap())[0]
+		g = list(layer).index(get_action_code("g"))
+		c = list(layer).index(get_action_code("c"))
+		reports = run(keyboard, tap(100, RCTRL) + tap(150, g) + tap(200, c))
+		self.assertEqual(macros, [(3, True), (3, False)])
+		self.assertEqual(typed(reports), [])
+		keyboard, macros = make_leader_keyboard(dvorak_keymap())
+		reports = run(keyboard, tap(100, RCTRL) + tap(150, G) + tap(200, C))
+		self.assertEqual(macros, [])
@@ -0,0 +1,127 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Macros run in their own task(MacroScheduler)
+
+import asyncio
+import unittest
+
+from .sim import make_keyboard, run, keys, tap, Z, RCTRL
+
+from keyboard.action_code import MACRO
+from keyboard.macro_scheduler import MacroScheduler
+
+
+async def drain(scheduler):
+	# run the queued macros, return once they're done
+	task = asyncio.create_task(scheduler.run())
+	while scheduler._count > 0 or scheduler._task is not None:
+		await asyncio.sleep(0)
+	await asyncio.sleep(0)
+	task.cancel()
+
+
+def make_scheduler(size = 8, cancel_on_release = False, hold = None):
+	calls = []
+	scheduler = MacroScheduler(size, cancel_on_release)
+
+	async def handler(interface, index, press):
+		calls.append((index, press))
+		if press and hold is not None:
+			await hold.wait()
+	scheduler.handler = handler
+	return scheduler, calls
+
+
+class MacroSchedulerTest(unittest.TestCase):
+
+	def test_in_order(self):
+		scheduler, calls = make_scheduler()
+		for key_id, index in ((1, 5), (2, 6)):
+			scheduler.put(key_id, index, True)
+			scheduler.put(key_id, index, False)
+		asyncio.run(drain(scheduler))
+		self.assertEqual(calls, [(5, True), (5, False), (6, True), (6, False)])
+
+	def test_full_queue_drops_press_and_release(self):
+		# a slot is kept for the release of every press queued
+		scheduler, calls = make_scheduler(size = 4)
+		self.assertTrue(scheduler.put(1, 1, True))
+		self.assertTrue(scheduler.put(2, 2, True))
+		self.assertFalse(scheduler.put(3, 3, True))
+		self.assertFalse(scheduler.put(3, 3, False))
+		self.assertTrue(scheduler.put(1, 1, False))
+		self.assertTrue(scheduler.put(2, 2, False))
+		self.assertEqual(scheduler.dropped, 1)
+		asyncio.run(drain(scheduler))
+		self.assertEqual(sorted(calls), [(1, False), (1, True), (2, False), (2, True)])
+
+	def test_cancel_on_release(self):
+		async def main():
+			hold = asyncio.Event()
+			scheduler, calls = make_scheduler(cancel_on_release = True, hold = hold)
+			task = asyncio.create_task(scheduler.run())
+			scheduler.put(1, 7, True)
+			for _ in range(3):
+				await asyncio.sleep(0)
+			self.assertEqual(scheduler._running_key, 1)
+			scheduler.put(1, 7, False) # cancels the press
+			for _ in range(5):
+				await asyncio.sleep(0)
+			task.cancel()
+			return calls, scheduler
+		calls, scheduler = asyncio.run(main())
+		self.assertEqual(calls, [(7, True), (7, False)])
+		self.assertEqual(scheduler._running_key, -1)
+
+	def test_handler_error(self):
+		scheduler, calls = make_scheduler()
+
+		async def handler(interface, index, press):
+			calls.append((index, press))
+			raise ValueError("macro")
+		scheduler.handler = handler
+		scheduler.put(1, 1, True)
+		scheduler.put(1, 1, False)
+		asyncio.run(drain(scheduler))
+		self.assertEqual(calls, [(1, True), (1, False)])
+
+
+class MacroKeyTest(unittest.TestCase):
+
+	def make(self, text, **kwargs):
+		keyboard = make_keyboard({RCTRL: MACRO(1)}, **kwargs)
+		calls = []
+
+		async def handler(dev, index, press):
+			calls.append((index, press))
+			if press:
+				await dev.send_text(text)
+		keyboard.register_macro_handler(handler)
+		return keyboard, calls
+
+	def test_keys_typed_while_a_macro_runs(self):
+		# the main loop isn't held back by the macro
+		keyboard, calls = self.make("abcdefghij" * 3)
+		reports = run(keyboard, tap(100, RCTRL, 5) + tap(110, Z, 5))
+		z = [t for t, r in reports if 0x1D in keys(r)]
+		self.assertTrue(110 <= z[0] < 115, z)
+		self.assertEqual(calls, [(1, True), (1, False)])
+		typed = bytes(keys(r)[0] for _, r in reports if len(keys(r)) == 1 and keys(r)[0] != 0x1D)
+		self.assertEqual(typed, bytes(range(0x04, 0x0E)) * 3)
+
+	def test_queue_overflow(self):
+		keyboard, calls = self.make("abcdefghij" * 3, macro_queue_size = 4)
+		script = []
+		for k in range(6):
+			script += tap(100 + k * 10, RCTRL, 5)
+		run(keyboard, script, stop_after = 1000)
+		self.assertEqual(calls, [(1, True), (1, False)] * 2)
+		self.assertEqual(keyboard.macros.dropped, 4)
+
+	def test_cancelled_on_release(self):
+		keyboard, calls = self.make("abcdefghij" * 3, cancel_macro_on_release = True)
+		reports = run(keyboard, tap(100, RCTRL, 20))
+		self.assertEqual(calls, [(1, True), (1, False)])
+		self.assertLess(len(reports), 30)
+		self.assertEqual(reports[-1][1], bytes(8))
@@ -0,0 +1,185 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# The record log on nvm(RecordLog) and the heatmap kept in it(HeatmapLog)
+
+import array
+import unittest
+
+from . import sim # host_sim stand-ins first
+
+from keyboard.storage import RecordLog, NVM_SIZE, NVM_PAGE_SIZE, NVM_HEATMAP, NVM_SETTINGS
+from keyboard.heatmap import HeatmapLog
+
+
+class FlashModel:
+	# nvm: every slice write erases the pages it touches, like CircuitPython
+	# on the nRF52840, and can be cut after `fail_after` writes
+
+	def __init__(self):
+		self.data = bytearray(b"\xff" * NVM_SIZE)
+		self.erases = [0, 0]
+		self.fail_after = -1
+
+	def __len__(self):
+		return len(self.data)
+
+	def __getitem__(self, index):
+		return self.data[index]
+
+	def __setitem__(self, index, value):
+		if self.fail_after == 0:
+			raise OSError("reset")
+		self.fail_after -= 1
+		for page in range(index.start // NVM_PAGE_SIZE, (index.stop - 1) // NVM_PAGE_SIZE + 1):
+			self.erases[page] += 1
+		self.data[index] = value
+
+
+def records(log):
+	return [(tag, bytes(payload)) for tag, payload in log.records()]
+
+
+class RecordLogTest(unittest.TestCase):
+
+	def setUp(self):
+		self.flash = FlashModel()
+		self.log = RecordLog(self.flash, *NVM_SETTINGS)
+
+	def reopen(self):
+		return RecordLog(self.flash, *NVM_SETTINGS)
+
+	def test_regions(self):
+		# the halves of a log in different pages, the logs apart
+		for first, second, size in (NVM_HEATMAP, NVM_SETTINGS):
+			self.assertEqual(first // NVM_PAGE_SIZE, 0)
+			self.assertEqual((first + size - 1) // NVM_PAGE_SIZE, 0)
+			self.assertEqual(second // NVM_PAGE_SIZE, 1)
+			self.assertLessEqual(second + size, NVM_SIZE)
+		self.assertLessEqual(NVM_HEATMAP[0] + NVM_HEATMAP[2], NVM_SETTINGS[0])
+
+	def test_unused(self):
+		self.assertEqual(records(self.log), [])
+		self.assertFalse(self.log.append(1, b"a")) # compact first
+		self.assertEqual(self.log.room(), 0)
+
+	def test_append_and_reload(self):
+		self.log.compact([])
+		self.assertTrue(self.log.append(1, b"one"))
+		self.assertTrue(self.log.extend([(2, b"two"), (3, b"")]))
+		expected = [(1, b"one"), (2, b"two"), (3, b"")]
+		self.assertEqual(records(self.log), expected)
+		self.assertEqual(records(self.reopen()), expected)
+
+	def test_extend_is_one_write(self):
+		self.log.compact([])
+		erases = sum(self.flash.erases)
+		self.log.extend([(1, b"a"), (2, b"b"), (3, b"c")])
+		self.assertEqual(sum(self.flash.erases), erases + 1)
+
+	def test_full(self):
+		self.log.compact([])
+		while self.log.append(1, bytes(100)):
+			pass
+		count = len(records(self.log))
+		self.assertFalse(self.log.extend([(2, b"")] * 200))
+		self.assertEqual(len(records(self.reopen())), count)
+
+	def test_compact_moves_to_the_other_page(self):
+		self.log.compact([(1, b"x")])
+		self.log.append(2, b"y")
+		erases = list(self.flash.erases)
+		self.log.compact([(3, b"z")])
+		self.assertEqual(records(self.log), [(3, b"z")])
+		self.assertEqual(records(self.reopen()), [(3, b"z")])
+		# written to the other page only
+		page = NVM_SETTINGS[1] // NVM_PAGE_SIZE
+		self.assertEqual(self.flash.erases[1 - page], erases[1 - page])
+		self.assertEqual(self.flash.erases[page], erases[page] + 2)
+		# the appends follow it
+		erases = list(self.flash.erases)
+		self.log.append(4, b"w")
+		self.assertEqual(self.flash.erases[page], erases[page] + 1)
+		# and the next compaction goes back
+		self.log.compact([])
+		self.assertEqual(self.flash.erases[1 - page], erases[1 - page] + 2)
+
+	def test_generation_wraps(self):
+		self.log._generation = 0xFFFF
+		self.log.compact([(1, b"old")])
+		self.log.compact([(1, b"new")])
+		self.assertEqual(records(self.reopen()), [(1, b"new")])
+
+	def test_torn_record(self):
+		self.log.compact([(1, b"kept")])
+		self.log.append(2, b"cut")
+		# a reset while writing: the checksum never made it
+		start = NVM_SETTINGS[0] + 4 + 7 + 2 + 3
+		self.flash.data[start] ^= 0xFF
+		log = self.reopen()
+		self.assertEqual(records(log), [(1, b"kept")])
+		# written over by the next append
+		self.assertTrue(log.append(3, b"next"))
+		self.assertEqual(records(self.reopen()), [(1, b"kept"), (3, b"next")])
+
+	def test_torn_compaction(self):
+		self.log.compact([(1, b"old")])
+		self.log.append(2, b"appended")
+		# records written, the header not
+		self.flash.fail_after = 1
+		with self.assertRaises(OSError):
+			self.log.compact([(3, b"new")])
+		self.flash.fail_after = -1
+		self.assertEqual(records(self.reopen()), [(1, b"old"), (2, b"appended")])
+
+	def test_lost_page_falls_back(self):
+		# the page of the half in use erased by a reset: the older half
+		self.log.compact([(1, b"older")])
+		self.log.compact([(1, b"newer")])
+		_, second, size = NVM_SETTINGS # the newer half
+		self.flash.data[second:second + size] = b"\xff" * size
+		self.assertEqual(records(self.reopen()), [(1, b"older")])
+
+	def test_logs_apart(self):
+		heatmap = RecordLog(self.flash, *NVM_HEATMAP)
+		heatmap.compact([(1, b"heat")])
+		self.log.compact([(1, b"settings")])
+		heatmap.append(2, b"more")
+		self.assertEqual(records(RecordLog(self.flash, *NVM_HEATMAP)), [(1, b"heat"), (2, b"more")])
+		self.assertEqual(records(self.reopen()), [(1, b"settings")])
+
+
+class HeatmapLogTest(unittest.TestCase):
+
+	def setUp(self):
+		self.flash = FlashModel()
+
+	def make(self, key_count = 64):
+		log = RecordLog(self.flash, *NVM_HEATMAP)
+		heatmap = HeatmapLog(array.array("L", [0] * key_count), log)
+		heatmap.load()
+		return heatmap
+
+	def test_flush_and_load(self):
+		heatmap = self.make()
+		heatmap.counts[3] += 5
+		heatmap.counts[63] += 70000 # more than a delta holds
+		self.assertTrue(heatmap.flush())
+		while heatmap.dirty:
+			heatmap.flush()
+		self.assertFalse(heatmap.flush())
+		self.assertEqual(list(self.make().counts), list(heatmap.counts))
+
+	def test_compacts_when_full(self):
+		heatmap = self.make()
+		for n in range(400):
+			heatmap.counts[n % 64] += 1 + n
+			heatmap.flush()
+		self.assertEqual(list(self.make().counts), list(heatmap.counts))
+
+	def test_clear(self):
+		heatmap = self.make()
+		heatmap.counts[1] = 9
+		heatmap.flush()
+		heatmap.clear()
+		self.assertEqual(sum(self.make().counts), 0)
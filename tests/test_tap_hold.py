@@ -0,0 +1,106 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# Tap keys resolved through the buffer of pending key events
+# (Keyboard._resolve_tap_key), with the default keymap:
+#   SCC = MODS_TAP(MODS(RCTRL), ';'), L2D = LAYER_TAP(2, D)
+# and the default timing, tap delay 80ms, tap threshold 170ms
+
+import unittest
+
+from .sim import make_keyboard, run, states, typed, tap, J, K, SCC, L2D
+
+SEMICOLON = 0x33
+KEY_J = 0x0D
+KEY_K = 0x0E
+KEY_D = 0x07
+DOWN = 0x51
+RCTRL_BIT = 0x10
+
+
+class TapHoldTest(unittest.TestCase):
+
+	def test_tap(self):
+		reports = run(make_keyboard(), tap(100, SCC, 40))
+		self.assertEqual(typed(reports), [(0, SEMICOLON)])
+		self.assertEqual(states(reports)[-1], (0, b""))
+
+	def test_hold_after_threshold(self):
+		reports = run(make_keyboard(), tap(100, SCC, 250))
+		self.assertEqual(typed(reports), [])
+		self.assertIn((RCTRL_BIT, b""), states(reports))
+		self.assertEqual(states(reports)[-1], (0, b""))
+
+	def test_hold_decided_at_threshold(self):
+		# no event needed, the hold starts once the threshold is over
+		reports = run(make_keyboard(), tap(100, SCC, 400))
+		held = [t for t, r in reports if r[0] == RCTRL_BIT]
+		self.assertTrue(270 <= held[0] < 300, held)
+
+	def test_layer_tap(self):
+		reports = run(make_keyboard(), tap(100, L2D, 40))
+		self.assertEqual(typed(reports), [(0, KEY_D)])
+		reports = run(make_keyboard(), tap(100, L2D, 300) + tap(300, J))
+		self.assertEqual(typed(reports), [(0, DOWN)])
+
+	def test_release_order_kept(self):
+		# the events behind a waiting tap key come out after it, in order
+		reports = run(make_keyboard(tap_hold_mode = "timeout"),
+				[(100, SCC, True), (120, J, True), (130, K, True), (140, SCC, False),
+				(150, J, False), (160, K, False)])
+		self.assertEqual(typed(reports), [(0, SEMICOLON), (0, KEY_J), (0, KEY_K)])
+
+	def test_buffer_full_holds(self):
+		# no room to wait any longer: hold
+		keyboard = make_keyboard(tap_hold_mode = "timeout", tap_hold_buffer_size = 4)
+		reports = run(keyboard, [(100, SCC, True)] + tap(110, J, 5) + tap(120, K, 5)
+				+ [(140, SCC, False)])
+		self.assertEqual(typed(reports), [(RCTRL_BIT, KEY_J), (RCTRL_BIT, KEY_K)])
+
+
+class HoldOnOtherKeyPressTest(unittest.TestCase):
+
+	def test_quick_key_taps(self):
+		# another key within the tap delay: typing fast, tap
+		reports = run(make_keyboard(), [(100, SCC, True), (130, J, True),
+				(150, SCC, False), (160, J, False)])
+		self.assertEqual(typed(reports), [(0, SEMICOLON), (0, KEY_J)])
+
+	def test_key_after_delay_holds(self):
+		reports = run(make_keyboard(), [(100, SCC, True), (200, J, True),
+				(220, J, False), (240, SCC, False)])
+		self.assertEqual(typed(reports), [(RCTRL_BIT, KEY_J)])
+
+
+class PermissiveHoldTest(unittest.TestCase):
+
+	def test_key_tapped_inside_holds(self):
+		reports = run(make_keyboard(tap_hold_mode = "permissive_hold"),
+				[(100, SCC, True), (130, J, True), (150, J, False), (160, SCC, False)])
+		self.assertEqual(typed(reports), [(RCTRL_BIT, KEY_J)])
+
+	def test_roll_taps(self):
+		# the tap key released first: a fast roll, tap
+		reports = run(make_keyboard(tap_hold_mode = "permissive_hold"),
+				[(100, SCC, True), (130, J, True), (150, SCC, False), (170, J, False)])
+		self.assertEqual(typed(reports), [(0, SEMICOLON), (0, KEY_J)])
+
+	def test_key_held_before_doesnt_count(self):
+		# J pressed before the tap key and released inside it: tap
+		reports = run(make_keyboard(tap_hold_mode = "permissive_hold"),
+				[(90, J, True), (100, SCC, True), (130, J, False), (150, SCC, False)])
+		self.assertEqual(typed(reports), [(0, KEY_J), (0, SEMICOLON)])
+
+
+class TimeoutTest(unittest.TestCase):
+
+	def test_key_tapped_inside_taps(self):
+		# only the threshold decides
+		reports = run(make_keyboard(tap_hold_mode = "timeout"),
+				[(100, SCC, True), (200, J, True), (220, J, False), (240, SCC, False)])
+		self.assertEqual(typed(reports), [(0, SEMICOLON), (0, KEY_J)])
+
+	def test_threshold_holds(self):
+		reports = run(make_keyboard(tap_hold_mode = "timeout"),
+				[(100, SCC, True), (200, J, True), (220, J, False), (300, SCC, False)])
+		self.assertEqual(typed(reports), [(RCTRL_BIT, KEY_J)])
@@ -0,0 +1,97 @@
+# -*- encoding: utf-8 -*-
+# vim: ts=4 noexpandtab
+
+# HIDDeviceManager.send_text and compile_text
+
+import unittest
+
+from .sim import make_keyboard, run, keys, tap, A, Z, LGUI, LCTRL, SPACE, RCTRL
+
+from keyboard.action_code import MACRO
+from keyboard.hid.text import compile_text
+
+TEXT = "Hi"
+# keycode, modifiers
+TYPED = ((0x0B, 0x02), (0x0C, 0x00))
+
+
+def make_text_keyboard(text = TEXT, **kwargs):
+	keyboard = make_keyboard({RCTRL: MACRO(1)}, **kwargs)
+
+	async def handler(dev, index, press):
+		if press:
+			await dev.send_text(text)
+	keyboard.register_macro_handler(handler)
+	return keyboard
+
+
+def strokes(reports):
+	# (modifiers, keycodes) of the reports pressing a key of TEXT
+	typed = [k for k, _ in TYPED]
+	return [(r[0], keys(r)) for _, r in reports
+			if any(k in typed for k in keys(r))]
+
+
+class CompileTextTest(unittest.TestCase):
+
+	def test_strokes(self):
+		strokes, skipped = compile_text("aBé\n")
+		self.assertEqual(bytes(strokes), bytes((0, 1, 0x04, 0x02, 1, 0x05, 0, 1, 0x28)))
+		self.assertEqual(skipped, 1)
+
+	def test_nkro_packs_ascending_keys(self):
+		strokes, _ = compile_text("abcba", nkro = True)
+		self.assertEqual(bytes(strokes), bytes((0, 3, 0x04, 0x05, 0x06, 0, 1, 0x05, 0, 1, 0x04)))
+
+
+class SendTextTest(unittest.TestCase):
+
+	def test_types_text(self):
+		reports = run(make_text_keyboard(), tap(100, RCTRL))
+		self.assertEqual(strokes(reports), [(m, bytes((k,))) for k, m in TYPED])
+		self.assertEqual(reports[-1][1], bytes(8))
+
+	def test_held_modifier_left_out(self):
+		# GUI held while the text is typed: no GUI+h shortcut, the text's
+		# own shift only, GUI pressed again at the end
+		script = [(50, LGUI, True)] + tap(100, RCTRL) + [(250, LGUI, False)]
+		reports = run(make_text_keyboard(), script)
+		self.assertEqual(strokes(reports), [(m, bytes((k,))) for k, m in TYPED])
+		held = [r for t, r in reports if t < 250]
+		self.assertEqual(held[-1], bytes((0x08, 0, 0, 0, 0, 0, 0, 0)))
+		self.assertEqual(reports[-1][1], bytes(8))
+
+	def test_held_modifier_left_out_nkro(self):
+		script = [(50, LCTRL, True)] + tap(100, RCTRL) + [(250, LCTRL, False)]
+		reports = run(make_text_keyboard(nkro_usb = True), script)
+		typed = [r for _, r in reports if r[1 + (0x0B >> 3)] & (1 << (0x0B & 7))]
+		self.assertEqual([r[0] for r in typed], [0x02])
+		self.assertEqual(reports[-1][1], bytes(16))
+
+	def test_held_key_not_shifted(self):
+		# 'a' held: the text reports don't carry it, so it gets no shift
+		script = [(50, A, True)] + tap(100, RCTRL) + [(250, A, False)]
+		reports = run(make_text_keyboard(), script)
+		for _, report in reports:
+			if report[0] & 0x02:
+				self.assertNotIn(0x04, keys(report))
+		held = [r for t, r in reports if t < 250]
+		self.assertEqual(keys(held[-1]), bytes((0x04,)))
+
+	def test_keys_pressed_meanwhile_go_out(self):
+		reports = run(make_text_keyboard("abcdefgh"),
+				tap(100, RCTRL) + [(103, SPACE, True), (106, SPACE, False)])
+		self.assertTrue(any(0x2C in keys(r) for _, r in reports))
+		typed = [keys(r) for _, r in reports if len(keys(r)) == 1 and keys(r)[0] < 0x0C]
+		self.assertEqual(bytes(k[0] for k in typed), bytes(range(0x04, 0x0C)))
+		self.assertEqual(reports[-1][1], bytes(8))
+
+	def test_cancelled_restores_held_keys(self):
+		keyboard = make_text_keyboard("abcdefghij", cancel_macro_on_release = True)
+		script = [(50, Z, True), (100, RCTRL, True), (104, RCTRL, False), (300, Z, False)]
+		reports = run(keyboard, script)
+		typed = [keys(r) for t, r in reports if 100 <= t < 300 and keys(r) and keys(r) != b"\x1d"]
+		self.assertLess(len(typed), 10)
+		held = [r for t, r in reports if t < 300]
+		self.assertEqual(keys(held[-1]), bytes((0x1D,)))
+		self.assertEqual(reports[-1][1], bytes(8))